@@ -0,0 +1,77 @@
+"""
+Benchmark of the figure serialization paths used for callback responses.
+
+Compares the bytes per second of encoding the same choropleth map response
+with the current path, where Dash encodes a plotly figure object on every
+response, against the cached path, where the figure JSON is encoded once and
+added to each response as a pre-encoded fragment.
+
+Run from the repository root with: python benchmarks/bench_serialization.py
+"""
+from pathlib import Path
+import sys
+import time
+
+# Import the app modules the same way the app itself does
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath("tourism_hotels_app")))
+
+from dash._utils import to_json  # noqa: E402
+import plotly.io as pio  # noqa: E402
+import create_charts as cc  # noqa: E402
+
+
+def time_encoding(encode_response, repeats):
+    """
+    Time encoding a callback response several times.
+
+    Args:
+        encode_response: Function returning the encoded response string
+        repeats: Number of times to encode the response
+    Returns:
+        response_bytes: Size of one encoded response in bytes
+        seconds: Mean seconds taken to encode one response
+    """
+    response_bytes = len(encode_response())
+    start = time.perf_counter()
+    for _ in range(repeats):
+        encode_response()
+    seconds = (time.perf_counter() - start) / repeats
+    return response_bytes, seconds
+
+
+def main(repeats=50):
+    """
+    Print the bytes per second of each serialization path.
+
+    Args:
+        repeats: Number of times to encode each response
+    Returns:
+        None
+    """
+    figure = cc.create_choropleth_map.__wrapped__(2019, "All regions")
+    figure_json = pio.to_json(figure, validate=False)
+    fragment = cc.encode_figure_json(figure_json)
+
+    paths = {
+        # Encode the figure object in the response, as Dash does by default
+        "go.Figure via Dash to_json": lambda: to_json(
+            {"response": {"choropleth": {"figure": figure}}}
+        ),
+        # Encode the figure object and validate it again, as fig.to_json does
+        "go.Figure via pio.to_json (validated)": lambda: pio.to_json(figure),
+        # Add the figure JSON encoded once when the figure was cached
+        "pre-encoded fragment via Dash to_json": lambda: to_json(
+            {"response": {"choropleth": {"figure": fragment}}}
+        ),
+    }
+    print(f"Choropleth map for all regions, {repeats} repeats per path")
+    for name, encode_response in paths.items():
+        response_bytes, seconds = time_encoding(encode_response, repeats)
+        print(
+            f"{name:40} {response_bytes:>8} bytes {seconds * 1000:>8.3f} ms "
+            f"{response_bytes / seconds / 1e6:>10.1f} MB/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,651 @@
+"""
+Benchmark suite of the chart builders and the dash callbacks.
+
+Times every create_charts builder across its input domain, i.e. every year
+and region, top-N from 1 to 15, every summary of the pre-COVID decade, every
+region and income group line chart and a sample of countries, and drives every
+chart callback and every data export end to end through the Flask test
+client. Each case reports the mean and 95th percentile latency, the memory
+allocated while running it and the size of the figure or response it returns.
+Builders are timed with an empty figure cache, and callbacks and exports both
+with an empty cache (cold) and with the figures or files already cached
+(warm).
+
+Results are written to a JSON file, and can be compared with an earlier run:
+
+python benchmarks/bench_suite.py --compare benchmarks/results/<earlier>.json
+
+Run from the repository root. Add --filter tree_map to only run the cases
+whose name contains tree_map, and --repeats to change the number of runs per
+case. Set TOURISM_CLIENTSIDE_YEARS=0 to also benchmark the server callback
+of the home page year changes.
+"""
+import argparse
+import datetime
+import json
+from pathlib import Path
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from urllib.parse import quote_plus
+import numpy as np
+
+# Import the app modules the same way the app itself does
+APP_DIRPATH = Path(__file__).parent.parent.joinpath("tourism_hotels_app")
+sys.path.insert(0, str(APP_DIRPATH))
+
+from dash._utils import to_json  # noqa: E402
+import plotly.graph_objs as go  # noqa: E402
+import plotly.io as pio  # noqa: E402
+import aggregate_cube as ac  # noqa: E402
+import create_charts as cc  # noqa: E402
+import data_store as ds  # noqa: E402
+import derived_metrics as dm  # noqa: E402
+
+# Folder the results are written to by default
+RESULTS_DIRPATH = Path(__file__).parent.joinpath("results")
+
+# Number of top countries the bar chart slider can select
+TOP_X_COUNTRIES_RANGE = range(1, 16)
+
+
+def sample_countries(store, sample_size):
+    """
+    Pick countries spread evenly over the alphabetical list of countries.
+
+    Args:
+        store: Dataset version to pick the countries from
+        sample_size: Number of countries to pick
+    Returns:
+        List of country names
+    """
+    country_names = store.country_names
+    step = max(1, len(country_names) // sample_size)
+    return country_names[::step][:sample_size]
+
+
+def builder_cases(store, countries):
+    """
+    List every chart builder and inputs to benchmark.
+
+    Args:
+        store: Dataset version to list the years and regions of
+        countries: Sample of country names for the country charts
+    Returns:
+        List of (builder name, builder function, chart inputs tuple) tuples
+    """
+    all_regions = [ds.ALL_REGIONS] + store.region_names
+    cases = []
+    for year in store.years:
+        for region_name in all_regions:
+            # Call the cached builders without the cache, to time building
+            cases.append(
+                (
+                    "create_choropleth_map",
+                    cc.create_choropleth_map.__wrapped__,
+                    (year, region_name),
+                )
+            )
+            cases.append(
+                (
+                    "create_choropleth_patch",
+                    cc.create_choropleth_patch,
+                    (year, region_name),
+                )
+            )
+            cases.append(
+                ("create_tree_map", cc.create_tree_map.__wrapped__, (year, region_name))
+            )
+            cases.append(
+                ("create_tree_map_patch", cc.create_tree_map_patch, (year, region_name))
+            )
+    for region_name in all_regions:
+        cases.append(
+            (
+                "create_region_years_data",
+                cc.create_region_years_data,
+                (region_name, region_name),
+            )
+        )
+    for top_x_countries in TOP_X_COUNTRIES_RANGE:
+        cases.append(
+            (
+                "bar_chart_top_x_tourism_countries",
+                cc.bar_chart_top_x_tourism_countries.__wrapped__,
+                (top_x_countries,),
+            )
+        )
+    # Every summary of the pre-COVID decade, as analysts use most
+    derived_metrics = dm.get_derived_metrics(store)
+    year_range = (derived_metrics.trend_first_year, derived_metrics.trend_last_year)
+    for aggregate in dm.WINDOW_AGGREGATES:
+        for region_name in all_regions:
+            cases.append(
+                (
+                    "create_choropleth_map_range",
+                    cc.create_choropleth_map_range.__wrapped__,
+                    year_range + (aggregate, region_name),
+                )
+            )
+            cases.append(
+                (
+                    "create_tree_map_range",
+                    cc.create_tree_map_range.__wrapped__,
+                    year_range + (aggregate, region_name),
+                )
+            )
+        for top_x_countries in TOP_X_COUNTRIES_RANGE:
+            cases.append(
+                (
+                    "bar_chart_top_x_range",
+                    cc.bar_chart_top_x_range.__wrapped__,
+                    (top_x_countries,) + year_range + (aggregate,),
+                )
+            )
+    for measure in ac.MEASURES:
+        cases.append(
+            (
+                "create_group_line_chart",
+                cc.create_group_line_chart.__wrapped__,
+                (ac.REGION, measure, ds.ALL_REGIONS),
+            )
+        )
+        for region_name in all_regions:
+            cases.append(
+                (
+                    "create_group_line_chart",
+                    cc.create_group_line_chart.__wrapped__,
+                    (ac.INCOME_GROUP, measure, region_name),
+                )
+            )
+    for country_name in countries:
+        cases.append(
+            (
+                "create_line_per_country",
+                cc.create_line_per_country.__wrapped__,
+                (country_name,),
+            )
+        )
+    # Compare each sampled country with the next one
+    for country_name_1, country_name_2 in zip(countries, countries[1:] + countries[:1]):
+        cases.append(
+            (
+                "create_line_chart_compare_countries",
+                cc.create_line_chart_compare_countries.__wrapped__,
+                (country_name_1, country_name_2),
+            )
+        )
+    return cases
+
+
+def callback_cases(store, countries):
+    """
+    List the input and state values to benchmark each chart callback with.
+
+    Args:
+        store: Dataset version to list the years and regions of
+        countries: Sample of country names for the country callbacks
+    Returns:
+        Dictionary of callback module and function name -> list of (input
+        values, state values) pairs
+    """
+    all_regions = [ds.ALL_REGIONS] + store.region_names
+    derived_metrics = dm.get_derived_metrics(store)
+    year_range = [derived_metrics.trend_first_year, derived_metrics.trend_last_year]
+    compare_cases = [
+        ([country_name_1, country_name_2], [])
+        for country_name_1, country_name_2 in zip(
+            countries, countries[1:] + countries[:1]
+        )
+    ]
+    return {
+        # Every region, in every fifth year and the latest year
+        "pages.pg1.update_output": [
+            ([1, region_name], [year, "year"])
+            for region_name in all_regions
+            for year in sorted(set(store.years[::5] + store.years[-1:]))
+        ],
+        "pages.pg1.update_region_years": [
+            ([region_name], []) for region_name in all_regions
+        ],
+        # The 10-year average and the total of the pre-COVID decade
+        "pages.pg1.update_topx_tourism_graph": [
+            ([top_x_countries], [year_aggregate, year_range])
+            for year_aggregate in ["year", dm.WINDOW_SUM]
+            for top_x_countries in TOP_X_COUNTRIES_RANGE
+        ],
+        # Every summary of the pre-COVID decade for every region
+        "pages.pg1.update_year_range_figures": [
+            ([aggregate, year_range, region_name], [2019, 10])
+            for aggregate in dm.WINDOW_AGGREGATES
+            for region_name in all_regions
+        ],
+        "pages.pg2.update_country_line_and_stats_card": [
+            ([country_name], []) for country_name in countries
+        ],
+        # The trends page registers the same compare callback, so either
+        # page may be the one in the callback map
+        "pages.pg2.updatate_compare_line_charts_and_title": compare_cases,
+        "pages.trends_page.updatate_compare_line_charts_and_title": compare_cases,
+        "pages.trends_page.download_raw_data": [([1], [])],
+        "pages.pg4.update_region_line_chart": [
+            ([measure], []) for measure in ac.MEASURES
+        ],
+        # Clicking each region line
+        "pages.pg4.drill_down_region": [
+            ([{"points": [{"curveNumber": region_index}]}], [])
+            for region_index in range(len(store.region_names))
+        ],
+        "pages.pg4.update_income_group_line_chart": [
+            ([measure, region_name], [])
+            for measure in ac.MEASURES
+            for region_name in all_regions
+        ],
+    }
+
+
+def callback_request_body(callback_id, callback_entry, input_values, state_values):
+    """
+    Create the JSON body the dash renderer posts to run a callback.
+
+    Args:
+        callback_id: Key of the callback in the app's callback map
+        callback_entry: Callback map entry of the callback
+        input_values: List of values of the callback inputs
+        state_values: List of values of the callback states
+    Returns:
+        Dictionary of the request body
+    """
+    outputs = callback_entry["output"]
+    if isinstance(outputs, list):
+        outputs_body = [
+            {"id": output.component_id, "property": output.component_property}
+            for output in outputs
+        ]
+    else:
+        outputs_body = {
+            "id": outputs.component_id,
+            "property": outputs.component_property,
+        }
+    inputs_body = [
+        dict(dependency, value=value)
+        for dependency, value in zip(callback_entry["inputs"], input_values)
+    ]
+    return {
+        "output": callback_id,
+        "outputs": outputs_body,
+        "inputs": inputs_body,
+        "state": [
+            dict(dependency, value=value)
+            for dependency, value in zip(callback_entry["state"], state_values)
+        ],
+        "changedPropIds": [f"{inputs_body[0]['id']}.{inputs_body[0]['property']}"],
+    }
+
+
+def payload_bytes(result):
+    """
+    Get the size of a builder result encoded as in a callback response.
+
+    Args:
+        result: Plotly figure, Patch or dictionary returned by a builder
+    Returns:
+        Size of the JSON encoded result in bytes
+    """
+    if isinstance(result, go.Figure):
+        return len(pio.to_json(result, validate=False).encode("utf-8"))
+    return len(to_json(result).encode("utf-8"))
+
+
+def run_case(run, repeats, before_each=None):
+    """
+    Time a benchmark case and measure the memory it allocates.
+
+    Args:
+        run: Function running the case once and returning its payload size
+        repeats: Number of timed runs
+        before_each: Optional function called before each run, not timed
+    Returns:
+        Dictionary of the case results
+    """
+    seconds = []
+    for _ in range(repeats):
+        if before_each is not None:
+            before_each()
+        start = time.perf_counter()
+        size = run()
+        seconds.append(time.perf_counter() - start)
+
+    # Measure allocations in a separate run, as tracing slows down the code
+    if before_each is not None:
+        before_each()
+    tracemalloc.start()
+    try:
+        run()
+        allocated_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    milliseconds = np.array(seconds) * 1000
+    return {
+        "repeats": repeats,
+        "mean_ms": float(milliseconds.mean()),
+        "p95_ms": float(np.percentile(milliseconds, 95)),
+        "min_ms": float(milliseconds.min()),
+        "samples_ms": milliseconds.tolist(),
+        "alloc_peak_bytes": peak_bytes,
+        "alloc_retained_bytes": allocated_bytes,
+        "payload_bytes": size,
+    }
+
+
+def benchmark_builders(store, countries, repeats, name_filter):
+    """
+    Benchmark every chart builder case.
+
+    Args:
+        store: Dataset version to build the charts from
+        countries: Sample of country names for the country charts
+        repeats: Number of timed runs per case
+        name_filter: Only run the builders whose name contains this text
+    Returns:
+        List of case result dictionaries
+    """
+    results = []
+    for builder_name, build, args in builder_cases(store, countries):
+        if name_filter not in builder_name:
+            continue
+        result = run_case(
+            lambda: payload_bytes(build(*args, store=store)),
+            repeats,
+            # Builders using other cached builders must not hit the cache
+            before_each=cc.figure_cache.clear,
+        )
+        results.append(
+            dict(group="builder", name=builder_name, args=list(args), **result)
+        )
+    return results
+
+
+def benchmark_callbacks(store, countries, repeats, name_filter):
+    """
+    Benchmark every chart callback end to end through the Flask test client.
+
+    Args:
+        store: Dataset version the app serves
+        countries: Sample of country names for the country callbacks
+        repeats: Number of timed runs per case, with a cold and a warm cache
+        name_filter: Only run the callbacks whose name contains this text
+    Returns:
+        List of case result dictionaries
+    """
+    from tourism_hotels_dash_app import app
+
+    client = app.server.test_client()
+    # Dash registers the page callbacks when it serves the first request
+    client.get("/")
+
+    cases = callback_cases(store, countries)
+    results = []
+    for callback_id, callback_entry in list(app.callback_map.items()):
+        callback = callback_entry.get("callback")
+        # Clientside callbacks have no server function
+        if callback is None:
+            continue
+        callback_name = f"{callback.__module__}.{callback.__name__}"
+        if callback_name not in cases or name_filter not in callback_name:
+            continue
+
+        for input_values, state_values in cases[callback_name]:
+            body = callback_request_body(
+                callback_id, callback_entry, input_values, state_values
+            )
+
+            def post_callback():
+                response = client.post("/_dash-update-component", json=body)
+                if response.status_code not in (200, 204):
+                    raise RuntimeError(
+                        f"{callback_name} returned {response.status_code}: "
+                        f"{response.get_data(as_text=True)[:500]}"
+                    )
+                return len(response.get_data())
+
+            for cache_state, before_each in (
+                ("cold", cc.figure_cache.clear),
+                ("warm", None),
+            ):
+                result = run_case(post_callback, repeats, before_each=before_each)
+                results.append(
+                    dict(
+                        group="callback",
+                        name=callback_name,
+                        cache=cache_state,
+                        args={"inputs": input_values, "state": state_values},
+                        **result,
+                    )
+                )
+    return results
+
+
+def export_cases(store, countries):
+    """
+    List the export downloads to benchmark, for every export format.
+
+    Args:
+        store: Dataset version to pick the region and years from
+        countries: Sample of country names for the country export
+    Returns:
+        List of (case name, URL path) pairs
+    """
+    import exports
+
+    filters = [
+        ("all", ""),
+        ("region", f"?region={quote_plus(store.region_names[0])}"),
+        (
+            "countries",
+            f"?start={store.years[-10]}&"
+            + "&".join(f"country={quote_plus(country)}" for country in countries),
+        ),
+    ]
+    return [
+        (f"export_{export_format} ({filter_name})", f"/export/{export_format}{query}")
+        for export_format in exports.EXPORT_FORMATS
+        for filter_name, query in filters
+    ]
+
+
+def benchmark_exports(store, countries, repeats, name_filter):
+    """
+    Benchmark the export downloads through the Flask test client.
+
+    Args:
+        store: Dataset version the app serves
+        countries: Sample of country names for the country export
+        repeats: Number of timed runs per case, with a cold and a warm cache
+        name_filter: Only run the exports whose name contains this text
+    Returns:
+        List of case result dictionaries
+    """
+    import exports
+    from tourism_hotels_dash_app import app
+
+    client = app.server.test_client()
+    results = []
+    for export_name, path in export_cases(store, countries):
+        if name_filter not in export_name:
+            continue
+
+        def get_export():
+            response = client.get(path)
+            if response.status_code != 200:
+                raise RuntimeError(
+                    f"{path} returned {response.status_code}: "
+                    f"{response.get_data(as_text=True)[:500]}"
+                )
+            return len(response.get_data())
+
+        for cache_state, before_each in (
+            ("cold", exports.export_cache.clear),
+            ("warm", None),
+        ):
+            result = run_case(get_export, repeats, before_each=before_each)
+            results.append(
+                dict(
+                    group="export",
+                    name=export_name,
+                    cache=cache_state,
+                    args={"path": path},
+                    **result,
+                )
+            )
+    return results
+
+
+def summarise(results):
+    """
+    Summarise the case results per builder or callback.
+
+    Args:
+        results: List of case result dictionaries
+    Returns:
+        Dictionary of summary name -> dictionary of mean and 95th percentile
+        latency over every run of every case, and the largest payload and
+        allocation peak of any case
+    """
+    grouped = {}
+    for result in results:
+        summary_name = result["name"]
+        if "cache" in result:
+            summary_name += f" ({result['cache']})"
+        grouped.setdefault(summary_name, []).append(result)
+
+    summary = {}
+    for summary_name, name_results in grouped.items():
+        milliseconds = np.concatenate([result["samples_ms"] for result in name_results])
+        summary[summary_name] = {
+            "cases": len(name_results),
+            "mean_ms": float(milliseconds.mean()),
+            "p95_ms": float(np.percentile(milliseconds, 95)),
+            "max_payload_bytes": max(
+                result["payload_bytes"] for result in name_results
+            ),
+            "max_alloc_peak_bytes": max(
+                result["alloc_peak_bytes"] for result in name_results
+            ),
+        }
+    return summary
+
+
+def git_commit():
+    """
+    Get the commit of the benchmarked code, if run in a git repository.
+
+    Returns:
+        Commit hash string, or None if it cannot be found
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=APP_DIRPATH,
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_summary(summary, baseline_summary=None):
+    """
+    Print the summary table, with the change from a baseline run if given.
+
+    Args:
+        summary: Summary dictionary returned by summarise
+        baseline_summary: Optional summary dictionary of an earlier run
+    Returns:
+        None
+    """
+    print(
+        f"{'benchmark':55} {'cases':>5} {'mean ms':>9} {'p95 ms':>9} "
+        f"{'payload':>9} {'alloc':>10}"
+    )
+    for summary_name, values in summary.items():
+        line = (
+            f"{summary_name:55} {values['cases']:>5} {values['mean_ms']:>9.2f} "
+            f"{values['p95_ms']:>9.2f} {values['max_payload_bytes']:>9} "
+            f"{values['max_alloc_peak_bytes']:>10}"
+        )
+        if baseline_summary and summary_name in baseline_summary:
+            baseline_mean_ms = baseline_summary[summary_name]["mean_ms"]
+            change = (values["mean_ms"] - baseline_mean_ms) / baseline_mean_ms
+            line += f" {change:>+8.1%} mean"
+        print(line)
+
+
+def main():
+    """
+    Run the benchmarks, print a summary and write the results to JSON.
+
+    Args:
+        None
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--repeats", type=int, default=5, help="timed runs per case")
+    parser.add_argument(
+        "--countries", type=int, default=10, help="number of countries to sample"
+    )
+    parser.add_argument("--filter", default="", help="only run names containing this")
+    parser.add_argument(
+        "--skip-callbacks",
+        action="store_true",
+        help="only benchmark the builders, not the callbacks and exports",
+    )
+    parser.add_argument("--output", type=Path, help="JSON file to write")
+    parser.add_argument("--compare", type=Path, help="JSON file of an earlier run")
+    args = parser.parse_args()
+
+    store = ds.get_data_store()
+    countries = sample_countries(store, args.countries)
+    results = benchmark_builders(store, countries, args.repeats, args.filter)
+    if not args.skip_callbacks:
+        results += benchmark_callbacks(store, countries, args.repeats, args.filter)
+        results += benchmark_exports(store, countries, args.repeats, args.filter)
+
+    summary = summarise(results)
+    baseline_summary = None
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline_summary = json.load(file)["summary"]
+    print_summary(summary, baseline_summary)
+
+    started_at = datetime.datetime.now(datetime.timezone.utc)
+    output_filepath = args.output or RESULTS_DIRPATH.joinpath(
+        f"bench_suite-{started_at:%Y%m%dT%H%M%S}.json"
+    )
+    output_filepath.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_filepath, "w") as file:
+        json.dump(
+            {
+                "time": started_at.isoformat(),
+                "git_commit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "dataset_sha256": store.source_sha256,
+                "repeats": args.repeats,
+                "countries": countries,
+                "summary": summary,
+                "results": results,
+            },
+            file,
+            indent=1,
+        )
+    print(f"Results written to {output_filepath}")
+
+
+if __name__ == "__main__":
+    main()
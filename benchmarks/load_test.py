@@ -0,0 +1,916 @@
+"""
+Load test replaying scripted dashboard sessions against the real dash app.
+
+Starts the app with serve.py on a free local port (or targets a running
+server with --url), then runs virtual users in threads, each replaying user
+sessions such as "open home, step the year from 2019 to 2015, switch region,
+move the top-N slider, open trends, pick 5 countries, compare two countries
+and download Excel" until the test duration is over. The requests are the
+ones the dash renderer sends for each step, read from the app's
+/_dash-dependencies, so steps the browser handles with clientside callbacks
+send no request, as in a real browser.
+
+Reports throughput, p50/p95/p99 latency and error rate per callback, and
+writes them to a JSON file so runs can be compared, e.g.:
+
+python benchmarks/load_test.py --users 16 --duration 60 --workers 4 --threads 8
+
+Run from the repository root (Linux and macOS, as serve.py uses gunicorn).
+The load generator runs on the same machine as the server, so leave it some
+CPU when sizing the number of workers.
+"""
+import argparse
+import datetime
+import http.client
+import json
+import os
+from pathlib import Path
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+import numpy as np
+
+APP_DIRPATH = Path(__file__).parent.parent.joinpath("tourism_hotels_app")
+
+# Folder the results are written to by default
+RESULTS_DIRPATH = Path(__file__).parent.joinpath("results")
+
+# Outputs of the callbacks the sessions run, with the label they are reported as
+ROUTER_OUTPUT = ".._pages_content.children..._pages_store.data.."
+HOME_FIGURES_OUTPUT = (
+    "..choropleth.figure...tree-map-regions.figure...tree-map-title.children.."
+)
+REGION_YEARS_REQUEST_OUTPUT = "region-years-request.data"
+REGION_YEARS_OUTPUT = "region-years-store.data"
+TOP_X_OUTPUT = "..bar-10yr-average.figure...bar-10yr-average-title.children.."
+# Input of the year range callback, which is found by it as its outputs are
+# shared with the year and top-N callbacks, so dash adds a hash to each output
+YEAR_RANGE_INPUT = "year-aggregate.value"
+YEAR_RANGE_LABEL = "home year range figures"
+COUNTRY_LINE_OUTPUT = "..line-per-country.figure...line-per-country-title.children...stats-card.children.."
+COMPARE_OUTPUT = (
+    "..line-compare-countries.figure...line-compare-countries-title.children.."
+)
+EXPORT_JOB_OUTPUT = "export-job.data"
+REGION_LINE_OUTPUT = "region-line-chart.figure"
+DRILL_DOWN_OUTPUT = "income-group-region-dropdown.value"
+INCOME_GROUP_LINE_OUTPUT = (
+    "..income-group-line-chart.figure...income-group-line-chart-title.children.."
+)
+EXPORT_PROGRESS_OUTPUT = (
+    "..export-job-interval.disabled...export-progress.value...export-progress.label"
+    "...export-status.children...export-cancel-button.disabled...export-result.data.."
+)
+CALLBACK_LABELS = {
+    ROUTER_OUTPUT: "page router",
+    HOME_FIGURES_OUTPUT: "home year and region figures",
+    REGION_YEARS_OUTPUT: "home region years data",
+    TOP_X_OUTPUT: "home top-N bar chart",
+    COUNTRY_LINE_OUTPUT: "trends country line and stats",
+    COMPARE_OUTPUT: "trends compare countries",
+    EXPORT_JOB_OUTPUT: "trends start download",
+    EXPORT_PROGRESS_OUTPUT: "trends download progress",
+    REGION_LINE_OUTPUT: "regions region lines",
+    DRILL_DOWN_OUTPUT: "regions drill down",
+    INCOME_GROUP_LINE_OUTPUT: "regions income group lines",
+}
+
+# Measures of the regions page the sessions pick from
+GROUP_MEASURES = ["sum", "mean", "count"]
+
+# Seconds between checks of the progress of a download, as on the trends page
+EXPORT_POLL_SECONDS = 0.5
+
+# Summaries of a range of years the sessions pick from
+YEAR_AGGREGATES = ["sum", "mean", "min", "max", "growth"]
+
+# Regions and countries the sessions pick from
+REGIONS = [
+    "All regions",
+    "East Asia & Pacific",
+    "Europe & Central Asia",
+    "Latin America & Caribbean",
+    "Middle East & North Africa",
+    "North America",
+    "South Asia",
+    "Sub-Saharan Africa",
+]
+COUNTRIES = [
+    "Armenia",
+    "Australia",
+    "Bangladesh",
+    "Bermuda",
+    "Brazil",
+    "Canada",
+    "China",
+    "Egypt, Arab Rep.",
+    "France",
+    "Germany",
+    "India",
+    "Italy",
+    "Japan",
+    "Kenya",
+    "Mexico",
+    "Morocco",
+    "Spain",
+    "Thailand",
+    "United Kingdom",
+    "United States",
+]
+
+
+class LatencyRecorder:
+    """
+    Thread-safe record of the latency and outcome of every request.
+    """
+
+    def __init__(self):
+        """
+        Create an empty record.
+
+        Args:
+            None
+        Returns:
+            None
+        """
+        self._lock = threading.Lock()
+        # Label -> list of (seconds, succeeded, response bytes)
+        self.requests = {}
+        self.error_messages = []
+
+    def record(self, label, seconds, succeeded, response_bytes, error_message=None):
+        """
+        Record one request.
+
+        Args:
+            label: Request label, e.g. the callback label
+            seconds: Request latency
+            succeeded: True if the request succeeded
+            response_bytes: Size of the response body
+            error_message: Optional description of a failed request
+        Returns:
+            None
+        """
+        with self._lock:
+            self.requests.setdefault(label, []).append(
+                (seconds, succeeded, response_bytes)
+            )
+            # Keep a few error messages to show what went wrong
+            if error_message is not None and len(self.error_messages) < 20:
+                self.error_messages.append(f"{label}: {error_message}")
+
+    def report(self, elapsed_seconds):
+        """
+        Summarise the requests per label and over all labels.
+
+        Args:
+            elapsed_seconds: Duration of the test, to work out throughput
+        Returns:
+            Dictionary of label -> dictionary of request count, throughput,
+            error rate, latency percentiles in milliseconds and mean bytes
+        """
+        with self._lock:
+            requests = {label: list(values) for label, values in self.requests.items()}
+        requests["all requests"] = [
+            value for values in requests.values() for value in values
+        ]
+
+        report = {}
+        for label, values in requests.items():
+            if not values:
+                continue
+            milliseconds = np.array([seconds for seconds, _, _ in values]) * 1000
+            errors = sum(1 for _, succeeded, _ in values if not succeeded)
+            report[label] = {
+                "requests": len(values),
+                "requests_per_second": len(values) / elapsed_seconds,
+                "error_rate": errors / len(values),
+                "p50_ms": float(np.percentile(milliseconds, 50)),
+                "p95_ms": float(np.percentile(milliseconds, 95)),
+                "p99_ms": float(np.percentile(milliseconds, 99)),
+                "mean_bytes": float(np.mean([size for _, _, size in values])),
+            }
+        return report
+
+
+class DashboardSession:
+    """
+    Virtual user sending the requests the dash renderer sends for each step.
+    """
+
+    def __init__(self, host, port, dependencies, recorder, rng, think_seconds):
+        """
+        Create a session with its own keep-alive connection.
+
+        Args:
+            host: Server host name
+            port: Server port
+            dependencies: Callback list returned by /_dash-dependencies
+            recorder: LatencyRecorder the requests are recorded in
+            rng: Random number generator choosing the regions and countries
+            think_seconds: Mean pause between steps, 0 for no pauses
+        Returns:
+            None
+        """
+        self.host = host
+        self.port = port
+        self.recorder = recorder
+        self.rng = rng
+        self.think_seconds = think_seconds
+        self.connection = None
+        # Output -> dependency, some outputs are registered by two pages so
+        # prefer the server callback if there is one
+        self.dependencies = {}
+        for dependency in dependencies:
+            if dependency["output"] not in self.dependencies or not dependency.get(
+                "clientside_function"
+            ):
+                self.dependencies[dependency["output"]] = dependency
+        self.year_range_output = next(
+            (
+                dependency["output"]
+                for dependency in dependencies
+                if any(
+                    f"{dependency_input['id']}.{dependency_input['property']}"
+                    == YEAR_RANGE_INPUT
+                    for dependency_input in dependency["inputs"]
+                )
+            ),
+            None,
+        )
+        # Component property values, as "id.property" -> value
+        self.props = {}
+        # Region the home page has the values of every year for
+        self.region_years_region = None
+
+    def is_server_callback(self, output):
+        """
+        Check if the app runs the callback of an output on the server.
+
+        Args:
+            output: Output string of the callback
+        Returns:
+            True if it is a server callback, False if clientside or missing
+        """
+        dependency = self.dependencies.get(output)
+        return dependency is not None and not dependency.get("clientside_function")
+
+    def request(self, label, method, path, body=None):
+        """
+        Send a request on the session's connection and record it.
+
+        Args:
+            label: Label the request is reported as
+            method: HTTP method
+            path: URL path
+            body: Optional dictionary sent as the JSON body
+        Returns:
+            Response body bytes, or None if the request failed
+        """
+        headers = {}
+        encoded_body = None
+        if body is not None:
+            encoded_body = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        start = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(
+                    self.host, self.port, timeout=120
+                )
+            self.connection.request(method, path, body=encoded_body, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException) as error:
+            # Reconnect for the next request
+            self.connection.close()
+            self.connection = None
+            self.recorder.record(
+                label, time.perf_counter() - start, False, 0, repr(error)
+            )
+            return None
+        seconds = time.perf_counter() - start
+        # Dash answers 204 when a callback prevents the update
+        succeeded = response.status in (200, 204)
+        self.recorder.record(
+            label,
+            seconds,
+            succeeded,
+            len(data),
+            None if succeeded else f"HTTP {response.status}: {data[:200]!r}",
+        )
+        return data if succeeded else None
+
+    def post_callback(self, output, changed_prop_id):
+        """
+        Run a server callback with the session's current property values.
+
+        Args:
+            output: Output string of the callback
+            changed_prop_id: Input property that changed, as "id.property"
+        Returns:
+            Response body bytes, or None if the request failed
+        """
+        dependency = self.dependencies[output]
+
+        def with_values(dependency_props):
+            return [
+                dict(
+                    dependency_prop,
+                    value=self.props.get(
+                        f"{dependency_prop['id']}.{dependency_prop['property']}"
+                    ),
+                )
+                for dependency_prop in dependency_props
+            ]
+
+        if output.startswith(".."):
+            # Without the hash dash adds to outputs shared by several callbacks
+            output_props = [
+                output_prop.split("@", 1)[0].split(".", 1)
+                for output_prop in output[2:-2].split("...")
+            ]
+            outputs = [
+                {"id": component_id, "property": component_property}
+                for component_id, component_property in output_props
+            ]
+        else:
+            component_id, component_property = output.split(".", 1)
+            outputs = {"id": component_id, "property": component_property}
+        body = {
+            "output": output,
+            "outputs": outputs,
+            "inputs": with_values(dependency["inputs"]),
+            "state": with_values(dependency["state"]),
+            "changedPropIds": [changed_prop_id],
+        }
+        if output == self.year_range_output:
+            label = YEAR_RANGE_LABEL
+        else:
+            label = CALLBACK_LABELS.get(output, output)
+        return self.request(
+            label,
+            "POST",
+            "/_dash-update-component",
+            body,
+        )
+
+    def think(self):
+        """
+        Pause for a random time between steps, like a user reading the page.
+        """
+        if self.think_seconds > 0:
+            time.sleep(self.rng.expovariate(1 / self.think_seconds))
+
+    def load_app(self, pathname):
+        """
+        Load the app in a new browser tab, showing a page.
+
+        Args:
+            pathname: Page path, e.g. / or /pg2
+        Returns:
+            None
+        """
+        self.request("index page", "GET", pathname)
+        self.request("dash layout", "GET", "/_dash-layout")
+        self.request("dash dependencies", "GET", "/_dash-dependencies")
+        self.props = {"prerender-figures.data": True}
+        self.region_years_region = None
+        self.navigate(pathname)
+
+    def navigate(self, pathname):
+        """
+        Open a page from the navigation bar, without reloading the app.
+
+        Args:
+            pathname: Page path, e.g. / or /pg2
+        Returns:
+            None
+        """
+        self.props["_pages_location.pathname"] = pathname
+        self.props["_pages_location.search"] = ""
+        self.post_callback(ROUTER_OUTPUT, "_pages_location.pathname")
+        if pathname == "/":
+            # Default inputs the home page is prerendered with
+            self.props["submit_button.n_clicks"] = None
+            self.props["region-dropdown.value"] = "All regions"
+            self.props["input_year_field.value"] = 2019
+            self.props["top-x-slider.value"] = 10
+            self.props["year-aggregate.value"] = "year"
+            self.props["year-range-slider.value"] = [2010, 2019]
+            self.region_years_region = None
+        elif pathname == "/pg2":
+            self.props["dropdown-line-per-country.value"] = "Armenia"
+            self.props["dropdown-compare-countries-1.value"] = "Bermuda"
+            self.props["dropdown-compare-countries-2.value"] = "Bangladesh"
+            # Default download options
+            self.props["export-region.value"] = "All regions"
+            self.props["export-download-button.n_clicks"] = 0
+            self.props["export-job-interval.n_intervals"] = 0
+            self.props[EXPORT_JOB_OUTPUT] = None
+        elif pathname == "/pg4":
+            self.props["group-measure.value"] = "sum"
+            self.props["income-group-region-dropdown.value"] = "All regions"
+            self.props["region-line-chart.clickData"] = None
+        self.think()
+
+    def update_home_figures(self, changed_prop_id):
+        """
+        Send the requests for a home page year submit or region change.
+
+        Args:
+            changed_prop_id: Input property that changed, as "id.property"
+        Returns:
+            None
+        """
+        if self.is_server_callback(HOME_FIGURES_OUTPUT):
+            self.post_callback(HOME_FIGURES_OUTPUT, changed_prop_id)
+            return
+        # The browser draws each year from the values of every year, which
+        # it requests when it does not have them for the region yet
+        region = self.props["region-dropdown.value"]
+        if (
+            self.is_server_callback(REGION_YEARS_OUTPUT)
+            and self.region_years_region != region
+        ):
+            self.props[REGION_YEARS_REQUEST_OUTPUT] = region
+            if (
+                self.post_callback(REGION_YEARS_OUTPUT, REGION_YEARS_REQUEST_OUTPUT)
+                is not None
+            ):
+                self.region_years_region = region
+
+    def submit_year(self, year):
+        """
+        Enter a year, e.g. with the arrows of the year field, and submit it.
+
+        Args:
+            year: Year to show
+        Returns:
+            None
+        """
+        self.props["input_year_field.value"] = year
+        self.props["submit_button.n_clicks"] = (
+            self.props.get("submit_button.n_clicks") or 0
+        ) + 1
+        self.update_home_figures("submit_button.n_clicks")
+        self.think()
+
+    def switch_region(self, region):
+        """
+        Choose a region in the home page region dropdown.
+
+        Args:
+            region: Region name
+        Returns:
+            None
+        """
+        self.props["region-dropdown.value"] = region
+        self.update_home_figures("region-dropdown.value")
+        self.think()
+
+    def move_top_x_slider(self, top_x_countries):
+        """
+        Drag the top-N slider, which updates when the mouse button is released.
+
+        Args:
+            top_x_countries: Number of countries the slider is released at
+        Returns:
+            None
+        """
+        self.props["top-x-slider.value"] = top_x_countries
+        self.post_callback(TOP_X_OUTPUT, "top-x-slider.value")
+        self.think()
+
+    def summarise_years(self, year_aggregate, year_range):
+        """
+        Choose a summary of a range of years on the home page, or "year" to go
+        back to the year in the year field.
+
+        Args:
+            year_aggregate: Value of the year summary selector, e.g. sum
+            year_range: First and last year of the range slider
+        Returns:
+            None
+        """
+        self.props["year-range-slider.value"] = list(year_range)
+        self.props[YEAR_RANGE_INPUT] = year_aggregate
+        if self.year_range_output is not None:
+            self.post_callback(self.year_range_output, YEAR_RANGE_INPUT)
+        self.think()
+
+    def pick_country(self, country_name):
+        """
+        Choose a country in the trends page country dropdown.
+
+        Args:
+            country_name: Country name
+        Returns:
+            None
+        """
+        self.props["dropdown-line-per-country.value"] = country_name
+        self.post_callback(COUNTRY_LINE_OUTPUT, "dropdown-line-per-country.value")
+        self.think()
+
+    def pick_measure(self, measure):
+        """
+        Choose the measure of both regions page line charts.
+
+        Args:
+            measure: Measure of the aggregate cube, e.g. sum
+        Returns:
+            None
+        """
+        self.props["group-measure.value"] = measure
+        self.post_callback(REGION_LINE_OUTPUT, "group-measure.value")
+        self.post_callback(INCOME_GROUP_LINE_OUTPUT, "group-measure.value")
+        self.think()
+
+    def drill_down_region(self, region_index):
+        """
+        Click a region line on the regions page to show its income groups.
+
+        Args:
+            region_index: Trace number of the region line clicked
+        Returns:
+            None
+        """
+        self.props["region-line-chart.clickData"] = {
+            "points": [{"curveNumber": region_index, "pointNumber": 0}]
+        }
+        # Region lines are in the order of the regions after "All regions"
+        response = self.post_callback(DRILL_DOWN_OUTPUT, "region-line-chart.clickData")
+        if response is not None:
+            self.props["income-group-region-dropdown.value"] = REGIONS[region_index + 1]
+            self.post_callback(
+                INCOME_GROUP_LINE_OUTPUT, "income-group-region-dropdown.value"
+            )
+        self.think()
+
+    def compare_countries(self, country_name_1, country_name_2):
+        """
+        Choose both countries in the trends page compare dropdowns.
+
+        Args:
+            country_name_1: First country name
+            country_name_2: Second country name
+        Returns:
+            None
+        """
+        for dropdown_number, country_name in enumerate(
+            [country_name_1, country_name_2], start=1
+        ):
+            changed_prop_id = f"dropdown-compare-countries-{dropdown_number}.value"
+            self.props[changed_prop_id] = country_name
+            self.post_callback(COMPARE_OUTPUT, changed_prop_id)
+            self.think()
+
+    def download_export(self, export_format, first_year=1995, country_names=()):
+        """
+        Choose the trends page download options and click the download button,
+        then check the progress of the file until it is ready and download it.
+
+        Args:
+            export_format: Name of the export format, e.g. xlsx
+            first_year: First year to download
+            country_names: Countries to download, empty for every country
+        Returns:
+            None
+        """
+        self.props["export-format.value"] = export_format
+        self.props["export-years.value"] = [first_year, 2020]
+        self.props["export-countries.value"] = list(country_names)
+        self.props["export-download-button.n_clicks"] += 1
+        data = self.post_callback(EXPORT_JOB_OUTPUT, "export-download-button.n_clicks")
+        if not data:
+            return
+        self.props[EXPORT_JOB_OUTPUT] = json.loads(data)["response"]["export-job"][
+            "data"
+        ]
+
+        # The browser checks the progress when the download starts, then at an
+        # interval until the file is ready
+        changed_prop_id = EXPORT_JOB_OUTPUT
+        while True:
+            data = self.post_callback(EXPORT_PROGRESS_OUTPUT, changed_prop_id)
+            if not data:
+                return
+            response = json.loads(data)["response"]
+            if response["export-job-interval"]["disabled"]:
+                break
+            time.sleep(EXPORT_POLL_SECONDS)
+            self.props["export-job-interval.n_intervals"] += 1
+            changed_prop_id = "export-job-interval.n_intervals"
+
+        export_result = response.get("export-result", {}).get("data")
+        if export_result:
+            self.request(
+                f"trends {export_format} download", "GET", export_result["url"]
+            )
+        self.think()
+
+    def close(self):
+        """
+        Close the session's connection.
+        """
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def explore_session(session):
+    """
+    Open home, step the year from 2019 to 2015, switch region, move the top-N
+    slider, summarise ranges of years, open trends, pick 5 countries, compare
+    two, download Excel and download a filtered CSV, then open regions, pick
+    a measure and drill down into two regions.
+
+    Args:
+        session: DashboardSession to run the steps in
+    Returns:
+        None
+    """
+    session.load_app("/")
+    for year in range(2018, 2014, -1):
+        session.submit_year(year)
+    session.switch_region(session.rng.choice(REGIONS[1:]))
+    session.submit_year(2019)
+    for top_x_countries in session.rng.sample(range(1, 16), 2):
+        session.move_top_x_slider(top_x_countries)
+    # Summarise the pre-COVID decade and a random range, then go back
+    session.summarise_years(session.rng.choice(YEAR_AGGREGATES), [2010, 2019])
+    first_year = session.rng.randint(1995, 2019)
+    session.summarise_years(
+        session.rng.choice(YEAR_AGGREGATES),
+        [first_year, session.rng.randint(first_year, 2020)],
+    )
+    session.summarise_years("year", [2010, 2019])
+    session.navigate("/pg2")
+    for country_name in session.rng.sample(COUNTRIES, 5):
+        session.pick_country(country_name)
+    session.compare_countries(*session.rng.sample(COUNTRIES, 2))
+    session.download_export("xlsx")
+    session.download_export(
+        "csv", first_year=2010, country_names=session.rng.sample(COUNTRIES, 3)
+    )
+    session.navigate("/pg4")
+    session.pick_measure(session.rng.choice(GROUP_MEASURES))
+    for region_index in session.rng.sample(range(len(REGIONS) - 1), 2):
+        session.drill_down_region(region_index)
+
+
+def home_session(session):
+    """
+    Open home and explore years and regions on the home page only.
+
+    Args:
+        session: DashboardSession to run the steps in
+    Returns:
+        None
+    """
+    session.load_app("/")
+    for region in session.rng.sample(REGIONS, 3):
+        session.switch_region(region)
+        for year in session.rng.sample(range(1995, 2021), 3):
+            session.submit_year(year)
+    session.move_top_x_slider(session.rng.randint(1, 15))
+
+
+SESSION_SCRIPTS = {"explore": explore_session, "home": home_session}
+
+
+def free_port():
+    """
+    Find a free local TCP port for the server.
+
+    Returns:
+        Port number
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, workers, threads, startup_timeout):
+    """
+    Start the app with serve.py and wait until it answers requests.
+
+    Args:
+        port: Local port to serve on
+        workers: Number of worker processes, or None for the default
+        threads: Threads per worker process, or None for the default
+        startup_timeout: Seconds to wait for the server to start
+    Returns:
+        Server subprocess.Popen object
+    """
+    command = [sys.executable, "serve.py", "--bind", f"127.0.0.1:{port}"]
+    if workers is not None:
+        command += ["--workers", str(workers)]
+    if threads is not None:
+        command += ["--threads", str(threads)]
+    # Keep the load test on the dataset loaded at start-up
+    env = dict(os.environ, TOURISM_DATA_WATCH_SECONDS="0")
+    server = subprocess.Popen(command, cwd=APP_DIRPATH, env=env)
+
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", "/")
+            if connection.getresponse().status == 200:
+                connection.close()
+                return server
+        except OSError:
+            pass
+        time.sleep(0.5)
+    stop_server(server)
+    raise RuntimeError(f"Server did not start within {startup_timeout} seconds")
+
+
+def stop_server(server):
+    """
+    Stop the server started by start_server.
+
+    Args:
+        server: Server subprocess.Popen object
+    Returns:
+        None
+    """
+    server.terminate()
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def fetch_dependencies(host, port):
+    """
+    Get the callback list the dash renderer loads from the app.
+
+    Args:
+        host: Server host name
+        port: Server port
+    Returns:
+        List of callback dependency dictionaries
+    """
+    connection = http.client.HTTPConnection(host, port, timeout=60)
+    try:
+        # Dash registers the page callbacks when it serves the first request
+        connection.request("GET", "/")
+        connection.getresponse().read()
+        connection.request("GET", "/_dash-dependencies")
+        return json.loads(connection.getresponse().read())
+    finally:
+        connection.close()
+
+
+def run_load_test(host, port, args):
+    """
+    Run the virtual users until the test duration is over.
+
+    Args:
+        host: Server host name
+        port: Server port
+        args: Parsed command line arguments
+    Returns:
+        recorder: LatencyRecorder of the measured requests
+        elapsed_seconds: Duration of the measured part of the test
+        completed_sessions: Number of sessions run to the end
+    """
+    dependencies = fetch_dependencies(host, port)
+    session_script = SESSION_SCRIPTS[args.session]
+
+    # Warm up the server with sessions that are not measured
+    warmup_session = DashboardSession(
+        host, port, dependencies, LatencyRecorder(), random.Random(0), 0
+    )
+    for _ in range(args.warmup_sessions):
+        session_script(warmup_session)
+    warmup_session.close()
+
+    recorder = LatencyRecorder()
+    completed_sessions = []
+    start = time.perf_counter()
+    deadline = start + args.duration
+
+    def virtual_user(user_number):
+        session = DashboardSession(
+            host,
+            port,
+            dependencies,
+            recorder,
+            random.Random(args.seed + user_number),
+            args.think_seconds,
+        )
+        try:
+            while time.perf_counter() < deadline:
+                session_script(session)
+                completed_sessions.append(user_number)
+        finally:
+            session.close()
+
+    users = [
+        threading.Thread(target=virtual_user, args=(user_number,), daemon=True)
+        for user_number in range(args.users)
+    ]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    return recorder, time.perf_counter() - start, len(completed_sessions)
+
+
+def main():
+    """
+    Run the load test, print the report and write it to JSON.
+
+    Args:
+        None
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--users", type=int, default=8, help="concurrent users")
+    parser.add_argument(
+        "--duration", type=float, default=30, help="seconds to start new sessions"
+    )
+    parser.add_argument("--session", choices=sorted(SESSION_SCRIPTS), default="explore")
+    parser.add_argument(
+        "--think-seconds", type=float, default=0, help="mean pause between steps"
+    )
+    parser.add_argument("--warmup-sessions", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--url", help="test a running server instead of starting one")
+    parser.add_argument("--workers", type=int, help="server worker processes")
+    parser.add_argument("--threads", type=int, help="threads per worker process")
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--output", type=Path, help="JSON file to write")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        host, port = "127.0.0.1", free_port()
+        print(f"Starting the server on port {port}")
+        server = start_server(port, args.workers, args.threads, args.startup_timeout)
+    try:
+        print(f"Running {args.users} users for {args.duration:g} seconds")
+        recorder, elapsed_seconds, completed_sessions = run_load_test(host, port, args)
+    finally:
+        if server is not None:
+            stop_server(server)
+
+    report = recorder.report(elapsed_seconds)
+    print(
+        f"{completed_sessions} sessions in {elapsed_seconds:.1f} s, "
+        f"{completed_sessions / elapsed_seconds:.2f} sessions/s"
+    )
+    print(
+        f"{'request':32} {'count':>7} {'req/s':>8} {'errors':>7} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'bytes':>8}"
+    )
+    for label, values in report.items():
+        print(
+            f"{label:32} {values['requests']:>7} "
+            f"{values['requests_per_second']:>8.1f} {values['error_rate']:>7.1%} "
+            f"{values['p50_ms']:>8.1f} {values['p95_ms']:>8.1f} "
+            f"{values['p99_ms']:>8.1f} {values['mean_bytes']:>8.0f}"
+        )
+    for error_message in recorder.error_messages:
+        print(f"Error: {error_message}")
+
+    started_at = datetime.datetime.now(datetime.timezone.utc)
+    output_filepath = args.output or RESULTS_DIRPATH.joinpath(
+        f"load_test-{started_at:%Y%m%dT%H%M%S}.json"
+    )
+    output_filepath.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_filepath, "w") as file:
+        json.dump(
+            {
+                "time": started_at.isoformat(),
+                "settings": {
+                    key: str(value) if isinstance(value, Path) else value
+                    for key, value in vars(args).items()
+                },
+                "elapsed_seconds": elapsed_seconds,
+                "completed_sessions": completed_sessions,
+                "report": report,
+                "errors": recorder.error_messages,
+            },
+            file,
+            indent=1,
+        )
+    print(f"Results written to {output_filepath}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,447 @@
+"""
+Memory and figure payload report of the dash app.
+
+Imports the app, opens every page and runs every chart callback through the
+Flask test client, then reports:
+
+- the process memory (resident, proportional and private) after importing
+  the app and after serving every page and callback, i.e. what each worker
+  process costs
+- the deep size of every module-level object of the app modules, e.g. the
+  dataset store, figure cache, page layouts, dropdown options and post
+  cards, with memory-mapped data shared between processes counted apart
+- the JSON size of every output the page router and the callbacks return,
+  flagging figures and responses over the payload budgets
+
+The report is printed and written to a JSON file, e.g.:
+
+python benchmarks/memory_report.py --figure-budget-kb 50 --response-budget-kb 200
+
+Run from the repository root. Add --fail-over-budget to exit with an error if
+any payload is over budget, e.g. in a CI job.
+"""
+import argparse
+import datetime
+import json
+import mmap
+import resource
+import sys
+import types
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from werkzeug.local import LocalProxy
+
+# Reuse the callback cases and requests of the benchmark suite
+from bench_suite import (
+    APP_DIRPATH,
+    RESULTS_DIRPATH,
+    callback_cases,
+    callback_request_body,
+    sample_countries,
+)
+
+# Objects that belong to Python or other libraries rather than the data the
+# app keeps, which the deep size does not follow
+SKIPPED_TYPES = (
+    types.ModuleType,
+    types.FunctionType,
+    types.BuiltinFunctionType,
+    types.MethodType,
+    types.CodeType,
+    types.FrameType,
+    type,
+    # Flask request globals, e.g. request and g, only exist during a request
+    LocalProxy,
+)
+
+# Dash route of the page router callback output
+ROUTER_OUTPUT = ".._pages_content.children..._pages_store.data.."
+
+
+def process_memory():
+    """
+    Get the memory used by this process.
+
+    On Linux the resident, proportional (shared pages split between the
+    processes using them) and private memory is read from /proc, elsewhere
+    only the peak resident memory is available.
+
+    Args:
+        None
+    Returns:
+        Dictionary of memory measure name -> bytes
+    """
+    memory = {}
+    try:
+        with open("/proc/self/smaps_rollup") as smaps_file:
+            for line in smaps_file:
+                name, _, value = line.partition(":")
+                if name in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                    memory[name.lower()] = int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and macOS bytes
+    memory["max_rss"] = max_rss if sys.platform == "darwin" else max_rss * 1024
+    return memory
+
+
+def deep_sizeof(obj, seen):
+    """
+    Get the memory held by an object and everything it refers to.
+
+    NumPy arrays backed by a memory-mapped file, e.g. the dataset snapshot,
+    are counted as mapped bytes, which the OS shares between processes.
+
+    Args:
+        obj: Object to measure
+        seen: Set of ids of objects already counted, which are skipped
+    Returns:
+        heap_bytes: Bytes of the object graph in the process heap
+        mapped_bytes: Bytes of memory-mapped files the objects use
+    """
+    heap_bytes = mapped_bytes = 0
+    pending = [obj]
+    while pending:
+        item = pending.pop()
+        if id(item) in seen or isinstance(item, SKIPPED_TYPES):
+            continue
+        seen.add(id(item))
+
+        if isinstance(item, mmap.mmap):
+            mapped_bytes += len(item)
+            continue
+        if isinstance(item, np.ndarray):
+            # Arrays own their data or are views of a base object
+            heap_bytes += sys.getsizeof(item)
+            if item.base is not None:
+                pending.append(item.base)
+            continue
+        if isinstance(item, (pd.DataFrame, pd.Series, pd.Index)):
+            heap_bytes += int(np.sum(item.memory_usage(deep=True)))
+            continue
+
+        heap_bytes += sys.getsizeof(item)
+        if isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            pending.extend(item)
+        elif not isinstance(item, (str, bytes, bytearray, int, float)):
+            if hasattr(item, "__dict__"):
+                pending.append(item.__dict__)
+            for slot_name in getattr(type(item), "__slots__", ()):
+                if hasattr(item, slot_name):
+                    pending.append(getattr(item, slot_name))
+    return heap_bytes, mapped_bytes
+
+
+def app_modules():
+    """
+    List the imported modules of the app, including the pages.
+
+    Args:
+        None
+    Returns:
+        List of (module name, module) pairs
+    """
+    modules = []
+    for module_name, module in sorted(sys.modules.items()):
+        module_filepath = getattr(module, "__file__", None)
+        if module_filepath and Path(module_filepath).is_relative_to(APP_DIRPATH):
+            modules.append((module_name, module))
+    return modules
+
+
+def module_object_sizes():
+    """
+    Measure every module-level object of the app modules.
+
+    Each object is measured on its own, so objects shared by several names,
+    e.g. the dataset store, are included in each of their sizes.
+
+    Args:
+        None
+    Returns:
+        List of dictionaries of the module, name, type and sizes of each
+        object, largest first
+    """
+    sizes = []
+    for module_name, module in app_modules():
+        for name, value in vars(module).items():
+            if name.startswith("__") or isinstance(value, SKIPPED_TYPES):
+                continue
+            heap_bytes, mapped_bytes = deep_sizeof(value, set())
+            sizes.append(
+                {
+                    "module": module_name,
+                    "name": name,
+                    "type": type(value).__name__,
+                    "heap_bytes": heap_bytes,
+                    "mapped_bytes": mapped_bytes,
+                }
+            )
+    return sorted(sizes, key=lambda size: size["heap_bytes"], reverse=True)
+
+
+def output_sizes(response_data):
+    """
+    Get the JSON size of each output in a callback response.
+
+    Args:
+        response_data: Body of a _dash-update-component response
+    Returns:
+        Dictionary of "id.property" -> bytes
+    """
+    if not response_data:
+        # Prevented updates have no body
+        return {}
+    sizes = {}
+    for component_id, props in json.loads(response_data)["response"].items():
+        for prop_name, value in props.items():
+            sizes[f"{component_id}.{prop_name}"] = len(
+                json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode(
+                    "utf-8"
+                )
+            )
+    return sizes
+
+
+def exercise_app(app, store, countries):
+    """
+    Open every page and run every chart callback, recording the payloads.
+
+    Args:
+        app: Dash app
+        store: Dataset version the app serves
+        countries: Sample of country names for the country callbacks
+    Returns:
+        List of payload dictionaries of each request, with the callback, its
+        arguments, the response size and the size of each output
+    """
+    import dash
+
+    client = app.server.test_client()
+    # Dash registers the page callbacks when it serves the first request
+    client.get("/")
+
+    requests = [
+        (
+            "page router",
+            ROUTER_OUTPUT,
+            [page["path"], ""],
+            # Prerender the figures, as for pages loaded in the browser
+            [True],
+        )
+        for page in dash.page_registry.values()
+    ]
+    cases = callback_cases(store, countries)
+    for callback_id, callback_entry in app.callback_map.items():
+        callback = callback_entry.get("callback")
+        if callback is None:
+            continue
+        callback_name = f"{callback.__module__}.{callback.__name__}"
+        for input_values, state_values in cases.get(callback_name, []):
+            requests.append((callback_name, callback_id, input_values, state_values))
+
+    payloads = []
+    for callback_name, callback_id, input_values, state_values in requests:
+        body = callback_request_body(
+            callback_id, app.callback_map[callback_id], input_values, state_values
+        )
+        response = client.post("/_dash-update-component", json=body)
+        if response.status_code not in (200, 204):
+            raise RuntimeError(
+                f"{callback_name} returned {response.status_code} for {input_values}"
+            )
+        response_data = response.get_data()
+        payloads.append(
+            {
+                "callback": callback_name,
+                "args": {"inputs": input_values, "state": state_values},
+                "response_bytes": len(response_data),
+                "outputs": output_sizes(response_data),
+            }
+        )
+    return payloads
+
+
+def over_budget(payloads, figure_budget_bytes, response_budget_bytes):
+    """
+    List the figures and responses larger than their budget.
+
+    Args:
+        payloads: Payload dictionaries returned by exercise_app
+        figure_budget_bytes: Largest allowed size of a figure output
+        response_budget_bytes: Largest allowed size of a whole response
+    Returns:
+        List of dictionaries of the callback, arguments, output (or None for
+        the whole response), bytes and budget of each payload over budget
+    """
+    flagged = []
+    for payload in payloads:
+        if payload["response_bytes"] > response_budget_bytes:
+            flagged.append(
+                {
+                    "callback": payload["callback"],
+                    "args": payload["args"],
+                    "output": None,
+                    "bytes": payload["response_bytes"],
+                    "budget_bytes": response_budget_bytes,
+                }
+            )
+        for output, output_bytes in payload["outputs"].items():
+            if output.endswith(".figure") and output_bytes > figure_budget_bytes:
+                flagged.append(
+                    {
+                        "callback": payload["callback"],
+                        "args": payload["args"],
+                        "output": output,
+                        "bytes": output_bytes,
+                        "budget_bytes": figure_budget_bytes,
+                    }
+                )
+    return flagged
+
+
+def summarise_payloads(payloads):
+    """
+    Summarise the payload sizes per callback output.
+
+    Args:
+        payloads: Payload dictionaries returned by exercise_app
+    Returns:
+        Dictionary of "callback output" -> dictionary of the number of
+        requests and the mean and largest size in bytes
+    """
+    sizes = {}
+    for payload in payloads:
+        sizes.setdefault(f"{payload['callback']} (response)", []).append(
+            payload["response_bytes"]
+        )
+        for output, output_bytes in payload["outputs"].items():
+            sizes.setdefault(f"{payload['callback']} {output}", []).append(output_bytes)
+    return {
+        name: {
+            "requests": len(values),
+            "mean_bytes": float(np.mean(values)),
+            "max_bytes": int(np.max(values)),
+        }
+        for name, values in sizes.items()
+    }
+
+
+def print_report(memory, object_sizes, payload_summary, flagged, top):
+    """
+    Print the memory, object size and payload tables.
+
+    Args:
+        memory: Dictionary of stage -> process memory dictionary
+        object_sizes: List returned by module_object_sizes
+        payload_summary: Dictionary returned by summarise_payloads
+        flagged: List returned by over_budget
+        top: Number of largest module-level objects to print
+    Returns:
+        None
+    """
+    print("Process memory (MB)")
+    for stage, values in memory.items():
+        print(
+            f"  {stage:32} "
+            + " ".join(f"{name} {value / 1e6:8.1f}" for name, value in values.items())
+        )
+
+    print(f"\nLargest module-level objects (KB), top {top}")
+    print(f"  {'object':60} {'type':22} {'heap':>10} {'mapped':>10}")
+    for size in object_sizes[:top]:
+        print(
+            f"  {size['module'] + '.' + size['name']:60} {size['type'][:22]:22} "
+            f"{size['heap_bytes'] / 1e3:>10.1f} {size['mapped_bytes'] / 1e3:>10.1f}"
+        )
+
+    print("\nPayloads (KB)")
+    print(f"  {'callback output':95} {'requests':>8} {'mean':>8} {'max':>8}")
+    for name, values in payload_summary.items():
+        print(
+            f"  {name:95} {values['requests']:>8} "
+            f"{values['mean_bytes'] / 1e3:>8.1f} {values['max_bytes'] / 1e3:>8.1f}"
+        )
+
+    print(f"\n{len(flagged)} payloads over budget")
+    for payload in flagged:
+        print(
+            f"  {payload['callback']} {payload['output'] or '(response)'} "
+            f"{payload['args']['inputs']}: {payload['bytes'] / 1e3:.1f} KB "
+            f"> {payload['budget_bytes'] / 1e3:.0f} KB"
+        )
+
+
+def main():
+    """
+    Run the memory and payload report, print it and write it to JSON.
+
+    Args:
+        None
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--figure-budget-kb", type=float, default=50)
+    parser.add_argument("--response-budget-kb", type=float, default=200)
+    parser.add_argument(
+        "--countries", type=int, default=10, help="number of countries to sample"
+    )
+    parser.add_argument(
+        "--top", type=int, default=30, help="number of largest objects to print"
+    )
+    parser.add_argument("--fail-over-budget", action="store_true")
+    parser.add_argument("--output", type=Path, help="JSON file to write")
+    args = parser.parse_args()
+
+    memory = {"after importing the libraries": process_memory()}
+    import data_store as ds
+    from tourism_hotels_dash_app import app
+
+    store = ds.get_data_store()
+    memory["after importing the app"] = process_memory()
+
+    payloads = exercise_app(app, store, sample_countries(store, args.countries))
+    memory["after every page and callback"] = process_memory()
+
+    object_sizes = module_object_sizes()
+    payload_summary = summarise_payloads(payloads)
+    flagged = over_budget(
+        payloads, args.figure_budget_kb * 1e3, args.response_budget_kb * 1e3
+    )
+    print_report(memory, object_sizes, payload_summary, flagged, args.top)
+
+    started_at = datetime.datetime.now(datetime.timezone.utc)
+    output_filepath = args.output or RESULTS_DIRPATH.joinpath(
+        f"memory_report-{started_at:%Y%m%dT%H%M%S}.json"
+    )
+    output_filepath.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_filepath, "w") as file:
+        json.dump(
+            {
+                "time": started_at.isoformat(),
+                "dataset_sha256": store.source_sha256,
+                "figure_budget_bytes": args.figure_budget_kb * 1e3,
+                "response_budget_bytes": args.response_budget_kb * 1e3,
+                "memory": memory,
+                "module_objects": object_sizes,
+                "payload_summary": payload_summary,
+                "over_budget": flagged,
+                "payloads": payloads,
+            },
+            file,
+            indent=1,
+        )
+    print(f"\nReport written to {output_filepath}")
+
+    if args.fail_over_budget and flagged:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,12 +9,15 @@ setup(
     packages=find_packages(include=[]),
     install_requires=[
         "pandas",
+        "numpy",
         "pathlib",
         "openpyxl",
         "dash",
         "dash-bootstrap-components",
         "pytest",
         "plotly",
+        "orjson>=3.9",
+        "gunicorn",
     ],
     package_data={
         "Tourism_arrivals_prepared": ["Tourism_arrivals_prepared.csv"],
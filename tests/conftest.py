@@ -0,0 +1,79 @@
+"""
+Shared fixtures of the tests of the data store, figure cache and metrics.
+
+Run from the repository root with python -m pytest. The app modules are
+imported the same way the app itself does, from the tourism_hotels_app folder.
+"""
+from pathlib import Path
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+APP_DIRPATH = Path(__file__).parent.parent.joinpath("tourism_hotels_app")
+sys.path.insert(0, str(APP_DIRPATH))
+
+import data_store as ds  # noqa: E402
+import helper_functions as helper  # noqa: E402
+
+
+@pytest.fixture
+def small_dataframe():
+    """
+    Small prepared dataframe with ties, missing values and a country with no
+    income group, so every edge case of the indexes is easy to check by hand.
+    """
+    return pd.DataFrame(
+        {
+            "Country Name": ["A", "B", "C", "D", "E", "F", "G"],
+            "Region": ["North", "South", "North", "South", "North", "South", "North"],
+            "IncomeGroup": [
+                "High income",
+                "Low income",
+                "High income",
+                None,
+                "Low income",
+                "High income",
+                "Low income",
+            ],
+            "Country Code": ["AAA", "BBB", "CCC", "DDD", "EEE", "FFF", "GGG"],
+            "Indicator Name": ["International tourism, number of arrivals"] * 7,
+            # Ties between A and C and between B and F, D is missing
+            "2018": [5.0, 3.0, 5.0, np.nan, 1.0, 3.0, 2.0],
+            # Missing values in both regions and a three way tie
+            "2019": [np.nan, 10.0, 4.0, 4.0, np.nan, 7.0, 4.0],
+            # Every country tied
+            "2020": [1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0],
+            "10-year Average in tourist arrivals": [3.0, 6.5, 4.5, 4.0, 1.0, 5.0, 3.0],
+            "Max number of arrivals": [5.0, 10.0, 5.0, 4.0, 1.0, 7.0, 4.0],
+            "Minimum number of arrivals": [1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0],
+            # Percent drop is stored as text, as in the prepared CSV file
+            "Percent drop 2019 to 2020": [
+                None,
+                "-90.00%",
+                "-75.00%",
+                "-75.00%",
+                None,
+                "-85.71%",
+                "-75.00%",
+            ],
+        }
+    )
+
+
+@pytest.fixture
+def small_store(small_dataframe):
+    """Data store of the small dataframe."""
+    return ds.TourismDataStore(small_dataframe, version=1)
+
+
+@pytest.fixture(scope="session")
+def dataset_dataframe():
+    """Prepared tourism arrivals dataframe read from the CSV file."""
+    return helper.load_dataframe()
+
+
+@pytest.fixture(scope="session")
+def dataset_store(dataset_dataframe):
+    """Data store of the prepared tourism arrivals dataset."""
+    return ds.TourismDataStore(dataset_dataframe, version=1)
@@ -0,0 +1,195 @@
+"""
+Tests of the aggregate cube against the pandas groupby it replaces.
+"""
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import pytest
+import aggregate_cube as ac
+import create_charts as cc
+import data_store as ds
+
+# Pandas aggregate of each cube measure
+PANDAS_AGGREGATES = {ac.SUM: "sum", ac.MEAN: "mean", ac.COUNT: "count"}
+
+
+@pytest.fixture(params=["small", "dataset"])
+def cube_and_dataframe(request):
+    """
+    Aggregate cube of each data store, with its dataframe, in which countries
+    with no income group are in the not classified group.
+    """
+    store = request.getfixturevalue(f"{request.param}_store")
+    df = store.dataframe.copy()
+    df["IncomeGroup"] = df["IncomeGroup"].fillna(ac.NOT_CLASSIFIED)
+    df[store.year_columns] = df[store.year_columns].astype(float)
+    return ac.AggregateCube(store), df
+
+
+def pandas_groups(df, group_columns, values, measure, group_names):
+    """
+    Measure of each group with pandas, in the order of the group names, with
+    groups of no countries summed and counted as 0 and averaged as NaN.
+    """
+    df_groups = values.groupby([df[column] for column in group_columns])
+    df_groups = getattr(df_groups, PANDAS_AGGREGATES[measure])()
+    if len(group_columns) > 1:
+        group_names = pd.MultiIndex.from_product(group_names)
+    fill_value = np.nan if measure == ac.MEAN else 0
+    return df_groups.reindex(group_names, fill_value=fill_value).to_numpy()
+
+
+@pytest.mark.parametrize("measure", ac.MEASURES)
+def test_cells_match_pandas_groupby(cube_and_dataframe, measure):
+    """
+    GIVEN the aggregate cube of a dataset with missing years
+    WHEN every region, income group and year is read
+    THEN it matches the pandas groupby of region and income group
+    """
+    cube, df = cube_and_dataframe
+    year_columns = [str(year) for year in cube.years]
+    expected = pandas_groups(
+        df,
+        ["Region", "IncomeGroup"],
+        df[year_columns],
+        measure,
+        [cube.region_names, cube.income_group_names],
+    )
+    values = cube._measure(cube.sums, cube.counts, measure)
+    np.testing.assert_allclose(values.reshape(expected.shape), expected, rtol=1e-9)
+
+
+@pytest.mark.parametrize("measure", ac.MEASURES)
+def test_regions_and_income_groups_match_pandas_groupby(cube_and_dataframe, measure):
+    """
+    GIVEN the aggregate cube of a dataset
+    WHEN a measure of every region, of every income group, and of every
+        income group in one region is read
+    THEN it matches the pandas groupby of the same countries
+    """
+    cube, df = cube_and_dataframe
+    year_columns = [str(year) for year in cube.years]
+    np.testing.assert_allclose(
+        cube.by_region(measure),
+        pandas_groups(df, ["Region"], df[year_columns], measure, cube.region_names),
+        rtol=1e-9,
+    )
+    np.testing.assert_allclose(
+        cube.by_income_group(measure),
+        pandas_groups(
+            df, ["IncomeGroup"], df[year_columns], measure, cube.income_group_names
+        ),
+        rtol=1e-9,
+    )
+    for region_name in cube.region_names:
+        df_region = df[df["Region"] == region_name]
+        np.testing.assert_allclose(
+            cube.by_income_group(measure, region_name),
+            pandas_groups(
+                df_region,
+                ["IncomeGroup"],
+                df_region[year_columns],
+                measure,
+                cube.income_group_names,
+            ),
+            rtol=1e-9,
+        )
+    for income_group in cube.income_group_names:
+        df_income_group = df[df["IncomeGroup"] == income_group]
+        np.testing.assert_allclose(
+            cube.by_region(measure, income_group),
+            pandas_groups(
+                df_income_group,
+                ["Region"],
+                df_income_group[year_columns],
+                measure,
+                cube.region_names,
+            ),
+            rtol=1e-9,
+        )
+
+
+@pytest.mark.parametrize("measure", ac.MEASURES)
+def test_levels_of_values_match_pandas_groupby(cube_and_dataframe, measure):
+    """
+    GIVEN per-country values with missing values, e.g. a summary of some years
+    WHEN the values of every region and of every region and income group are
+        read
+    THEN they match the pandas groupby of the values, as do those of a year
+    """
+    cube, df = cube_and_dataframe
+    year_column = str(cube.years[-2])
+    values = df[year_column] - df[str(cube.years[0])]
+    for region_values, cell_values in [
+        cube.levels(measure, values=values.to_numpy()),
+        cube.levels(measure, year=cube.years[-2]),
+    ]:
+        np.testing.assert_allclose(
+            region_values,
+            pandas_groups(df, ["Region"], values, measure, cube.region_names),
+            rtol=1e-9,
+        )
+        np.testing.assert_allclose(
+            cell_values.ravel(),
+            pandas_groups(
+                df,
+                ["Region", "IncomeGroup"],
+                values,
+                measure,
+                [cube.region_names, cube.income_group_names],
+            ),
+            rtol=1e-9,
+        )
+        values = df[year_column]
+
+
+def test_not_classified_group_is_always_last(small_dataframe):
+    """
+    GIVEN datasets with and without a country with no income group
+    WHEN their aggregate cubes are built
+    THEN both have the not classified income group last, empty if no country
+        is in it
+    """
+    cube = ac.AggregateCube(ds.TourismDataStore(small_dataframe))
+    df_classified = small_dataframe.fillna({"IncomeGroup": "Low income"})
+    classified_cube = ac.AggregateCube(ds.TourismDataStore(df_classified))
+
+    for aggregate_cube in [cube, classified_cube]:
+        assert aggregate_cube.income_group_names == [
+            "High income",
+            "Low income",
+            ac.NOT_CLASSIFIED,
+        ]
+    # Country D in the South region is the only one not classified
+    assert cube.country_counts[:, -1].tolist() == [0, 1]
+    assert classified_cube.country_counts[:, -1].tolist() == [0, 0]
+    assert (classified_cube.sums[:, -1] == 0).all()
+    assert np.isnan(classified_cube.by_income_group(ac.MEAN)[-1]).all()
+
+
+def test_charts_leave_out_empty_income_groups(small_dataframe, monkeypatch):
+    """
+    GIVEN a dataset where every country has an income group
+    WHEN the income group line chart and drill-down tree map are created
+    THEN neither has a not classified line or square
+    """
+    # Cubes are shared by dataset version, so other tests' cubes are not used
+    monkeypatch.setattr(ac, "_aggregate_cubes", OrderedDict())
+    df_classified = small_dataframe.fillna({"IncomeGroup": "Low income"})
+    store = ds.TourismDataStore(df_classified)
+    fig_line_chart = cc.create_group_line_chart.__wrapped__(
+        ac.INCOME_GROUP, ac.SUM, ds.ALL_REGIONS, store=store
+    )
+    assert [trace.name for trace in fig_line_chart.data] == [
+        "High income",
+        "Low income",
+    ]
+
+    arrivals = store.year_matrix[0]
+    tree_map_data = cc.drilldown_tree_map_data(
+        store,
+        arrivals,
+        arrivals,
+        *ac.get_aggregate_cube(store).levels(ac.MEAN, year=store.years[0]),
+    )
+    assert ac.NOT_CLASSIFIED not in tree_map_data["labels"]
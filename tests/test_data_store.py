@@ -0,0 +1,282 @@
+"""
+Tests of the data store indexes against the pandas filters they replace.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+import data_store as ds
+import helper_functions as helper
+
+
+@pytest.fixture(params=["small", "dataset"])
+def store_and_dataframe(request):
+    """Each data store with the dataframe it was built from."""
+    store = request.getfixturevalue(f"{request.param}_store")
+    return store, store.dataframe
+
+
+def test_region_positions_match_pandas_filter(store_and_dataframe):
+    """
+    GIVEN a data store
+    WHEN the positions of each region are looked up
+    THEN they are the rows pandas selects for the region, in dataset order
+    """
+    store, df = store_and_dataframe
+    for region_name in df["Region"].dropna().unique():
+        expected = np.flatnonzero(df["Region"] == region_name)
+        np.testing.assert_array_equal(store.region_positions(region_name), expected)
+    np.testing.assert_array_equal(
+        store.region_positions(ds.ALL_REGIONS), np.arange(len(df))
+    )
+
+
+def test_income_group_positions_match_pandas_filter(store_and_dataframe):
+    """
+    GIVEN a data store
+    WHEN the positions of each income group are looked up
+    THEN they are the rows pandas selects, and countries with no income group
+        are in none of them
+    """
+    store, df = store_and_dataframe
+    for income_group in store.income_group_names:
+        expected = np.flatnonzero(df["IncomeGroup"] == income_group)
+        np.testing.assert_array_equal(
+            store.income_group_positions(income_group), expected
+        )
+    assert sorted(store.income_group_names) == sorted(
+        df["IncomeGroup"].dropna().unique()
+    )
+
+
+def test_unknown_group_has_no_positions(small_store):
+    """
+    GIVEN a data store
+    WHEN a region or income group not in the dataset is looked up
+    THEN no positions are returned
+    """
+    assert len(small_store.region_positions("Atlantis")) == 0
+    assert len(small_store.income_group_positions("Middle income")) == 0
+
+
+def test_indexes_are_read_only(small_store):
+    """
+    GIVEN a data store
+    WHEN its index arrays are written to
+    THEN a ValueError is raised, as they are shared by every callback
+    """
+    with pytest.raises(ValueError):
+        small_store.region_positions("North")[0] = 1
+
+
+def test_snapshot_numeric_columns_share_memory_mapped_pages(small_dataframe, tmp_path):
+    """
+    GIVEN a CSV file converted into a snapshot
+    WHEN the snapshot is loaded
+    THEN every numeric column of the dataframe is a view of the memory-mapped
+        matrix, and the dataframe has the values of the CSV file
+    """
+    csv_filepath = tmp_path.joinpath("arrivals.csv")
+    small_dataframe.to_csv(csv_filepath, index=False)
+    df_loaded, numeric_matrix, numeric_columns, _ = helper.load_snapshot(
+        csv_filepath, tmp_path.joinpath("snapshot")
+    )
+
+    assert isinstance(numeric_matrix, np.memmap)
+    for column in numeric_columns:
+        assert np.shares_memory(df_loaded[column].to_numpy(), numeric_matrix)
+    pd.testing.assert_frame_equal(
+        df_loaded,
+        helper.load_dataframe(csv_filepath).astype(
+            dict.fromkeys(numeric_columns, float)
+        ),
+    )
+
+
+def test_saved_indexes_load_unchanged(small_dataframe, tmp_path):
+    """
+    GIVEN the indexes of a dataframe
+    WHEN they are saved into a snapshot folder and loaded again
+    THEN every index array is the same, including empty ones
+    """
+    store = ds.TourismDataStore(small_dataframe)
+    indexes = ds.build_indexes(small_dataframe, store.year_matrix, store.year_columns)
+    ds.save_indexes(indexes, tmp_path)
+    loaded_indexes = ds.load_indexes(tmp_path)
+
+    def assert_same(expected, loaded):
+        assert expected.keys() == loaded.keys()
+        for key, value in expected.items():
+            if isinstance(value, dict):
+                assert_same(value, loaded[key])
+            else:
+                np.testing.assert_array_equal(loaded[key], value)
+
+    assert_same(indexes, loaded_indexes)
+
+
+def test_store_with_loaded_indexes_matches_built_indexes(small_dataframe, tmp_path):
+    """
+    GIVEN a data store using indexes loaded from a snapshot folder
+    WHEN countries are looked up and ranked
+    THEN the results are the same as with the indexes built in memory
+    """
+    built_store = ds.TourismDataStore(small_dataframe)
+    ds.save_indexes(
+        ds.build_indexes(
+            small_dataframe, built_store.year_matrix, built_store.year_columns
+        ),
+        tmp_path,
+    )
+    loaded_store = ds.TourismDataStore(
+        small_dataframe, indexes=ds.load_indexes(tmp_path)
+    )
+    for column in built_store.year_columns:
+        for region_name in [ds.ALL_REGIONS, "North", "South"]:
+            np.testing.assert_array_equal(
+                loaded_store.ranked_positions(column, region_name),
+                built_store.ranked_positions(column, region_name),
+            )
+    np.testing.assert_array_equal(
+        loaded_store.income_group_positions("Low income"),
+        built_store.income_group_positions("Low income"),
+    )
+
+
+def test_load_indexes_without_valid_files_returns_none(small_dataframe, tmp_path):
+    """
+    GIVEN a snapshot folder with no indexes, or indexes of another format
+    WHEN the indexes are loaded
+    THEN None is returned so they are built again
+    """
+    assert ds.load_indexes(tmp_path) is None
+
+    store = ds.TourismDataStore(small_dataframe)
+    ds.save_indexes(
+        ds.build_indexes(small_dataframe, store.year_matrix, store.year_columns),
+        tmp_path,
+    )
+    tmp_path.joinpath("indexes.json").write_text('{"format": 0, "indexes": {}}')
+    assert ds.load_indexes(tmp_path) is None
+
+
+def rankable_columns(store):
+    """Every year and statistic column the rank index sorts by."""
+    return store.year_columns + ds.STAT_COLUMNS
+
+
+def numeric_column(df, column):
+    """Column values as floats, with the percent drop text converted."""
+    if column == "Percent drop 2019 to 2020":
+        return df[column].str.rstrip("%").astype(float)
+    return df[column].astype(float)
+
+
+def test_ranked_positions_match_pandas_sort(store_and_dataframe):
+    """
+    GIVEN a data store
+    WHEN countries are ranked largest first by each year and statistic, in
+        every region
+    THEN the order is the stable pandas sort, ties in dataset order and missing
+        values last
+    """
+    store, df = store_and_dataframe
+    for column in rankable_columns(store):
+        values = numeric_column(df, column).reset_index(drop=True)
+        for region_name in [ds.ALL_REGIONS] + store.region_names:
+            region_values = values.iloc[store.region_positions(region_name)]
+            expected = region_values.sort_values(
+                ascending=False, kind="stable", na_position="last"
+            ).index.to_numpy()
+            np.testing.assert_array_equal(
+                store.ranked_positions(column, region_name), expected
+            )
+
+
+def test_ascending_ranked_positions_match_pandas_sort(store_and_dataframe):
+    """
+    GIVEN a data store
+    WHEN countries are ranked smallest first
+    THEN the values are in the order of the pandas sort with missing values
+        last, tied countries being in reverse dataset order
+    """
+    store, df = store_and_dataframe
+    for column in rankable_columns(store):
+        values = numeric_column(df, column).reset_index(drop=True)
+        for region_name in [ds.ALL_REGIONS] + store.region_names:
+            positions = store.ranked_positions(column, region_name, ascending=True)
+            expected_values = (
+                values.iloc[store.region_positions(region_name)]
+                .sort_values(na_position="last")
+                .to_numpy()
+            )
+            np.testing.assert_array_equal(values.iloc[positions], expected_values)
+            assert sorted(positions) == sorted(store.region_positions(region_name))
+
+
+def test_ties_and_missing_values_order(small_store):
+    """
+    GIVEN countries A and C tied in 2018, B and F tied, and D missing
+    WHEN they are ranked by 2018
+    THEN ties keep dataset order largest first and reverse order smallest
+        first, and D is last both ways
+    """
+    names = np.array(small_store.country_names)
+    assert names[small_store.ranked_positions("2018")].tolist() == list("ACBFGED")
+    assert names[small_store.ranked_positions("2018", ascending=True)].tolist() == list(
+        "EGFBCAD"
+    )
+    assert names[small_store.ranked_positions(2019, "North")].tolist() == list("CGAE")
+
+
+def test_top_n_matches_pandas_nlargest(store_and_dataframe):
+    """
+    GIVEN a data store
+    WHEN the top n countries of a year are looked up
+    THEN they are the first n rows of the pandas sort, at most every country
+    """
+    store, df = store_and_dataframe
+    column = store.year_columns[-2]
+    expected = (
+        df[column]
+        .reset_index(drop=True)
+        .sort_values(ascending=False, kind="stable", na_position="last")
+        .index.to_numpy()
+    )
+    for n in [0, 1, 3, len(df), len(df) + 5]:
+        np.testing.assert_array_equal(store.top_n(column, n), expected[:n])
+
+
+def test_rank_matches_pandas_rank(store_and_dataframe):
+    """
+    GIVEN a data store
+    WHEN the rank of every country is looked up for each year, overall and in
+        its region
+    THEN it matches the pandas first-come rank, and is None if missing
+    """
+    store, df = store_and_dataframe
+    for column in store.year_columns:
+        values = df[column]
+        overall_ranks = values.rank(method="first", ascending=False)
+        region_ranks = values.groupby(df["Region"]).rank(
+            method="first", ascending=False
+        )
+        for position, country_name in enumerate(store.country_names):
+            expected = overall_ranks.iat[position]
+            assert store.rank(country_name, column) == (
+                None if np.isnan(expected) else int(expected)
+            )
+            region_name = df["Region"].iat[position]
+            expected = region_ranks.iat[position]
+            assert store.rank(country_name, column, region_name) == (
+                None if np.isnan(expected) else int(expected)
+            )
+
+
+def test_rank_outside_region_is_none(small_store):
+    """
+    GIVEN country A in the North region
+    WHEN its rank is looked up in the South region
+    THEN None is returned
+    """
+    assert small_store.rank("A", "2018", "South") is None
+    assert small_store.rank("A", "2018", "North") == 1
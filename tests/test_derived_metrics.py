@@ -0,0 +1,237 @@
+"""
+Tests of the derived metrics against the pandas calculations they replace.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+import data_store as ds
+import derived_metrics as dm
+
+
+@pytest.fixture(params=["small", "dataset"])
+def metrics_and_years(request):
+    """
+    Derived metrics of each data store, with its year columns as a dataframe
+    of a row per year and a column per country.
+    """
+    store = request.getfixturevalue(f"{request.param}_store")
+    df_years = store.dataframe[store.year_columns].T.astype(float)
+    return dm.DerivedMetrics(store), df_years.reset_index(drop=True)
+
+
+def year_ranges(year_count, step):
+    """Every range of rows first to last, with the first rows every step."""
+    return [
+        (first_row, last_row)
+        for first_row in range(0, year_count, step)
+        for last_row in range(first_row, year_count)
+    ]
+
+
+def pandas_window_values(df_range, aggregate):
+    """Summary of a range of years of every country with pandas."""
+    if aggregate == dm.WINDOW_SUM:
+        return df_range.sum(min_count=1)
+    if aggregate == dm.WINDOW_MEAN:
+        return df_range.mean()
+    if aggregate == dm.WINDOW_MIN:
+        return df_range.min()
+    if aggregate == dm.WINDOW_MAX:
+        return df_range.max()
+    first_year, last_year = df_range.iloc[0], df_range.iloc[-1]
+    return (last_year / first_year - 1).where(first_year > 0)
+
+
+@pytest.mark.parametrize("aggregate", dm.WINDOW_AGGREGATES)
+def test_window_values_match_pandas(metrics_and_years, aggregate):
+    """
+    GIVEN the derived metrics of a dataset with missing years
+    WHEN a range of years is summarised, including single year ranges
+    THEN each country's value matches pandas over the same columns
+    """
+    derived_metrics, df_years = metrics_and_years
+    years = derived_metrics._years
+    step = 1 if len(years) < 10 else 4
+    for first_row, last_row in year_ranges(len(years), step):
+        values = derived_metrics.window_values(
+            years[first_row], years[last_row], aggregate
+        )
+        expected = pandas_window_values(
+            df_years.iloc[first_row : last_row + 1], aggregate
+        )
+        np.testing.assert_allclose(values, expected.to_numpy(), rtol=1e-9)
+
+
+def test_single_year_range_is_that_year(small_store):
+    """
+    GIVEN country D with no arrivals in 2018
+    WHEN the range 2018 to 2018 is summarised
+    THEN the sum, mean, lowest and highest are the 2018 arrivals, growth is 0
+        and D has no value
+    """
+    derived_metrics = dm.DerivedMetrics(small_store)
+    arrivals_2018 = small_store.year_matrix[0]
+    for aggregate in [dm.WINDOW_SUM, dm.WINDOW_MEAN, dm.WINDOW_MIN, dm.WINDOW_MAX]:
+        np.testing.assert_array_equal(
+            derived_metrics.window_values(2018, 2018, aggregate), arrivals_2018
+        )
+    growth = derived_metrics.window_values(2018, 2018, dm.WINDOW_GROWTH)
+    assert np.isnan(growth[3])
+    np.testing.assert_array_equal(np.delete(growth, 3), 0.0)
+    assert derived_metrics.window_counts(2018, 2018).tolist() == [1, 1, 1, 0, 1, 1, 1]
+
+
+def test_reversed_or_unknown_range_is_rejected(small_store):
+    """
+    GIVEN the derived metrics of a dataset
+    WHEN a reversed range, a year not in the dataset or an unknown summary is used
+    THEN an error is raised
+    """
+    derived_metrics = dm.DerivedMetrics(small_store)
+    with pytest.raises(ValueError):
+        derived_metrics.window_values(2020, 2018, dm.WINDOW_SUM)
+    with pytest.raises(KeyError):
+        derived_metrics.window_values(1990, 2018, dm.WINDOW_SUM)
+    with pytest.raises(ValueError):
+        derived_metrics.window_values(2018, 2020, "median")
+
+
+@pytest.mark.parametrize("window", [1, 2, 3, 5])
+def test_rolling_average_matches_pandas_rolling(metrics_and_years, window):
+    """
+    GIVEN the derived metrics of a dataset with missing years
+    WHEN the trailing average over a number of years is calculated
+    THEN it matches the pandas rolling mean, NaN if a year is missing
+    """
+    derived_metrics, df_years = metrics_and_years
+    np.testing.assert_allclose(
+        derived_metrics.rolling_average(window),
+        df_years.rolling(window).mean().to_numpy(),
+        rtol=1e-9,
+    )
+
+
+def test_cagr_matches_compound_growth(metrics_and_years):
+    """
+    GIVEN the derived metrics of a dataset
+    WHEN the growth per year between two years is calculated
+    THEN it matches (last / first) ** (1 / years) - 1, NaN without a first value
+    """
+    derived_metrics, df_years = metrics_and_years
+    years = derived_metrics._years
+    first_year, last_year = df_years.iloc[0], df_years.iloc[-1]
+    expected = ((last_year / first_year) ** (1 / (years[-1] - years[0])) - 1).where(
+        first_year > 0
+    )
+    np.testing.assert_allclose(
+        derived_metrics.cagr(years[0], years[-1]), expected.to_numpy(), rtol=1e-9
+    )
+
+
+def test_volatility_matches_pandas_std_of_growth(metrics_and_years):
+    """
+    GIVEN the derived metrics of a dataset with missing years
+    WHEN the volatility between two years is calculated
+    THEN it is the sample standard deviation of the yearly growth, NaN with
+        fewer than 2 growth values
+    """
+    derived_metrics, df_years = metrics_and_years
+    years = derived_metrics._years
+    previous_years = df_years.shift(1)
+    df_growth = (df_years / previous_years - 1).where(previous_years > 0)
+    for first_row, last_row in [(0, len(years) - 1), (0, 1), (1, len(years) - 1)]:
+        expected = df_growth.iloc[first_row + 1 : last_row + 1].std(ddof=1)
+        np.testing.assert_allclose(
+            derived_metrics.volatility(years[first_row], years[last_row]),
+            expected.to_numpy(),
+            rtol=1e-9,
+        )
+
+
+def test_pre_covid_metrics_match_pandas(metrics_and_years):
+    """
+    GIVEN the derived metrics of a dataset
+    WHEN the pre-COVID peak, its year and the recovery ratio are read
+    THEN they match the pandas maximum of the years before 2020
+    """
+    derived_metrics, df_years = metrics_and_years
+    years = derived_metrics._years
+    df_pre_covid = df_years[years < dm.COVID_YEAR]
+    peak = df_pre_covid.max()
+    peak_year = pd.Series(years[df_pre_covid.fillna(-np.inf).idxmax()]).where(
+        peak.notna().to_numpy()
+    )
+    np.testing.assert_array_equal(
+        derived_metrics.column(dm.PRE_COVID_PEAK), peak.to_numpy()
+    )
+    np.testing.assert_array_equal(
+        derived_metrics.column(dm.PRE_COVID_PEAK_YEAR), peak_year.to_numpy()
+    )
+    np.testing.assert_allclose(
+        derived_metrics.column(dm.RECOVERY_RATIO),
+        (df_years.iloc[-1] / peak).where(peak > 0).to_numpy(),
+        rtol=1e-9,
+    )
+
+
+def test_dataset_with_no_pre_covid_years(small_dataframe):
+    """
+    GIVEN a dataset with no year before 2020
+    WHEN its derived metrics are calculated
+    THEN the pre-COVID metrics are NaN and the trend window is the latest years
+    """
+    df_after_covid = small_dataframe.rename(
+        columns={"2018": "2020", "2019": "2021", "2020": "2022"}
+    )
+    derived_metrics = dm.DerivedMetrics(ds.TourismDataStore(df_after_covid))
+
+    assert (derived_metrics.trend_first_year, derived_metrics.trend_last_year) == (
+        2020,
+        2022,
+    )
+    for metric_name in [dm.PRE_COVID_PEAK, dm.PRE_COVID_PEAK_YEAR, dm.RECOVERY_RATIO]:
+        assert np.isnan(derived_metrics.column(metric_name)).all()
+    assert len(derived_metrics.frame()) == len(df_after_covid)
+
+
+@pytest.mark.parametrize("ascending", [False, True])
+def test_window_ranked_positions_match_year_ranking(metrics_and_years, ascending):
+    """
+    GIVEN the derived metrics of a dataset with ties and missing years
+    WHEN countries are ranked by the total of a range of one year, in every
+        region
+    THEN the order is the same as ranking them by that year
+    """
+    derived_metrics, _ = metrics_and_years
+    store = derived_metrics._store
+    for year in [store.years[0], store.years[-1]]:
+        for region_name in [ds.ALL_REGIONS] + store.region_names:
+            np.testing.assert_array_equal(
+                derived_metrics.window_ranked_positions(
+                    year, year, dm.WINDOW_SUM, region_name, ascending
+                ),
+                store.ranked_positions(year, region_name, ascending),
+            )
+
+
+def test_window_ranked_positions_ties_order(small_store):
+    """
+    GIVEN countries A and C tied for the highest arrivals over 2018 to 2019,
+        D and G tied too, and A, D and E with no 2018 to 2019 growth
+    WHEN they are ranked by highest arrivals and by growth over 2018 to 2019
+    THEN ties keep dataset order largest first and reverse order smallest
+        first, and countries with no value are last both ways
+    """
+    derived_metrics = dm.DerivedMetrics(small_store)
+    names = np.array(small_store.country_names)
+
+    def ranked_names(aggregate, ascending):
+        positions = derived_metrics.window_ranked_positions(
+            2018, 2019, aggregate, ascending=ascending
+        )
+        return "".join(names[positions])
+
+    assert ranked_names(dm.WINDOW_MAX, False) == "BFACDGE"
+    assert ranked_names(dm.WINDOW_MAX, True) == "EGDCAFB"
+    assert ranked_names(dm.WINDOW_GROWTH, False) == "BFGCADE"
+    assert ranked_names(dm.WINDOW_GROWTH, True) == "CGFBADE"
@@ -0,0 +1,95 @@
+"""
+Tests of the cached dataset exports served on /export.
+"""
+from types import SimpleNamespace
+from flask import Flask
+import pytest
+import data_store as ds
+import exports
+import jobs
+
+
+@pytest.fixture
+def export_client(monkeypatch, dataset_dataframe):
+    """
+    Flask test client of the export route, with an empty export cache and a
+    count of the export files built.
+    """
+    store = ds.TourismDataStore(
+        dataset_dataframe, version=1, source_sha256="0123456789abcdef" * 4
+    )
+    monkeypatch.setattr(ds, "get_data_store", lambda: store)
+    monkeypatch.setattr(exports, "export_cache", exports.ExportCache(1024 * 1024))
+
+    build_counts = []
+    build_export = exports.build_export
+
+    def counted_build_export(df_export, export_format, on_chunk=None):
+        build_counts.append(export_format)
+        return build_export(df_export, export_format, on_chunk=on_chunk)
+
+    monkeypatch.setattr(exports, "build_export", counted_build_export)
+
+    app = SimpleNamespace(server=Flask(__name__))
+    exports.add_export_route(app)
+    client = app.server.test_client()
+    client.build_counts = build_counts
+    return client
+
+
+def test_conditional_request_is_answered_before_building(export_client):
+    """
+    GIVEN an Excel export already downloaded with its ETag
+    WHEN it is requested again with If-None-Match, after the cache was cleared
+    THEN 304 is returned without building the file again
+    """
+    url = "/export/xlsx?region=South+Asia&start=2010&end=2019"
+    response = export_client.get(url)
+    assert response.status_code == 200
+    assert export_client.build_counts == ["xlsx"]
+    etag = response.headers["ETag"]
+
+    exports.export_cache.clear()
+    response = export_client.get(url, headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert export_client.build_counts == ["xlsx"]
+
+
+def test_etag_changes_with_filter_and_format(export_client):
+    """
+    GIVEN exports of different filters and formats
+    WHEN they are requested with the ETag of another export
+    THEN each is built and sent in full
+    """
+    etag = export_client.get("/export/xlsx?region=South+Asia").headers["ETag"]
+    for url in ["/export/xlsx?region=North+America", "/export/csv?region=South+Asia"]:
+        response = export_client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+
+def test_export_job_result_is_cached(export_client, monkeypatch, tmp_path):
+    """
+    GIVEN two background jobs exporting the same rows
+    WHEN they are run one after the other
+    THEN the export is built once and both result files hold the cached export
+    """
+    monkeypatch.setattr(jobs, "JOBS_DIRPATH", tmp_path)
+    export_filter = exports.ExportFilter.from_values(ds.get_data_store(), "South Asia")
+    results = []
+    for job_id in ["0" * 32, "1" * 32]:
+        job = jobs.JobContext(job_id)
+        assert (
+            exports.run_export_job(job, "xlsx", export_filter)
+            == "Tourism arrivals.xlsx"
+        )
+        results.append(tmp_path.joinpath(job.result_filename).read_bytes())
+
+    assert export_client.build_counts == ["xlsx"]
+    expected = exports.get_export(ds.get_data_store(), "xlsx", export_filter)
+    assert results == [expected, expected]
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        f"{job_id}-result.xlsx" for job_id in ["0" * 32, "1" * 32]
+    ]
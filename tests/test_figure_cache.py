@@ -0,0 +1,136 @@
+"""
+Tests of the figure cache and the cached chart builders.
+"""
+import json
+import plotly.io as pio
+import pytest
+import create_charts as cc
+import data_store as ds
+
+
+@pytest.fixture
+def figure_cache(monkeypatch):
+    """Empty figure cache used by the cached chart builders during a test."""
+    figure_cache = cc.FigureCache(max_bytes=1024 * 1024)
+    monkeypatch.setattr(cc, "figure_cache", figure_cache)
+    return figure_cache
+
+
+def figure_json(size_bytes):
+    """Serialized figure JSON of the given size, padded with a title."""
+    figure_json = json.dumps({"data": [], "layout": {"title": {"text": ""}}})
+    return figure_json.replace('""', '"' + "x" * (size_bytes - len(figure_json)) + '"')
+
+
+def test_least_recently_used_figures_are_evicted_to_fit_budget():
+    """
+    GIVEN a figure cache with room for three figures
+    WHEN a fourth figure is added after the first was used again
+    THEN the least recently used figure is evicted and the total stays in budget
+    """
+    figure_cache = cc.FigureCache(max_bytes=300)
+    for name in ["a", "b", "c"]:
+        figure_cache.put(("builder", 1, name), None, figure_json(100))
+    assert figure_cache.get_json(("builder", 1, "a")) is not None
+
+    figure_cache.put(("builder", 1, "d"), None, figure_json(100))
+
+    assert figure_cache.get_json(("builder", 1, "b")) is None
+    for name in ["a", "c", "d"]:
+        assert figure_cache.get_json(("builder", 1, name)) is not None
+    stats = figure_cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["entries"] == 3
+    assert stats["bytes"] <= stats["max_bytes"]
+
+
+def test_figure_larger_than_budget_is_not_cached():
+    """
+    GIVEN a figure cache holding a figure
+    WHEN a figure larger than the whole budget is added
+    THEN it is not cached and the other figure is kept
+    """
+    figure_cache = cc.FigureCache(max_bytes=300)
+    figure_cache.put(("builder", 1, "a"), None, figure_json(100))
+    figure_cache.put(("builder", 1, "big"), None, figure_json(400))
+    assert figure_cache.get_json(("builder", 1, "big")) is None
+    assert figure_cache.get_json(("builder", 1, "a")) is not None
+
+
+def test_new_dataset_version_drops_older_figures():
+    """
+    GIVEN a figure cache with figures of dataset version 1
+    WHEN a figure of version 2 is added
+    THEN the version 1 figures are dropped, and are not added again later
+    """
+    figure_cache = cc.FigureCache(max_bytes=1000)
+    figure_cache.put(("builder", 1, "a"), None, figure_json(100))
+    figure_cache.put(("builder", 2, "a"), None, figure_json(100))
+
+    assert figure_cache.get_json(("builder", 1, "a")) is None
+    assert figure_cache.get_json(("builder", 2, "a")) is not None
+    figure_cache.put(("builder", 1, "b"), None, figure_json(100))
+    assert figure_cache.get_json(("builder", 1, "b")) is None
+    assert figure_cache.stats()["bytes"] == 100
+
+
+def test_figure_cached_as_json_is_built_once():
+    """
+    GIVEN a figure cached as JSON only, as added by the cache warmer
+    WHEN the figure is read twice
+    THEN the same figure object is returned, built from the JSON
+    """
+    figure_cache = cc.FigureCache(max_bytes=1000)
+    figure_cache.put(("builder", 1, "a"), None, figure_json(100))
+    figure = figure_cache.get(("builder", 1, "a"))
+    assert figure is figure_cache.get(("builder", 1, "a"))
+    expected_title = json.loads(figure_json(100))["layout"]["title"]["text"]
+    assert figure.layout.title.text == expected_title
+
+
+def encoded_json(encoded_figure):
+    """Serialized JSON of a figure returned by an encoded builder."""
+    if isinstance(encoded_figure, dict):
+        return encoded_figure
+    return json.loads(cc.orjson.dumps(encoded_figure))
+
+
+def test_encoded_figure_matches_uncached_builder(figure_cache, dataset_store):
+    """
+    GIVEN a cached chart builder
+    WHEN its encoded figure is requested, before and after it is cached
+    THEN it is the same figure the uncached builder returns
+    """
+    expected = json.loads(
+        pio.to_json(
+            cc.create_line_per_country.__wrapped__("Armenia", store=dataset_store),
+            validate=False,
+        )
+    )
+    for _ in range(2):
+        encoded_figure = cc.create_line_per_country.encoded(
+            "Armenia", store=dataset_store
+        )
+        assert encoded_json(encoded_figure) == expected
+    assert figure_cache.stats()["hits"] == 1
+
+    figure = cc.create_line_per_country("Armenia", store=dataset_store)
+    assert json.loads(pio.to_json(figure, validate=False)) == expected
+
+
+def test_reloaded_dataset_builds_figure_again(figure_cache, dataset_dataframe):
+    """
+    GIVEN a figure cached for a dataset version
+    WHEN the same figure is requested for the next dataset version
+    THEN it is built again and the older version's figure is dropped
+    """
+    store = ds.TourismDataStore(dataset_dataframe, version=1)
+    reloaded_store = ds.TourismDataStore(dataset_dataframe, version=2)
+
+    figure = cc.create_line_per_country("Armenia", store=store)
+    assert cc.create_line_per_country("Armenia", store=store) is figure
+    reloaded_figure = cc.create_line_per_country("Armenia", store=reloaded_store)
+
+    assert reloaded_figure is not figure
+    assert figure_cache.stats()["entries"] == 1
+    assert figure_cache.stats()["misses"] == 2
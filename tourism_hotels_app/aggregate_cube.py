@@ -0,0 +1,246 @@
+"""
+Aggregate cube of the tourist arrivals of every region and income group by year.
+
+Region and income group views would otherwise group the countries of the
+dataset for every request, so the total arrivals and the number of countries
+with data of every region, income group and year are added up once per
+dataset version with NumPy, the first time they are used. The totals and
+averages of a region, of an income group or of both are then read from the
+cube, and totals over all regions or income groups are sums over one of its
+axes, so region views cost no more than country views.
+
+Averages are per country with data, so countries missing a year are not
+counted as having no arrivals.
+"""
+from collections import OrderedDict
+import threading
+import numpy as np
+import data_store as ds
+
+# Income group of the countries with none in the dataset
+NOT_CLASSIFIED = "Not classified"
+
+# Measures the cube answers
+SUM = "sum"
+MEAN = "mean"
+COUNT = "count"
+MEASURES = [SUM, MEAN, COUNT]
+
+# Axes of the cube a measure can be grouped by
+REGION = "region"
+INCOME_GROUP = "income_group"
+
+
+def _read_only(values):
+    """Mark a NumPy array as read-only, as the cube is shared, and return it."""
+    values.flags.writeable = False
+    return values
+
+
+def _mean(sums, counts):
+    """Divide sums by counts, NaN where there are no values."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+class AggregateCube:
+    """
+    Total arrivals and number of countries with data of every region, income
+    group and year of one dataset version.
+    """
+
+    def __init__(self, store):
+        """
+        Args:
+            store: TourismDataStore of the dataset version
+        """
+        self._store = store
+        self.years = list(store.years)
+        self.region_names = list(store.region_names)
+        # Countries with no income group get their own, always last even if
+        # it is empty, the charts leave out groups with no countries
+        self.income_group_names = list(store.income_group_names) + [NOT_CLASSIFIED]
+
+        # Cell of each country
+        region_codes = np.zeros(len(store.country_names), dtype=np.intp)
+        for code, region_name in enumerate(self.region_names):
+            region_codes[store.region_positions(region_name)] = code
+        income_group_codes = np.full(
+            len(store.country_names), len(self.income_group_names) - 1, dtype=np.intp
+        )
+        for code, income_group in enumerate(self.income_group_names[:-1]):
+            income_group_codes[store.income_group_positions(income_group)] = code
+        self.region_codes = _read_only(region_codes)
+        self.income_group_codes = _read_only(income_group_codes)
+        self._cell_codes = _read_only(
+            region_codes * len(self.income_group_names) + income_group_codes
+        )
+        self.shape = (len(self.region_names), len(self.income_group_names))
+
+        # Add up every year at once by multiplying the year matrix with a
+        # matrix of which cell each country is in
+        cell_membership = np.zeros(
+            (len(self._cell_codes), self.shape[0] * self.shape[1])
+        )
+        cell_membership[np.arange(len(self._cell_codes)), self._cell_codes] = 1.0
+        year_matrix = store.year_matrix
+        has_value = ~np.isnan(year_matrix)
+        cube_shape = self.shape + (len(self.years),)
+        self.sums = _read_only(
+            (np.where(has_value, year_matrix, 0.0) @ cell_membership).T.reshape(
+                cube_shape
+            )
+        )
+        self.counts = _read_only(
+            (has_value @ cell_membership).T.reshape(cube_shape).astype(np.intp)
+        )
+        # Number of countries in each cell, with data or not
+        self.country_counts = _read_only(
+            np.bincount(
+                self._cell_codes, minlength=self.shape[0] * self.shape[1]
+            ).reshape(self.shape)
+        )
+
+    def _year_index(self, year):
+        """
+        Get the index of a year on the year axis of the cube.
+
+        Raises:
+            KeyError: If the year is not in the dataset
+        """
+        try:
+            return self.years.index(int(year))
+        except ValueError:
+            raise KeyError(f"Year {year} is not in the dataset") from None
+
+    def _measure(self, sums, counts, measure):
+        """
+        Get a measure from matching arrays of totals and counts.
+        """
+        if measure == SUM:
+            return sums
+        if measure == MEAN:
+            return _mean(sums, counts)
+        if measure == COUNT:
+            return counts
+        raise ValueError(f"Unknown measure: {measure}")
+
+    def by_region(self, measure=SUM, income_group=None):
+        """
+        Get a measure of every region and year, over all income groups or
+        only for the countries of one income group.
+
+        Args:
+            measure: One of the names in MEASURES
+            income_group: Optional income group name to slice the cube by
+        Returns:
+            Matrix with shape (regions, years)
+        """
+        if income_group is None:
+            sums, counts = self.sums.sum(axis=1), self.counts.sum(axis=1)
+        else:
+            income_group_index = self.income_group_names.index(income_group)
+            sums = self.sums[:, income_group_index]
+            counts = self.counts[:, income_group_index]
+        return self._measure(sums, counts, measure)
+
+    def by_income_group(self, measure=SUM, region_name=ds.ALL_REGIONS):
+        """
+        Get a measure of every income group and year, over all regions or
+        only for the countries of one region.
+
+        Args:
+            measure: One of the names in MEASURES
+            region_name: Region name to slice the cube by, or "All regions"
+        Returns:
+            Matrix with shape (income groups, years)
+        """
+        if region_name == ds.ALL_REGIONS:
+            sums, counts = self.sums.sum(axis=0), self.counts.sum(axis=0)
+        else:
+            region_index = self.region_names.index(region_name)
+            sums, counts = self.sums[region_index], self.counts[region_index]
+        return self._measure(sums, counts, measure)
+
+    def group(self, group_by, measure=SUM, region_name=ds.ALL_REGIONS):
+        """
+        Get a measure of every region or income group and year.
+
+        Args:
+            group_by: REGION or INCOME_GROUP
+            measure: One of the names in MEASURES
+            region_name: For income groups, region name to slice the cube by,
+                or "All regions"
+        Returns:
+            group_names: List of the region or income group names
+            values: Matrix with shape (groups, years)
+        """
+        if group_by == REGION:
+            return self.region_names, self.by_region(measure)
+        if group_by == INCOME_GROUP:
+            return self.income_group_names, self.by_income_group(measure, region_name)
+        raise ValueError(f"Unknown group: {group_by}")
+
+    def levels(self, measure=SUM, year=None, values=None):
+        """
+        Get a measure of every region, and of every region and income group,
+        for a year of the cube or for any per-country values, e.g. a summary
+        of a range of years, which are added up the same way.
+
+        Args:
+            measure: One of the names in MEASURES
+            year: Year as an integer or string, if values is not given
+            values: Optional float array in dataset order, NaN for missing values
+        Returns:
+            region_values: Array with a value per region
+            cell_values: Matrix with shape (regions, income groups)
+        """
+        if values is None:
+            year_index = self._year_index(year)
+            sums = self.sums[:, :, year_index]
+            counts = self.counts[:, :, year_index]
+        else:
+            has_value = ~np.isnan(values)
+            cell_count = self.shape[0] * self.shape[1]
+            sums = np.bincount(
+                self._cell_codes[has_value],
+                weights=values[has_value],
+                minlength=cell_count,
+            ).reshape(self.shape)
+            counts = np.bincount(
+                self._cell_codes[has_value], minlength=cell_count
+            ).reshape(self.shape)
+        return (
+            self._measure(sums.sum(axis=1), counts.sum(axis=1), measure),
+            self._measure(sums, counts, measure),
+        )
+
+
+# Cubes of the latest dataset versions, as version -> AggregateCube, so
+# callbacks still using the previous version do not build it again
+_aggregate_cubes = OrderedDict()
+_aggregate_cubes_lock = threading.Lock()
+_KEEP_VERSIONS = 2
+
+
+def get_aggregate_cube(store):
+    """
+    Get the aggregate cube of a dataset version, building it on first use.
+
+    Args:
+        store: TourismDataStore of the dataset version
+    Returns:
+        AggregateCube shared by every callback using this version
+    """
+    aggregate_cube = _aggregate_cubes.get(store.version)
+    if aggregate_cube is not None:
+        return aggregate_cube
+    # Lock so that two threads starting together only build it once
+    with _aggregate_cubes_lock:
+        aggregate_cube = _aggregate_cubes.get(store.version)
+        if aggregate_cube is None:
+            aggregate_cube = AggregateCube(store)
+            _aggregate_cubes[store.version] = aggregate_cube
+            while len(_aggregate_cubes) > _KEEP_VERSIONS:
+                _aggregate_cubes.popitem(last=False)
+    return aggregate_cube
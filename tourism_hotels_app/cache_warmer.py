@@ -0,0 +1,219 @@
+"""
+Cache warmer that pre-renders every figure variant of the home, trends and
+regions pages.
+
+The chart inputs on these pages are a small finite set, so every choropleth
+and treemap for each year and region, every top-N bar chart, every summary of
+the pre-COVID decade, every region and income group line chart and every
+line chart per country is rendered in a process pool and added to the figure
+cache. The rendered figure JSON is also saved next to the dataset snapshot,
+so later starts with the same dataset load it instead of rendering again.
+
+Run this file to render the figures for the current dataset ahead of a deploy.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import json
+import logging
+import multiprocessing
+import os
+import plotly.io as pio
+import aggregate_cube as ac
+import create_charts as cc
+import data_store as ds
+import derived_metrics as dm
+import helper_functions as helper
+
+
+logger = logging.getLogger(__name__)
+
+# Number of top countries the bar chart slider can select
+TOP_X_COUNTRIES_RANGE = range(1, 16)
+
+# Format of the figures saved by the chart builders, increased when they
+# change, so figures saved by an older version are rendered again
+FIGURES_FORMAT = 5
+
+
+def figure_variants(store):
+    """
+    List every chart builder and inputs that the page callbacks can request.
+
+    Args:
+        store: Dataset version to list the years, regions and countries of
+    Returns:
+        List of (builder name, chart inputs tuple) pairs
+    """
+    variants = []
+    for year in store.years:
+        for region_name in [ds.ALL_REGIONS] + store.region_names:
+            variants.append(("create_choropleth_map", (year, region_name)))
+            variants.append(("create_tree_map", (year, region_name)))
+    for top_x_countries in TOP_X_COUNTRIES_RANGE:
+        variants.append(("bar_chart_top_x_tourism_countries", (top_x_countries,)))
+    # Every summary of the pre-COVID decade, the range of years analysts use most
+    derived_metrics = dm.get_derived_metrics(store)
+    year_range = (derived_metrics.trend_first_year, derived_metrics.trend_last_year)
+    for aggregate in dm.WINDOW_AGGREGATES:
+        for region_name in [ds.ALL_REGIONS] + store.region_names:
+            variants.append(
+                ("create_choropleth_map_range", year_range + (aggregate, region_name))
+            )
+            variants.append(
+                ("create_tree_map_range", year_range + (aggregate, region_name))
+            )
+        for top_x_countries in TOP_X_COUNTRIES_RANGE:
+            variants.append(
+                (
+                    "bar_chart_top_x_range",
+                    (top_x_countries,) + year_range + (aggregate,),
+                )
+            )
+    # Region and income group lines of the regions page, for every measure
+    for measure in ac.MEASURES:
+        variants.append(
+            ("create_group_line_chart", (ac.REGION, measure, ds.ALL_REGIONS))
+        )
+        for region_name in [ds.ALL_REGIONS] + store.region_names:
+            variants.append(
+                ("create_group_line_chart", (ac.INCOME_GROUP, measure, region_name))
+            )
+    for country_name in store.country_names:
+        variants.append(("create_line_per_country", (country_name,)))
+    return variants
+
+
+def _render_variants(variants):
+    """
+    Render a batch of figure variants to JSON in a worker process.
+
+    Args:
+        variants: List of (builder name, chart inputs tuple) pairs
+    Returns:
+        source_sha256: Hash of the dataset the figures were rendered from
+        rendered: List of (builder name, chart inputs, figure JSON) tuples
+    """
+    store = ds.get_data_store()
+    rendered = []
+    for builder_name, args in variants:
+        # Call the builder without the cache, as this process is short lived
+        build_figure = getattr(cc, builder_name).__wrapped__
+        figure = build_figure(*args, store=store)
+        rendered.append((builder_name, args, pio.to_json(figure, validate=False)))
+    return store.source_sha256, rendered
+
+
+def render_all_figures(store, max_workers=None):
+    """
+    Render every figure variant to JSON, spread over a process pool.
+
+    Args:
+        store: Dataset version the figures must be rendered from
+        max_workers: Number of worker processes, defaults to the CPU count
+    Returns:
+        List of (builder name, chart inputs, figure JSON) tuples
+    """
+    variants = figure_variants(store)
+    max_workers = max_workers or os.cpu_count() or 1
+    # Several batches per worker so that slow batches do not hold up the pool
+    batch_count = max_workers * 4
+    batches = [variants[i::batch_count] for i in range(batch_count)]
+
+    rendered = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for source_sha256, batch_rendered in executor.map(_render_variants, batches):
+            if source_sha256 != store.source_sha256:
+                raise RuntimeError("Dataset changed while rendering figures")
+            rendered.extend(batch_rendered)
+    return rendered
+
+
+def figures_filepath(store):
+    """
+    Get the path of the rendered figures file saved with the dataset snapshot,
+    named by the figures format and the decimal places the values are rounded to.
+    """
+    return helper.SNAPSHOT_DIRPATH.joinpath(
+        store.source_sha256[:16],
+        f"figures-{FIGURES_FORMAT}-{cc.FIGURE_DECIMALS}.json",
+    )
+
+
+def save_figures(rendered, filepath):
+    """
+    Save rendered figure JSON to a file, replacing it atomically.
+
+    Args:
+        rendered: List of (builder name, chart inputs, figure JSON) tuples
+        filepath: Path of the file to write
+    Returns:
+        None
+    """
+    temp_filepath = filepath.with_name(f".{filepath.name}-{os.getpid()}")
+    with open(temp_filepath, "w") as file:
+        json.dump(rendered, file)
+    os.replace(temp_filepath, filepath)
+
+
+def load_figures(filepath):
+    """
+    Load rendered figure JSON saved by save_figures.
+
+    Args:
+        filepath: Path of the saved figures file
+    Returns:
+        List of (builder name, chart inputs tuple, figure JSON) tuples, or
+        None if the file does not exist or cannot be read
+    """
+    try:
+        with open(filepath) as file:
+            rendered = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return [
+        (builder_name, tuple(args), figure_json)
+        for builder_name, args, figure_json in rendered
+    ]
+
+
+def warm_figure_cache(max_workers=None, use_saved_figures=True):
+    """
+    Fill the figure cache with every figure variant for the current dataset.
+
+    Saved figures for the same dataset are loaded if they exist, otherwise
+    the figures are rendered in a process pool and saved for next time.
+    Only runs in the main process, so worker processes never warm again.
+
+    Args:
+        max_workers: Number of worker processes, defaults to the CPU count
+        use_saved_figures: Load and save the rendered figures file
+    Returns:
+        Number of figures added to the figure cache
+    """
+    if multiprocessing.parent_process() is not None:
+        return 0
+
+    store = ds.get_data_store()
+    filepath = figures_filepath(store)
+    rendered = load_figures(filepath) if use_saved_figures else None
+    if rendered is None:
+        rendered = render_all_figures(store, max_workers)
+        if use_saved_figures:
+            try:
+                save_figures(rendered, filepath)
+            except OSError:
+                # Snapshot folder was replaced by a newer dataset meanwhile
+                logger.warning("Could not save rendered figures to %s", filepath)
+
+    for builder_name, args, figure_json in rendered:
+        key = cc.figure_cache_key(builder_name, store, args)
+        cc.figure_cache.put(key, None, figure_json)
+    logger.info("Warmed figure cache with %s figures", len(rendered))
+    return len(rendered)
+
+
+if __name__ == "__main__":
+    # Render and save the figures for the current dataset, e.g. before deploy
+    store = ds.get_data_store()
+    rendered = render_all_figures(store)
+    save_figures(rendered, figures_filepath(store))
+    print(f"Saved {len(rendered)} figures to {figures_filepath(store)}")
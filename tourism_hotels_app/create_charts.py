@@ -1,24 +1,353 @@
-"""Helper functions for creating the charts."""
-from pathlib import Path
-import pandas as pd
+"""
+Helper functions for creating the charts.
+
+Figures are memoized in a bounded LRU figure cache keyed by the chart inputs
+and the dataset version, so repeated inputs do not rebuild the figure.
+Callbacks can also get the figure as JSON encoded once when it was cached,
+which Dash adds to the response without validating or encoding it again.
+"""
+from collections import OrderedDict
+import base64
+import functools
+import json
 import math
+import os
+import threading
+from dash import Patch
+import numpy as np
 import plotly.express as px
 import plotly.graph_objs as go
-import helper_functions as helper
+import plotly.io as pio
+import aggregate_cube as ac
+import data_store as ds
+import derived_metrics as dm
+import metrics
 
+try:
+    import orjson
+except ImportError:
+    # Without orjson, encoded figures are returned as plain dictionaries
+    orjson = None
+else:
+    # orjson.Fragment was added in orjson 3.9, older versions are not used
+    if not hasattr(orjson, "Fragment"):
+        orjson = None
 
 # Create custom colorscale for choropleth map to match overall blue theme
 custom_colorscale = [[0.0, "#003366"], [0.5, "#007bff"], [1.0, "#87ceeb"]]
 
-# Global prepared dataset path for tourist arrivals
-TOURISM_DATA_FILEPATH = Path(__file__).parent.parent.joinpath(
-    "tourism_hotels_app", "data", "Tourism_arrivals_prepared.csv"
+# Decimal places the figure values are rounded to before they are sent to the
+# browser, arrivals are whole numbers of people so none are kept by default
+FIGURE_DECIMALS = int(os.environ.get("TOURISM_FIGURE_DECIMALS", "0"))
+
+# Levels of the drill-down tree map of all regions shown at once, the regions
+# and their income groups, clicking one shows its countries
+DRILLDOWN_DEPTH = 2
+
+# Whole number typed array dtypes plotly.js reads, smallest first
+_INTEGER_DTYPES = [np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32]
+
+
+class FigureCache:
+    """
+    Thread-safe least recently used cache of figures with a byte budget.
+
+    Each entry keeps the figure and its serialized JSON, so figures rendered
+    in other processes, e.g. by the cache warmer, can be added as JSON only.
+    Keys start with the chart builder name and the dataset version, so when a
+    new dataset version is cached the entries of older versions are dropped.
+    Cached figures are shared between requests and must not be modified.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        Args:
+            max_bytes: Maximum total serialized size of the cached figures
+        """
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self._latest_version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Get a cached figure and mark it as most recently used.
+
+        Args:
+            key: Tuple of builder name, dataset version and chart inputs
+        Returns:
+            Cached figure, or None if it is not in the cache
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        if entry[0] is None:
+            # Only the JSON was cached, so build the figure from it once,
+            # skipping validation as it was valid when it was serialized
+            entry[0] = go.Figure(json.loads(entry[1]), _validate=False)
+        return entry[0]
+
+    def get_json(self, key):
+        """
+        Get the serialized JSON of a cached figure and mark it as most recently
+        used, without building the figure object.
+
+        Args:
+            key: Tuple of builder name, dataset version and chart inputs
+        Returns:
+            Figure JSON string, or None if it is not in the cache
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, figure, figure_json):
+        """
+        Add a figure, evicting least recently used figures to fit the budget.
+
+        Args:
+            key: Tuple of builder name, dataset version and chart inputs
+            figure: Plotly figure to cache, or None to build it from the JSON
+            figure_json: Serialized JSON of the figure as a string
+        Returns:
+            None
+        """
+        size_bytes = len(figure_json)
+        if size_bytes > self.max_bytes:
+            return
+        version = key[1]
+        with self._lock:
+            # Drop every figure built from an older dataset version
+            if self._latest_version is None or version > self._latest_version:
+                self._latest_version = version
+                for old_key in [k for k in self._entries if k[1] < version]:
+                    self._total_bytes -= self._entries.pop(old_key)[2]
+            elif version < self._latest_version:
+                return
+
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)[2]
+            self._entries[key] = [figure, figure_json, size_bytes]
+            self._total_bytes += size_bytes
+            while self._total_bytes > self.max_bytes:
+                _, evicted_entry = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_entry[2]
+                self.evictions += 1
+
+    def clear(self):
+        """Remove every cached figure and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """
+        Get the cache counters, e.g. to check the hit rate.
+
+        Returns:
+            Dictionary of hits, misses, evictions, entries, bytes and max_bytes
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# Shared figure cache, budget in megabytes can be set with an env variable
+figure_cache = FigureCache(
+    int(float(os.environ.get("TOURISM_FIGURE_CACHE_MB", "64")) * 1024 * 1024)
 )
-# Import global prepared dataframe from above dataset
-df_arrivals_prepared = pd.read_csv(TOURISM_DATA_FILEPATH)
 
 
-def create_choropleth_map(year_selected, selected_region):
+def figure_cache_metrics():
+    """
+    Get the figure cache counters in the format of the /metrics route.
+
+    Returns:
+        List of (name, type, help, value) tuples
+    """
+    stats = figure_cache.stats()
+    return [
+        ("figure_cache_hits_total", "counter", "Figure cache hits.", stats["hits"]),
+        (
+            "figure_cache_misses_total",
+            "counter",
+            "Figure cache misses, each building a figure.",
+            stats["misses"],
+        ),
+        (
+            "figure_cache_evictions_total",
+            "counter",
+            "Figures evicted to stay within the cache budget.",
+            stats["evictions"],
+        ),
+        ("figure_cache_entries", "gauge", "Figures in the cache.", stats["entries"]),
+        (
+            "figure_cache_bytes",
+            "gauge",
+            "Estimated size of the cached figures.",
+            stats["bytes"],
+        ),
+    ]
+
+
+metrics.register_collector(figure_cache_metrics)
+
+
+def figure_cache_key(builder_name, store, args):
+    """
+    Create the figure cache key for a chart builder and its inputs.
+
+    Args:
+        builder_name: Name of the chart builder function
+        store: Dataset version the figure is built from
+        args: Tuple of chart inputs passed to the builder
+    Returns:
+        Tuple used as the figure cache key
+    """
+    return (builder_name, store.version) + tuple(args)
+
+
+def encode_figure_json(figure_json):
+    """
+    Wrap serialized figure JSON so it can be returned from a callback.
+
+    With orjson installed, which Dash and plotly use to encode responses, the
+    JSON is wrapped in an orjson.Fragment and copied into the response as is.
+
+    Args:
+        figure_json: Serialized JSON of a figure as a string
+    Returns:
+        orjson.Fragment, or a dictionary if orjson 3.9 or later is not installed
+    """
+    if orjson is not None:
+        return orjson.Fragment(figure_json)
+    return json.loads(figure_json)
+
+
+def compact_array(values, decimals=None):
+    """
+    Round an array of numbers and store it in the smallest dtype holding the
+    rounded values exactly, e.g. uint16 or float32, which plotly sends to the
+    browser as a typed array of that dtype.
+
+    Args:
+        values: NumPy array of numbers, NaN is shown as missing data
+        decimals: Decimal places to round to, defaults to FIGURE_DECIMALS
+    Returns:
+        NumPy array of the rounded values
+    """
+    if decimals is None:
+        decimals = FIGURE_DECIMALS
+    values = np.round(np.asarray(values, dtype=np.float64), decimals)
+
+    # Whole numbers without missing data fit in an integer dtype
+    if values.size and np.isfinite(values).all() and (values == np.trunc(values)).all():
+        for dtype in _INTEGER_DTYPES:
+            dtype_info = np.iinfo(dtype)
+            if dtype_info.min <= values.min() and values.max() <= dtype_info.max:
+                return values.astype(dtype)
+
+    # Otherwise use float32 if it holds every value exactly
+    float32_values = values.astype(np.float32)
+    if np.array_equal(float32_values, values, equal_nan=True):
+        return float32_values
+    return values
+
+
+def encode_typed_array(values, decimals=None):
+    """
+    Encode an array of numbers in the base64 typed array format plotly.js
+    reads, rounded and in the smallest dtype as by compact_array.
+
+    Args:
+        values: NumPy array of numbers, NaN is shown as missing data
+        decimals: Decimal places to round to, defaults to FIGURE_DECIMALS
+    Returns:
+        Dictionary with the dtype, base64 encoded little-endian bytes and, for
+        arrays of more than one dimension, the shape
+    """
+    values = compact_array(values, decimals)
+    values = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder("<"))
+    typed_array = {
+        # Typed array dtype names are the kind and size, e.g. u2 or f4
+        "dtype": f"{values.dtype.kind}{values.dtype.itemsize}",
+        "bdata": base64.b64encode(values.tobytes()).decode(),
+    }
+    if values.ndim > 1:
+        typed_array["shape"] = ", ".join(str(size) for size in values.shape)
+    return typed_array
+
+
+def cached_figure(build_figure):
+    """
+    Decorator to memoize a chart builder in the shared figure cache.
+
+    The decorated builder must take its chart inputs as positional arguments
+    and the dataset version as the store keyword argument. The original
+    builder is available as the __wrapped__ attribute, and the encoded
+    attribute takes the same arguments and returns the pre-encoded figure
+    JSON for use as a callback output.
+
+    Args:
+        build_figure: Chart builder function returning a plotly figure
+    Returns:
+        Wrapped chart builder using the figure cache
+    """
+
+    def build_and_cache(key, args, store):
+        figure = build_figure(*args, store=store)
+        # Figure was validated while building, so only encode it here
+        figure_json = pio.to_json(figure, validate=False)
+        figure_cache.put(key, figure, figure_json)
+        return figure, figure_json
+
+    @functools.wraps(build_figure)
+    def cached_build_figure(*args, store=None):
+        with metrics.builder_duration.time(build_figure.__name__):
+            if store is None:
+                store = ds.get_data_store()
+            key = figure_cache_key(build_figure.__name__, store, args)
+            figure = figure_cache.get(key)
+            if figure is None:
+                figure, _ = build_and_cache(key, args, store)
+            return figure
+
+    def encoded_build_figure(*args, store=None):
+        with metrics.builder_duration.time(build_figure.__name__):
+            if store is None:
+                store = ds.get_data_store()
+            key = figure_cache_key(build_figure.__name__, store, args)
+            figure_json = figure_cache.get_json(key)
+            if figure_json is None:
+                _, figure_json = build_and_cache(key, args, store)
+            return encode_figure_json(figure_json)
+
+    cached_build_figure.encoded = encoded_build_figure
+    return cached_build_figure
+
+
+@cached_figure
+def create_choropleth_map(year_selected, selected_region, store=None):
     """
     Create a choropleth map showing in terms of level on a color gradient
     what the different countries are in terms of tourist arrivals.
@@ -26,16 +355,15 @@ def create_choropleth_map(year_selected, selected_region):
     Args:
         year_selected: Callback output of a number between 1995 to 2020
         selected_region: Callback output of a region name as a string
+        store: Dataset version to use, defaults to the current data store
     Returns:
         fig_choropleth: Plotly Express choropleth map figure for selected year and region
     """
-    if selected_region == "All regions":
-        filtered_df_by_region = df_arrivals_prepared
-    else:
-        # Filter by region if a region selected
-        filtered_df_by_region = df_arrivals_prepared[
-            df_arrivals_prepared["Region"] == selected_region
-        ]
+    if store is None:
+        store = ds.get_data_store()
+
+    # Filter by region if a region selected, store returns all for "All regions"
+    filtered_df_by_region = store.region(selected_region)
 
     # Create choropleth figure, note title not added
     ## Title added in main page layout to look better with responsive devices
@@ -53,6 +381,26 @@ def create_choropleth_map(year_selected, selected_region):
         labels={f"{str(year_selected)}": "No. of arrivals in <br>Millions"},
     )
 
+    return style_choropleth_map(fig_choropleth)
+
+
+def style_choropleth_map(fig_choropleth, decimals=None):
+    """
+    Add the layout, missing data key and instructions to a choropleth map
+    made by plotly express, and send its values compactly.
+
+    Args:
+        fig_choropleth: Plotly Express choropleth map figure
+        decimals: Decimal places to round the values to, defaults to FIGURE_DECIMALS
+    Returns:
+        fig_choropleth: The same figure, changed in place
+    """
+    # Send compact values, and drop the hidden "Country Code" hover column as
+    # the hover text does not use it
+    fig_choropleth.update_traces(
+        z=compact_array(fig_choropleth.data[0].z, decimals), customdata=None
+    )
+
     fig_choropleth.update_layout(
         # Resize choropleth figure to a larger size to view easier
         margin={"r": 10, "t": 10, "l": 0, "b": 0},
@@ -105,30 +453,45 @@ def create_choropleth_map(year_selected, selected_region):
     return fig_choropleth
 
 
-def create_tree_map(year_selected, region_name):
+@cached_figure
+def create_tree_map(year_selected, region_name, store=None):
     """
     Create a tree map showing each country as a proportion for a specific
-    year and region selected.
+    year and region selected. For all regions, the tree map shows the regions
+    and their income groups, which are clicked to drill down to countries.
 
     Args:
         year_selected: Callback output of a number between 1995 to 2020
         selected_region: Callback output of a region name as a string
+        store: Dataset version to use, defaults to the current data store
     Returns:
         fig_tree_map_regional: Plotly Express tree map figure for selected year and region
     """
-    df_arrivals = df_arrivals_prepared
+    if store is None:
+        store = ds.get_data_store()
 
-    # Filter dataset by region only if a region selected
-    if region_name == "All regions":
-        filtered_df_by_region = df_arrivals
-    else:
-        filtered_df_by_region = df_arrivals_prepared[
-            df_arrivals_prepared["Region"] == region_name
-        ]
-        title_text = f"Distribution in arrivals in {region_name}"
+    # Define custom hover template for clarity on country and data type
+    hovertemplate = "<b>%{label} </b><br> Total arrivals: %{value:.2f}"
+    colorbar_title = "No. of<br>arrivals<br>in Millions"
 
-    filtered_df_by_region_ascending = filtered_df_by_region.sort_values(
-        [f"{year_selected}"], ascending=(True)
+    # Every country at once is too many squares, so show the regions and
+    # their income groups from the aggregate cube, to drill down from
+    if region_name == ds.ALL_REGIONS:
+        arrivals = store.year_matrix[store.years.index(int(year_selected))]
+        fig_tree_map_regional = drilldown_tree_map_figure(
+            drilldown_tree_map_data(
+                store,
+                arrivals,
+                arrivals,
+                *ac.get_aggregate_cube(store).levels(ac.MEAN, year=year_selected),
+            )
+        )
+        return style_tree_map(fig_tree_map_regional, hovertemplate, colorbar_title)
+
+    # Filter dataset by region only if a region selected, already sorted
+    # ascending by the selected year using the store rank index
+    filtered_df_by_region_ascending = store.rows(
+        store.ranked_positions(f"{year_selected}", region_name, ascending=True)
     )
 
     # Create tree map plotly figure
@@ -143,14 +506,128 @@ def create_tree_map(year_selected, region_name):
         color_continuous_scale=custom_colorscale,
     )
 
-    # Define custom hover template for clarity on country and data type
-    hovertemplate = "<b>%{label} </b><br> Total arrivals: %{value:.2f}"
+    return style_tree_map(fig_tree_map_regional, hovertemplate, colorbar_title)
+
+
+def drilldown_tree_map_data(store, sizes, colors, region_colors, cell_colors):
+    """
+    Create the squares of a tree map of every region, split into its income
+    groups and then its countries, which can be clicked to drill down.
+
+    The country sizes are rounded first, and the size of each region and
+    income group is their total, so plotly finds them exactly equal.
+
+    Args:
+        store: Dataset version to use
+        sizes: Float array of the size of each country in dataset order,
+            missing values are shown as an empty square
+        colors: Float array of the colour value of each country
+        region_colors: Colour value of each region of the aggregate cube
+        cell_colors: Colour value of each region and income group, with shape
+            (regions, income groups)
+    Returns:
+        Dictionary of the ids, labels, parents, values and colors of the squares,
+        regions first, then income groups, then countries in dataset order
+    """
+    cube = ac.get_aggregate_cube(store)
+    sizes = np.round(np.nan_to_num(sizes), FIGURE_DECIMALS)
+    region_sizes, cell_sizes = cube.levels(ac.SUM, values=sizes)
+
+    ids, labels, parents, values, marker_colors = [], [], [], [], []
+    for region_index, region_name in enumerate(cube.region_names):
+        ids.append(region_name)
+        labels.append(region_name)
+        parents.append("")
+        values.append(region_sizes[region_index])
+        marker_colors.append(region_colors[region_index])
+        # Only the income groups the region has countries in
+        for income_group_index in np.flatnonzero(cube.country_counts[region_index]):
+            income_group = cube.income_group_names[income_group_index]
+            ids.append(f"{region_name}/{income_group}")
+            labels.append(income_group)
+            parents.append(region_name)
+            values.append(cell_sizes[region_index, income_group_index])
+            marker_colors.append(cell_colors[region_index, income_group_index])
+
+    # Each country is in the square of its region and income group
+    country_parents = (
+        np.array(cube.region_names, dtype=object)[cube.region_codes]
+        + "/"
+        + np.array(cube.income_group_names, dtype=object)[cube.income_group_codes]
+    )
+    country_ids = country_parents + "/" + np.array(store.country_names, dtype=object)
+    return {
+        "ids": ids + country_ids.tolist(),
+        "labels": labels + list(store.country_names),
+        "parents": parents + country_parents.tolist(),
+        "values": np.concatenate([values, sizes]),
+        "colors": np.concatenate([marker_colors, colors]),
+    }
+
+
+def drilldown_tree_map_figure(tree_map_data, decimals=None):
+    """
+    Create a drill-down tree map figure of every region, laid out as the tree
+    map of one region, to be styled with style_tree_map.
 
+    Args:
+        tree_map_data: Dictionary of the squares from drilldown_tree_map_data
+        decimals: Decimal places to round the colors to, defaults to FIGURE_DECIMALS
+    Returns:
+        fig_tree_map_regional: Plotly go tree map figure
+    """
+    # Compact values are set here, as plotly keeps an array when it is updated
+    # with equal values of another dtype
+    return go.Figure(
+        go.Treemap(
+            ids=tree_map_data["ids"],
+            labels=tree_map_data["labels"],
+            parents=tree_map_data["parents"],
+            values=compact_array(tree_map_data["values"]),
+            # Regions and income groups are the totals of their countries
+            branchvalues="total",
+            maxdepth=DRILLDOWN_DEPTH,
+            marker=dict(
+                colors=compact_array(tree_map_data["colors"], decimals),
+                coloraxis="coloraxis",
+            ),
+        ),
+        layout=dict(
+            width=650,
+            height=370,
+            template="simple_white",
+            coloraxis=dict(colorscale=custom_colorscale),
+        ),
+    )
+
+
+def style_tree_map(fig_tree_map_regional, hovertemplate, colorbar_title, decimals=None):
+    """
+    Add the hover text, instructions and colorbar title to a tree map made by
+    plotly express, and send its values compactly.
+
+    Args:
+        fig_tree_map_regional: Plotly Express tree map figure
+        hovertemplate: Hover template of the country squares
+        colorbar_title: Title of the colorbar
+        decimals: Decimal places to round the colors to, defaults to FIGURE_DECIMALS
+    Returns:
+        fig_tree_map_regional: The same figure, changed in place
+    """
     # update trace with custom hover template
     fig_tree_map_regional.update_traces(
         hovertemplate=hovertemplate, textinfo="label+value"
     )
 
+    # Send compact values, and drop the color values plotly express copies
+    # into the hover data as the custom hover template does not use them
+    tree_map_trace = fig_tree_map_regional.data[0]
+    fig_tree_map_regional.update_traces(
+        values=compact_array(tree_map_trace.values),
+        marker_colors=compact_array(tree_map_trace.marker.colors, decimals),
+        customdata=None,
+    )
+
     # Add text to instruct user how to use
     fig_tree_map_regional.add_annotation(
         text="Hover over a square to see more details<br>Click any rectangle to zoom and focus",
@@ -165,23 +642,181 @@ def create_tree_map(year_selected, region_name):
     )
 
     # Update legend of colorscale to informative text
-    fig_tree_map_regional.update_layout(
-        coloraxis_colorbar=dict(title="No. of<br>arrivals<br>in Millions")
-    )
+    fig_tree_map_regional.update_layout(coloraxis_colorbar=dict(title=colorbar_title))
 
     return fig_tree_map_regional
 
 
-def bar_chart_top_x_tourism_countries(top_x_countries):
+@metrics.timed_builder
+def create_choropleth_patch(year_selected, selected_region, store=None):
+    """
+    Create a partial update of a choropleth map already shown in the browser,
+    changing only the countries and values for the selected year and region.
+
+    The layout, the missing data shape and the annotations are left as they
+    were sent with the full figure from create_choropleth_map.
+
+    Args:
+        year_selected: Callback output of a number between 1995 to 2020
+        selected_region: Callback output of a region name as a string
+        store: Dataset version to use, defaults to the current data store
+    Returns:
+        fig_choropleth_patch: Dash Patch of the choropleth trace data
+    """
+    if store is None:
+        store = ds.get_data_store()
+
+    # Countries are in dataset order, as in the full figure
+    positions = store.region_positions(selected_region)
+    countries = store.rows(positions)
+    year_row = store.years.index(int(year_selected))
+
+    fig_choropleth_patch = Patch()
+    trace = fig_choropleth_patch["data"][0]
+    trace["locations"] = countries["Country Code"].tolist()
+    trace["hovertext"] = countries["Country Name"].tolist()
+    trace["z"] = encode_typed_array(store.year_matrix[year_row, positions])
+    return fig_choropleth_patch
+
+
+@metrics.timed_builder
+def create_tree_map_patch(year_selected, region_name, store=None):
+    """
+    Create a partial update of a tree map already shown in the browser,
+    changing only the countries and values for the selected year and region.
+
+    Args:
+        year_selected: Callback output of a number between 1995 to 2020
+        region_name: Callback output of a region name as a string
+        store: Dataset version to use, defaults to the current data store
+    Returns:
+        fig_tree_map_patch: Dash Patch of the tree map trace data
+    """
+    if store is None:
+        store = ds.get_data_store()
+
+    fig_tree_map_patch = Patch()
+    trace = fig_tree_map_patch["data"][0]
+
+    # Regions, income groups and countries, as in the full figure
+    if region_name == ds.ALL_REGIONS:
+        arrivals = store.year_matrix[store.years.index(int(year_selected))]
+        tree_map_data = drilldown_tree_map_data(
+            store,
+            arrivals,
+            arrivals,
+            *ac.get_aggregate_cube(store).levels(ac.MEAN, year=year_selected),
+        )
+        trace["ids"] = tree_map_data["ids"]
+        trace["labels"] = tree_map_data["labels"]
+        trace["parents"] = tree_map_data["parents"]
+        trace["values"] = encode_typed_array(tree_map_data["values"])
+        trace["marker"]["colors"] = encode_typed_array(tree_map_data["colors"])
+        trace["maxdepth"] = DRILLDOWN_DEPTH
+        return fig_tree_map_patch
+
+    # Countries sorted ascending by the selected year, as in the full figure
+    positions = store.ranked_positions(f"{year_selected}", region_name, ascending=True)
+    country_names = store.rows(positions)["Country Name"].tolist()
+    year_row = store.years.index(int(year_selected))
+    arrivals = store.year_matrix[year_row, positions]
+
+    trace["ids"] = country_names
+    trace["labels"] = country_names
+    trace["parents"] = [""] * len(country_names)
+    # Missing data is shown as an empty square, as plotly express does
+    trace["values"] = encode_typed_array(np.nan_to_num(arrivals))
+    trace["marker"]["colors"] = encode_typed_array(arrivals)
+    return fig_tree_map_patch
+
+
+@metrics.timed_builder
+def create_region_years_data(selected_region, tree_map_region, store=None):
+    """
+    Create the data to switch the choropleth map and tree map between years in
+    the browser, so only a region change needs a request to the server.
+
+    Contains both figures for the latest year and, for every year, the
+    choropleth values and the tree map countries sorted ascending by arrivals,
+    or for the drill-down tree map of all regions, the sizes and colours of
+    its squares.
+
+    Args:
+        selected_region: Region name for the choropleth map, or "All regions"
+        tree_map_region: Region name for the tree map
+        store: Dataset version to use, defaults to the current data store
+    Returns:
+        Dictionary of the figures and the values for each year
+    """
+    if store is None:
+        store = ds.get_data_store()
+    latest_year = store.years[-1]
+    year_matrix = store.year_matrix
+    # Choropleth countries are in dataset order for every year, so only the
+    # colour values change
+    region_positions = store.region_positions(selected_region)
+    country_names = np.array(store.country_names, dtype=object)
+    aggregate_cube = ac.get_aggregate_cube(store)
+
+    choropleth_values = {}
+    tree_map_years = {}
+    for row, year_column in enumerate(store.year_columns):
+        choropleth_values[year_column] = encode_typed_array(
+            year_matrix[row, region_positions]
+        )
+        # The drill-down tree map of all regions has the same squares every
+        # year, so only their sizes and colours change
+        if tree_map_region == ds.ALL_REGIONS:
+            tree_map_data = drilldown_tree_map_data(
+                store,
+                year_matrix[row],
+                year_matrix[row],
+                *aggregate_cube.levels(ac.MEAN, year=year_column),
+            )
+            tree_map_years[year_column] = {
+                "values": encode_typed_array(tree_map_data["values"]),
+                "colors": encode_typed_array(tree_map_data["colors"]),
+            }
+            continue
+        # Tree map countries are sorted ascending by arrivals in each year
+        tree_map_positions = store.ranked_positions(
+            year_column, tree_map_region, ascending=True
+        )
+        tree_map_arrivals = year_matrix[row, tree_map_positions]
+        tree_map_years[year_column] = {
+            "labels": country_names[tree_map_positions].tolist(),
+            # Missing data is shown as an empty square, as plotly express does
+            "values": encode_typed_array(np.nan_to_num(tree_map_arrivals)),
+            "colors": encode_typed_array(tree_map_arrivals),
+        }
+
+    return {
+        "region": selected_region,
+        "tree_map_region": tree_map_region,
+        "choropleth": create_choropleth_map.encoded(
+            latest_year, selected_region, store=store
+        ),
+        "choropleth_z": choropleth_values,
+        "tree_map": create_tree_map.encoded(latest_year, tree_map_region, store=store),
+        "tree_map_years": tree_map_years,
+    }
+
+
+@cached_figure
+def bar_chart_top_x_tourism_countries(top_x_countries, store=None):
     """
     Create a bar chart showing the top 1 to 15 countries for highest average
     international tourist arrivals over the last 10 recorded years.
 
     Args:
         top_x_countries: Callback output of a number between 1 to 15
+        store: Dataset version to use, defaults to the current data store
     Returns:
         fig_bar_chart_10_yr_average_topx: Plotly Express bar chart figure
     """
+    if store is None:
+        store = ds.get_data_store()
+
     # Specify desired columns
     cols = [
         "Country Name",
@@ -189,15 +824,11 @@ def bar_chart_top_x_tourism_countries(top_x_countries):
         "10-year Average in tourist arrivals",
     ]
 
-    # Define global dataframe of the prepared tourism dataset
-    df_arrivals_10year_average = pd.read_csv(TOURISM_DATA_FILEPATH, usecols=cols)
-
-    # Sort the values by "Average tourist arrivals in last 10 years" column descending order
-    df_arrivals_ascending_10yr_average = df_arrivals_10year_average.sort_values(
-        ["10-year Average in tourist arrivals"], ascending=(False)
-    )
-
-    df_arrivals_10yr_topx = df_arrivals_ascending_10yr_average.head(top_x_countries)
+    # Get top countries by "10-year Average in tourist arrivals" in descending
+    # order from the store rank index, then the desired columns
+    df_arrivals_10yr_topx = store.rows(
+        store.top_n("10-year Average in tourist arrivals", top_x_countries)
+    )[cols]
 
     # Create the plotly bar chart figure
     fig_bar_chart_10_yr_average_topx = px.bar(
@@ -219,43 +850,278 @@ def bar_chart_top_x_tourism_countries(top_x_countries):
         color_discrete_sequence=["#007bfa"],
     )
 
+    return style_bar_chart(fig_bar_chart_10_yr_average_topx)
+
+
+def style_bar_chart(fig_bar_chart_topx, decimals=None):
+    """
+    Remove the x-axis ticks of a top countries bar chart made by plotly
+    express, and send its values compactly.
+
+    Args:
+        fig_bar_chart_topx: Plotly Express bar chart figure
+        decimals: Decimal places to round the values to, defaults to FIGURE_DECIMALS
+    Returns:
+        fig_bar_chart_topx: The same figure, changed in place
+    """
     # Remove the x-axis labels and tick lines
-    fig_bar_chart_10_yr_average_topx.update_xaxes(ticklen=0)
+    fig_bar_chart_topx.update_xaxes(ticklen=0)
+
+    # Send compact values
+    fig_bar_chart_topx.update_traces(
+        y=compact_array(fig_bar_chart_topx.data[0].y, decimals)
+    )
+
+    return fig_bar_chart_topx
+
+
+# Names of each summary of a range of years, as shown in the figures
+WINDOW_LABELS = {
+    dm.WINDOW_SUM: "Total arrivals",
+    dm.WINDOW_MEAN: "Average arrivals per year",
+    dm.WINDOW_MIN: "Lowest arrivals",
+    dm.WINDOW_MAX: "Highest arrivals",
+    dm.WINDOW_GROWTH: "Growth in arrivals (%)",
+}
+
 
-    return fig_bar_chart_10_yr_average_topx
+def window_values(first_year, last_year, aggregate, store):
+    """
+    Get the summary of a range of years of every country as shown in the
+    figures, with growth as a percentage.
 
+    Args:
+        first_year: First year of the range
+        last_year: Last year of the range
+        aggregate: One of the names in derived_metrics.WINDOW_AGGREGATES
+        store: Dataset version to use
+    Returns:
+        values: Float array in dataset order
+        decimals: Decimal places to round the values to in the figures
+    """
+    values = dm.get_derived_metrics(store).window_values(
+        first_year, last_year, aggregate
+    )
+    if aggregate == dm.WINDOW_GROWTH:
+        # Keep a decimal place of the percentages
+        return values * 100, max(FIGURE_DECIMALS, 1)
+    return values, FIGURE_DECIMALS
 
-def create_line_per_country(country_name):
+
+@cached_figure
+def create_choropleth_map_range(
+    first_year, last_year, aggregate, selected_region, store=None
+):
+    """
+    Create a choropleth map of the countries coloured by a summary of their
+    tourist arrivals over a range of years, e.g. the total from 2010 to 2019.
+
+    Args:
+        first_year: Callback output of the first year of the range
+        last_year: Callback output of the last year of the range
+        aggregate: One of the names in derived_metrics.WINDOW_AGGREGATES
+        selected_region: Callback output of a region name as a string
+        store: Dataset version to use, defaults to the current data store
+    Returns:
+        fig_choropleth: Plotly Express choropleth map figure for selected years and region
+    """
+    if store is None:
+        store = ds.get_data_store()
+
+    # Countries of the region in dataset order, with the summary of each
+    values, decimals = window_values(first_year, last_year, aggregate, store)
+    positions = store.region_positions(selected_region)
+    value_label = WINDOW_LABELS[aggregate]
+    df_window = store.rows(positions)[["Country Code", "Country Name"]].assign(
+        **{value_label: values[positions]}
+    )
+
+    fig_choropleth = px.choropleth(
+        df_window,
+        locations="Country Code",
+        color=value_label,
+        hover_name="Country Name",
+        hover_data={
+            # remove unwanted "Country Code" column from hover data
+            "Country Code": False,
+        },
+        projection="natural earth",
+        color_continuous_scale=custom_colorscale,
+        labels={value_label: f"{value_label}<br>{first_year}-{last_year}"},
+    )
+
+    return style_choropleth_map(fig_choropleth, decimals)
+
+
+@cached_figure
+def create_tree_map_range(first_year, last_year, aggregate, region_name, store=None):
+    """
+    Create a tree map of the countries of a region sized and coloured by a
+    summary of their tourist arrivals over a range of years. For growth, the
+    squares are sized by the arrivals in the last year of the range instead.
+    For all regions, it is a drill-down tree map as in create_tree_map.
+
+    Args:
+        first_year: Callback output of the first year of the range
+        last_year: Callback output of the last year of the range
+        aggregate: One of the names in derived_metrics.WINDOW_AGGREGATES
+        region_name: Callback output of a region name as a string
+        store: Dataset version to use, defaults to the current data store
+    Returns:
+        fig_tree_map_regional: Plotly Express tree map figure for selected years and region
+    """
+    if store is None:
+        store = ds.get_data_store()
+
+    values, decimals = window_values(first_year, last_year, aggregate, store)
+    value_label = WINDOW_LABELS[aggregate]
+    colorbar_title = value_label.replace(" ", "<br>", 1)
+    if aggregate == dm.WINDOW_GROWTH:
+        # Growth can be negative, so it can only colour the squares
+        size_column = f"{last_year}"
+        hovertemplate = (
+            "<b>%{label} </b><br> Growth: %{color:.1f}%<br> "
+            f"Arrivals in {last_year}: %{{value:.2f}}"
+        )
+    else:
+        size_column = value_label
+        hovertemplate = f"<b>%{{label}} </b><br> {value_label}: %{{value:.2f}}"
+
+    # Drill-down tree map of all regions, coloured by the average of the
+    # countries in each region and income group
+    if region_name == ds.ALL_REGIONS:
+        if aggregate == dm.WINDOW_GROWTH:
+            sizes = store.year_matrix[store.years.index(int(last_year))]
+        else:
+            sizes = values
+        fig_tree_map_regional = drilldown_tree_map_figure(
+            drilldown_tree_map_data(
+                store,
+                sizes,
+                values,
+                *ac.get_aggregate_cube(store).levels(ac.MEAN, values=values),
+            ),
+            decimals,
+        )
+        return style_tree_map(
+            fig_tree_map_regional, hovertemplate, colorbar_title, decimals
+        )
+
+    # Countries sorted ascending by the summary, as the year tree map is
+    positions = dm.get_derived_metrics(store).window_ranked_positions(
+        first_year, last_year, aggregate, region_name, ascending=True
+    )
+    df_window = store.rows(positions)[["Country Name", f"{last_year}"]].assign(
+        **{value_label: values[positions]}
+    )
+
+    fig_tree_map_regional = px.treemap(
+        df_window,
+        path=["Country Name"],
+        values=size_column,
+        width=650,
+        height=370,
+        color=value_label,
+        template="simple_white",
+        color_continuous_scale=custom_colorscale,
+    )
+
+    return style_tree_map(
+        fig_tree_map_regional, hovertemplate, colorbar_title, decimals
+    )
+
+
+@cached_figure
+def bar_chart_top_x_range(
+    top_x_countries, first_year, last_year, aggregate, store=None
+):
+    """
+    Create a bar chart showing the top 1 to 15 countries for a summary of
+    their international tourist arrivals over a range of years.
+
+    Args:
+        top_x_countries: Callback output of a number between 1 to 15
+        first_year: Callback output of the first year of the range
+        last_year: Callback output of the last year of the range
+        aggregate: One of the names in derived_metrics.WINDOW_AGGREGATES
+        store: Dataset version to use, defaults to the current data store
+    Returns:
+        fig_bar_chart_topx: Plotly Express bar chart figure
+    """
+    if store is None:
+        store = ds.get_data_store()
+
+    # Get the top countries by the summary in descending order, leaving out
+    # countries with no data in the range
+    values, decimals = window_values(first_year, last_year, aggregate, store)
+    positions = dm.get_derived_metrics(store).window_ranked_positions(
+        first_year, last_year, aggregate
+    )[:top_x_countries]
+    positions = positions[~np.isnan(values[positions])]
+    value_label = WINDOW_LABELS[aggregate]
+    df_window_topx = store.rows(positions)[["Country Name"]].assign(
+        **{value_label: values[positions]}
+    )
+
+    # Create the plotly bar chart figure
+    fig_bar_chart_topx = px.bar(
+        df_window_topx,
+        # Display corresponding country names in x axis
+        x="Country Name",
+        y=value_label,
+        labels={
+            "Country Name": "",
+            value_label: f"{value_label} {first_year}-{last_year}",
+        },
+        hover_name="Country Name",
+        hover_data={
+            # Remove unwanted "Country Name" label from hover data
+            "Country Name": False,
+        },
+        template="simple_white",
+        # Set bars to exact colour of Bootstrap 'primary' blue
+        color_discrete_sequence=["#007bfa"],
+    )
+
+    return style_bar_chart(fig_bar_chart_topx, decimals)
+
+
+@cached_figure
+def create_line_per_country(country_name, store=None):
     """
     Create a line plot with markers for given country name.
 
     Args:
         country_name: Callback output of a selected country name as a string
+        store: Dataset version to use, defaults to the current data store
     Returns:
         fig_line_per_country: Plotly line chart with markers figure for selected country
 
     """
-    # Drop unwanted columns, transpose dataframe using helper function
-    df_arrivals_transposed = helper.transpose_df_arrivals_prepared()
+    if store is None:
+        store = ds.get_data_store()
+
+    # Look up the country column of the precomputed year by country matrix
+    arrivals_per_year = store.country_arrivals(country_name)
 
     # Create line chart with markers
     fig_line_per_country = px.line(
-        df_arrivals_transposed,
-        x="index",
-        y=country_name,
+        x=store.year_columns,
+        # Send compact values
+        y=compact_array(arrivals_per_year),
         # Update labels for clarity, replace repeated country name
-        labels={"index": "Year", f"{country_name}": "Number of Arrivals"},
+        labels={"x": "Year", "y": "Number of Arrivals"},
         # Enable markers on line
         markers=True,
         template="simple_white",
         # Decrease height of chart to align with the stats card column
-        height=405,
+        height=520,
     )
     # Make line color 'primary' blue consistent with navbar
     fig_line_per_country.update_traces(line_color="#007bff")
 
     # Get y value for covid-19 year 2020
-    value_2020_covid = df_arrivals_transposed.loc[25, f"{country_name}"]
+    value_2020_covid = arrivals_per_year[25]
 
     # If there is 2020 data, add annotation to inform user
     if not math.isnan(value_2020_covid):
@@ -275,18 +1141,20 @@ def create_line_per_country(country_name):
     return fig_line_per_country
 
 
-def create_line_chart_compare_countries(country_name_1, country_name_2):
+@cached_figure
+def create_line_chart_compare_countries(country_name_1, country_name_2, store=None):
     """
     Create 2 line plots on same chart for 2 given country names.
 
     Args:
         country_name_1: Callback output of first selected country name as a string
         country_name_2: Callback output of second selected country name as a string
+        store: Dataset version to use, defaults to the current data store
     Returns:
         fig_line_chart_compare_countries: Plotly go line chart figure with 2 lines for each selected country
     """
-    # Drop unwanted columns, transpose dataframe using helper function
-    df_arrivals_transposed = helper.transpose_df_arrivals_prepared()
+    if store is None:
+        store = ds.get_data_store()
 
     # Define two countries to plot given as parameters
     countries = [f"{country_name_1}", f"{country_name_2}"]
@@ -294,8 +1162,9 @@ def create_line_chart_compare_countries(country_name_1, country_name_2):
     # Create a trace for each country
     traces = [
         go.Scatter(
-            x=df_arrivals_transposed["index"],
-            y=df_arrivals_transposed[country],
+            x=store.year_columns,
+            # Send compact values
+            y=compact_array(store.country_arrivals(country)),
             mode="lines",
             name=country,
         )
@@ -316,3 +1185,62 @@ def create_line_chart_compare_countries(country_name_1, country_name_2):
     fig_line_chart_compare_countries = go.Figure(data=traces, layout=layout)
 
     return fig_line_chart_compare_countries
+
+
+# Axis titles of the measures of the aggregate cube
+GROUP_MEASURE_LABELS = {
+    ac.SUM: "Total arrivals",
+    ac.MEAN: "Average arrivals per country",
+    ac.COUNT: "Countries with data",
+}
+
+
+@cached_figure
+def create_group_line_chart(group_by, measure, region_name, store=None):
+    """
+    Create a line chart with a line per region or per income group, of the
+    total or average tourist arrivals of their countries in each year.
+
+    Args:
+        group_by: Callback output of "region" or "income_group"
+        measure: Callback output of "sum", "mean" or "count"
+        region_name: For income groups, region name to slice by, or "All regions"
+        store: Dataset version to use, defaults to the current data store
+    Returns:
+        fig_group_line_chart: Plotly go line chart figure with a line per group
+    """
+    if store is None:
+        store = ds.get_data_store()
+
+    # Every group and year is read from the precomputed aggregate cube
+    cube = ac.get_aggregate_cube(store)
+    group_names, values = cube.group(group_by, measure, region_name)
+    _, country_counts = cube.group(group_by, ac.COUNT, region_name)
+
+    # Create a trace for each group, regions always have countries so their
+    # trace numbers match the region order of the cube
+    traces = [
+        go.Scatter(
+            x=store.year_columns,
+            # Send compact values
+            y=compact_array(values[group_index]),
+            mode="lines+markers",
+            name=group_name,
+        )
+        for group_index, group_name in enumerate(group_names)
+        # Skip income groups with no countries in the region
+        if country_counts[group_index].any()
+    ]
+
+    layout = go.Layout(
+        xaxis_title="Year",
+        yaxis_title=GROUP_MEASURE_LABELS[measure],
+        template="simple_white",
+        height=450,
+        # Show the values of every group for the year under the mouse
+        hovermode="x unified",
+    )
+
+    fig_group_line_chart = go.Figure(data=traces, layout=layout)
+
+    return fig_group_line_chart
@@ -0,0 +1,775 @@
+"""
+Shared in-memory data store for the prepared tourism arrivals dataset.
+
+The dataset is loaded once per process by memory-mapping the binary snapshot
+of the CSV file, and every chart builder and callback reads from the same
+store, instead of each module parsing its own copy of the CSV file.
+
+Each store is an immutable version of the dataset. When the CSV file changes,
+a new store is loaded and validated in the background and then swapped in
+atomically, so callbacks that already hold the old store finish with it.
+
+The group and rank index arrays are saved in the snapshot folder the first
+time a dataset version is loaded and memory-mapped by every process after
+that, so worker processes share one copy of them, like the year matrix.
+"""
+import itertools
+import json
+import logging
+import os
+import threading
+import numpy as np
+import pandas as pd
+import helper_functions as helper
+
+
+logger = logging.getLogger(__name__)
+
+
+# Names of the precomputed statistic columns in the prepared dataset
+STAT_COLUMNS = [
+    "10-year Average in tourist arrivals",
+    "Max number of arrivals",
+    "Minimum number of arrivals",
+    "Percent drop 2019 to 2020",
+]
+
+# Columns describing each country, rather than holding numeric arrivals data
+INFO_COLUMNS = [
+    "Country Name",
+    "Region",
+    "IncomeGroup",
+    "Country Code",
+    "Indicator Name",
+]
+
+# Value used by the region dropdown to select every country
+ALL_REGIONS = "All regions"
+
+
+# Number of the index file layout, increased when the saved indexes change
+INDEXES_FORMAT = 1
+
+# Empty positions returned for a region or income group not in the dataset
+_NO_POSITIONS = np.array([], dtype=np.intp)
+_NO_POSITIONS.flags.writeable = False
+
+
+def _group_positions(column):
+    """
+    Build a group index of each value in a column to its row positions.
+
+    Args:
+        column: Pandas series, e.g. the Region column
+    Returns:
+        Dictionary of value to read-only NumPy array of row positions,
+        missing values are left out
+    """
+    group_positions = {}
+    for value, positions in column.groupby(column, sort=True).indices.items():
+        positions.flags.writeable = False
+        group_positions[value] = positions
+    return group_positions
+
+
+def _rank_order(values):
+    """
+    Build the rank order of an array, largest value first.
+
+    Args:
+        values: NumPy float array which may contain NaN for missing values
+    Returns:
+        rank_order: Read-only positions of the values that are not missing,
+            sorted largest first with ties kept in dataset order
+        missing_positions: Read-only positions of the missing values
+    """
+    missing = np.isnan(values)
+    valid_positions = np.flatnonzero(~missing)
+    rank_order = valid_positions[np.argsort(-values[valid_positions], kind="stable")]
+    missing_positions = np.flatnonzero(missing)
+    rank_order.flags.writeable = False
+    missing_positions.flags.writeable = False
+    return rank_order, missing_positions
+
+
+def _rankable_values(df_arrivals_prepared, year_matrix, year_columns):
+    """
+    Get the float values of each year and statistic column to be ranked.
+    """
+    rankable_values = {
+        column: year_matrix[row] for row, column in enumerate(year_columns)
+    }
+    for stat_name in STAT_COLUMNS:
+        stat_column = df_arrivals_prepared[stat_name]
+        # Percent drop is stored as text such as "-58.51%"
+        if not pd.api.types.is_float_dtype(stat_column):
+            stat_column = pd.to_numeric(stat_column.str.rstrip("%"))
+        rankable_values[stat_name] = stat_column.to_numpy(dtype=np.float64)
+    return rankable_values
+
+
+def build_indexes(df_arrivals_prepared, year_matrix, year_columns):
+    """
+    Build the group and rank indexes of a dataset version.
+
+    Args:
+        df_arrivals_prepared: Prepared tourism arrivals pandas dataframe
+        year_matrix: Float64 matrix of arrivals with shape (years, countries)
+        year_columns: List of year column names for the rows of year_matrix
+    Returns:
+        Dictionary of read-only NumPy arrays of row positions, with the keys
+        region_positions and income_group_positions of each group name, and
+        rank_orders, missing_positions, ranks and region_rank_orders of each
+        year and statistic column, the last also by region name
+    """
+    # Group indexes of the row positions of each region and income group
+    region_positions = _group_positions(df_arrivals_prepared["Region"])
+    indexes = {
+        "region_positions": region_positions,
+        "income_group_positions": _group_positions(df_arrivals_prepared["IncomeGroup"]),
+        "rank_orders": {},
+        "missing_positions": {},
+        "ranks": {},
+        "region_rank_orders": {},
+    }
+
+    # Rank indexes of every year and statistic, sorted largest first
+    for column, values in _rankable_values(
+        df_arrivals_prepared, year_matrix, year_columns
+    ).items():
+        rank_order, missing_positions = _rank_order(values)
+        indexes["rank_orders"][column] = rank_order
+        indexes["missing_positions"][column] = missing_positions
+        # Rank of each row, starting at 1, or 0 if the value is missing
+        ranks = np.zeros(len(values), dtype=np.intp)
+        ranks[rank_order] = np.arange(1, len(rank_order) + 1)
+        ranks.flags.writeable = False
+        indexes["ranks"][column] = ranks
+        # Partition the rank order by region, keeping the sorted order
+        indexes["region_rank_orders"][column] = {}
+        for region_name, positions in region_positions.items():
+            region_rank_order = rank_order[np.isin(rank_order, positions)]
+            region_rank_order.flags.writeable = False
+            indexes["region_rank_orders"][column][region_name] = region_rank_order
+    return indexes
+
+
+def _flatten_indexes(indexes, arrays, offset):
+    """
+    Collect nested index arrays into a list, recording where each one starts.
+
+    Args:
+        indexes: Dictionary of NumPy arrays or further dictionaries
+        arrays: List the arrays are appended to, in order
+        offset: Position in the joined arrays where the first array starts
+    Returns:
+        table: Dictionary with the same keys and [offset, length] values
+        offset: Position in the joined arrays after the last array
+    """
+    table = {}
+    for key, value in indexes.items():
+        if isinstance(value, dict):
+            table[key], offset = _flatten_indexes(value, arrays, offset)
+        else:
+            arrays.append(value)
+            table[key] = [offset, len(value)]
+            offset += len(value)
+    return table, offset
+
+
+def _unflatten_indexes(table, joined_array):
+    """
+    Get the nested index arrays back as views of the joined array.
+    """
+    return {
+        key: (
+            _unflatten_indexes(value, joined_array)
+            if isinstance(value, dict)
+            else joined_array[value[0] : value[0] + value[1]]
+        )
+        for key, value in table.items()
+    }
+
+
+def save_indexes(indexes, snapshot_dirpath):
+    """
+    Save the indexes of a dataset version into its snapshot folder.
+
+    All arrays are joined into one .npy file with a JSON table of where each
+    array starts. Both files are replaced atomically and the table is written
+    last, so processes loading at the same time see complete files.
+
+    Args:
+        indexes: Dictionary of index arrays returned by build_indexes
+        snapshot_dirpath: Snapshot folder of the dataset version
+    Returns:
+        None
+    """
+    arrays = []
+    table, _ = _flatten_indexes(indexes, arrays, 0)
+    joined_array = np.concatenate(arrays).astype(np.intp, copy=False)
+
+    temp_suffix = f"-{os.getpid()}-{threading.get_ident()}"
+    temp_array_filepath = snapshot_dirpath.joinpath(f".indexes{temp_suffix}.npy")
+    temp_table_filepath = snapshot_dirpath.joinpath(f".indexes{temp_suffix}.json")
+    np.save(temp_array_filepath, joined_array)
+    os.replace(temp_array_filepath, snapshot_dirpath.joinpath("indexes.npy"))
+    with open(temp_table_filepath, "w") as file:
+        json.dump({"format": INDEXES_FORMAT, "indexes": table}, file)
+    os.replace(temp_table_filepath, snapshot_dirpath.joinpath("indexes.json"))
+
+
+def load_indexes(snapshot_dirpath):
+    """
+    Load the indexes saved with a dataset version by memory-mapping them.
+
+    Args:
+        snapshot_dirpath: Snapshot folder of the dataset version
+    Returns:
+        Dictionary of read-only index arrays, as returned by build_indexes,
+        or None if the indexes have not been saved in the current format
+    """
+    try:
+        with open(snapshot_dirpath.joinpath("indexes.json")) as file:
+            table = json.load(file)
+        joined_array = np.load(snapshot_dirpath.joinpath("indexes.npy"), mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    if table.get("format") != INDEXES_FORMAT or joined_array.dtype != np.intp:
+        return None
+    return _unflatten_indexes(table["indexes"], joined_array)
+
+
+class TourismDataStore:
+    """
+    Read-only store of the prepared tourism arrivals dataframe with typed
+    accessors by country, region, year and statistic.
+
+    The dataframe given to the store must not be modified after it is created,
+    as it is shared between all chart builders and callbacks.
+    """
+
+    def __init__(
+        self,
+        df_arrivals_prepared,
+        year_matrix=None,
+        version=0,
+        source_sha256=None,
+        indexes=None,
+    ):
+        """
+        Args:
+            df_arrivals_prepared: Prepared tourism arrivals pandas dataframe
+            year_matrix: Optional float64 matrix of arrivals with shape
+                (years, countries) to use instead of building one, e.g. a
+                memory-mapped view from the binary snapshot
+            version: Number of this dataset version, used to key derived caches
+            source_sha256: Hash of the CSV file the dataset was loaded from
+            indexes: Optional index arrays of this dataframe to use instead
+                of building them, e.g. memory-mapped by load_indexes
+        """
+        self._df = df_arrivals_prepared
+        self._version = version
+        self._source_sha256 = source_sha256
+        # Year columns are the columns left after the info and stats columns
+        self._year_columns = [
+            column
+            for column in df_arrivals_prepared.columns
+            if column not in INFO_COLUMNS and column not in STAT_COLUMNS
+        ]
+
+        # Precompute contiguous float64 matrix with a row per year and a column
+        # per country, built once per store so it only changes with the data
+        if year_matrix is None:
+            year_matrix = np.ascontiguousarray(
+                df_arrivals_prepared[self._year_columns].to_numpy(dtype=np.float64).T
+            )
+        self._year_matrix = year_matrix.view()
+        self._year_matrix.flags.writeable = False
+        # Hash index of each country name to its row in the dataframe, which is
+        # also its column in the year matrix
+        self._country_positions = {
+            country_name: position
+            for position, country_name in enumerate(
+                df_arrivals_prepared["Country Name"]
+            )
+        }
+        self._all_positions = np.arange(len(df_arrivals_prepared))
+        self._all_positions.flags.writeable = False
+
+        if indexes is None:
+            indexes = build_indexes(
+                df_arrivals_prepared, self._year_matrix, self._year_columns
+            )
+        # Group indexes of the row positions of each region and income group
+        self._region_positions = indexes["region_positions"]
+        self._income_group_positions = indexes["income_group_positions"]
+        # Rank indexes of every year and statistic, sorted largest first
+        self._rank_orders = indexes["rank_orders"]
+        self._missing_positions = indexes["missing_positions"]
+        self._ranks = indexes["ranks"]
+        self._region_rank_orders = {
+            (column, region_name): region_rank_order
+            for column, region_rank_orders in indexes["region_rank_orders"].items()
+            for region_name, region_rank_order in region_rank_orders.items()
+        }
+
+    @property
+    def version(self):
+        """Version number of the dataset, increasing with every reload."""
+        return self._version
+
+    @property
+    def source_sha256(self):
+        """SHA-256 hash of the CSV file the dataset was loaded from."""
+        return self._source_sha256
+
+    @property
+    def dataframe(self):
+        """Full prepared dataframe, shared so must be treated as read-only."""
+        return self._df
+
+    @property
+    def years(self):
+        """List of years with data as integers, e.g. 1995 to 2020."""
+        return [int(year) for year in self._year_columns]
+
+    @property
+    def year_columns(self):
+        """List of year column names as strings, in order."""
+        return list(self._year_columns)
+
+    @property
+    def country_names(self):
+        """List of country names in dataset order."""
+        return self._df["Country Name"].tolist()
+
+    @property
+    def region_names(self):
+        """Sorted list of region names in the dataset."""
+        return sorted(self._df["Region"].dropna().unique().tolist())
+
+    @property
+    def income_group_names(self):
+        """Sorted list of income group names in the dataset."""
+        return sorted(self._income_group_positions)
+
+    @property
+    def year_matrix(self):
+        """Read-only NumPy matrix of arrivals with shape (years, countries)."""
+        return self._year_matrix
+
+    def country_arrivals(self, country_name):
+        """
+        Get the number of arrivals for a country in every year.
+
+        Args:
+            country_name: Country name as a string
+        Returns:
+            Read-only NumPy array of arrivals in year order
+        """
+        return self._year_matrix[:, self._country_positions[country_name]]
+
+    def country_position(self, country_name):
+        """
+        Look up the row position of a country using the country hash index.
+
+        Args:
+            country_name: Country name as a string
+        Returns:
+            Integer row position in the dataframe and year matrix column
+        Raises:
+            KeyError: If the country is not in the dataset
+        """
+        return self._country_positions[country_name]
+
+    def region_positions(self, region_name):
+        """
+        Look up the row positions of every country in a region.
+
+        Args:
+            region_name: Region name as a string, or "All regions"
+        Returns:
+            Read-only NumPy array of row positions in dataset order, empty if
+            the region is not in the dataset
+        """
+        if region_name == ALL_REGIONS:
+            return self._all_positions
+        return self._region_positions.get(region_name, _NO_POSITIONS)
+
+    def income_group_positions(self, income_group):
+        """
+        Look up the row positions of every country in an income group.
+
+        Args:
+            income_group: Income group name as a string, e.g. "High income"
+        Returns:
+            Read-only NumPy array of row positions in dataset order, empty if
+            the income group is not in the dataset
+        """
+        return self._income_group_positions.get(income_group, _NO_POSITIONS)
+
+    def rows(self, positions):
+        """
+        Get the rows at the given positions, e.g. from the group indexes.
+
+        Args:
+            positions: Array of row positions
+        Returns:
+            Pandas dataframe with the rows in the given order
+        """
+        return self._df.iloc[positions]
+
+    def region(self, region_name):
+        """
+        Get the rows of all countries in a region.
+
+        Args:
+            region_name: Region name as a string, or "All regions"
+        Returns:
+            Pandas dataframe of the countries in the region
+        """
+        if region_name == ALL_REGIONS:
+            return self._df
+        return self.rows(self.region_positions(region_name))
+
+    def income_group(self, income_group):
+        """
+        Get the rows of all countries in an income group.
+
+        Args:
+            income_group: Income group name as a string, e.g. "High income"
+        Returns:
+            Pandas dataframe of the countries in the income group
+        """
+        return self.rows(self.income_group_positions(income_group))
+
+    def country(self, country_name):
+        """
+        Get the row of a single country.
+
+        Args:
+            country_name: Country name as a string
+        Returns:
+            Pandas series with every column for the country
+        """
+        return self._df.iloc[self._country_positions[country_name]]
+
+    def year(self, year_selected):
+        """
+        Get the number of arrivals for every country in a year.
+
+        Args:
+            year_selected: Year as a number or string between 1995 and 2020
+        Returns:
+            Pandas series of arrivals in dataset order
+        """
+        return self._df[str(year_selected)]
+
+    def stat(self, country_name, stat_name):
+        """
+        Get one precomputed statistic for a country.
+
+        Args:
+            country_name: Country name as a string
+            stat_name: One of the names in STAT_COLUMNS
+        Returns:
+            Value of the statistic for the country
+        """
+        if stat_name not in STAT_COLUMNS:
+            raise KeyError(f"Unknown statistic: {stat_name}")
+        return self._df[stat_name].iat[self._country_positions[country_name]]
+
+    def ranked_positions(self, column, region_name=ALL_REGIONS, ascending=False):
+        """
+        Get row positions sorted by a year or statistic using the rank index.
+
+        Countries with missing values are placed last, like pandas sort_values.
+
+        Args:
+            column: Year column name, e.g. "2019", or a name in STAT_COLUMNS
+            region_name: Only include countries in this region, or "All regions"
+            ascending: Sort smallest first instead of largest first
+        Returns:
+            NumPy array of row positions in sorted order
+        """
+        column = str(column)
+        if region_name == ALL_REGIONS:
+            rank_order = self._rank_orders[column]
+            missing_positions = self._missing_positions[column]
+        else:
+            rank_order = self._region_rank_orders.get(
+                (column, region_name), _NO_POSITIONS
+            )
+            missing_positions = np.intersect1d(
+                self._missing_positions[column],
+                self.region_positions(region_name),
+            )
+        if ascending:
+            rank_order = rank_order[::-1]
+        return np.concatenate([rank_order, missing_positions])
+
+    def top_n(self, column, n, region_name=ALL_REGIONS):
+        """
+        Get the row positions of the n countries with the largest values.
+
+        Args:
+            column: Year column name, e.g. "2019", or a name in STAT_COLUMNS
+            n: Number of countries
+            region_name: Only include countries in this region, or "All regions"
+        Returns:
+            NumPy array of at most n row positions, largest value first
+        """
+        return self.ranked_positions(column, region_name)[:n]
+
+    def rank(self, country_name, column, region_name=ALL_REGIONS):
+        """
+        Get the rank of a country for a year or statistic, e.g. what rank
+        Albania was in 2012, where rank 1 has the most arrivals.
+
+        Args:
+            country_name: Country name as a string
+            column: Year column name, e.g. "2012", or a name in STAT_COLUMNS
+            region_name: Rank only within this region, or "All regions"
+        Returns:
+            Rank as an integer starting at 1, or None if the value is missing
+            or the country is not in the region
+        """
+        column = str(column)
+        position = self._country_positions[country_name]
+        if region_name == ALL_REGIONS:
+            rank = int(self._ranks[column][position])
+            return rank if rank else None
+        region_rank_order = self._region_rank_orders.get(
+            (column, region_name), _NO_POSITIONS
+        )
+        matches = np.flatnonzero(region_rank_order == position)
+        return int(matches[0]) + 1 if len(matches) else None
+
+    def columns(self, column_names):
+        """
+        Get a subset of columns for every country.
+
+        Args:
+            column_names: List of column names
+        Returns:
+            Pandas dataframe with only the given columns
+        """
+        return self._df[column_names]
+
+
+# Single store shared by the whole process, created on first use
+_data_store = None
+_data_store_lock = threading.Lock()
+# Counter giving each loaded dataset version a new number
+_version_counter = itertools.count(1)
+
+
+def validate_dataframe(df_arrivals_prepared):
+    """
+    Check a newly loaded dataframe has the structure the charts expect.
+
+    Args:
+        df_arrivals_prepared: Prepared tourism arrivals pandas dataframe
+    Returns:
+        None
+    Raises:
+        ValueError: If a column is missing or the data is not usable
+    """
+    missing_columns = [
+        column
+        for column in INFO_COLUMNS + STAT_COLUMNS
+        if column not in df_arrivals_prepared.columns
+    ]
+    if missing_columns:
+        raise ValueError(f"Dataset is missing columns: {missing_columns}")
+    if df_arrivals_prepared.empty:
+        raise ValueError("Dataset has no countries")
+
+    country_names = df_arrivals_prepared["Country Name"]
+    if country_names.isna().any() or not country_names.is_unique:
+        raise ValueError("Country names must be present and unique")
+
+    year_columns = [
+        column
+        for column in df_arrivals_prepared.columns
+        if column not in INFO_COLUMNS and column not in STAT_COLUMNS
+    ]
+    if not year_columns or not all(column.isdigit() for column in year_columns):
+        raise ValueError(f"Dataset has invalid year columns: {year_columns}")
+    # Whole number year columns are valid too, the loader converts them
+    for column in year_columns:
+        column_dtype = df_arrivals_prepared[column].dtype
+        is_number = pd.api.types.is_numeric_dtype(column_dtype)
+        if not is_number or pd.api.types.is_bool_dtype(column_dtype):
+            raise ValueError(f"Year column {column} is not numeric")
+
+
+def load_data_store():
+    """
+    Create a new tourism data store from the memory-mapped dataset snapshot.
+
+    The indexes are memory-mapped from the snapshot folder too, or built and
+    saved there if this is the first process to load this dataset version.
+
+    Args:
+        None
+    Returns:
+        TourismDataStore using the snapshot memory for its year matrix and
+        indexes
+    Raises:
+        ValueError: If the dataset fails validation
+    """
+    (
+        df_arrivals_prepared,
+        numeric_matrix,
+        numeric_columns,
+        manifest,
+    ) = helper.load_snapshot()
+    validate_dataframe(df_arrivals_prepared)
+
+    # Year columns are saved first in the snapshot, so they form a zero-copy
+    # slice of the memory-mapped matrix
+    year_columns = [
+        column
+        for column in df_arrivals_prepared.columns
+        if column not in INFO_COLUMNS and column not in STAT_COLUMNS
+    ]
+    # Convert any whole number year columns, e.g. from a snapshot written
+    # before they were saved in the matrix, float columns are kept as they
+    # are so they stay views of the memory-mapped matrix made by load_snapshot
+    integer_year_columns = {
+        column: np.float64
+        for column in year_columns
+        if df_arrivals_prepared[column].dtype != np.float64
+    }
+    if integer_year_columns:
+        df_arrivals_prepared = df_arrivals_prepared.astype(integer_year_columns)
+    if numeric_columns[: len(year_columns)] == year_columns:
+        year_matrix = numeric_matrix[: len(year_columns)]
+    else:
+        year_matrix = np.ascontiguousarray(
+            df_arrivals_prepared[year_columns].to_numpy(dtype=np.float64).T
+        )
+
+    snapshot_dirpath = helper.SNAPSHOT_DIRPATH.joinpath(manifest["snapshot"])
+    indexes = load_indexes(snapshot_dirpath)
+    if indexes is None:
+        indexes = build_indexes(df_arrivals_prepared, year_matrix, year_columns)
+        try:
+            save_indexes(indexes, snapshot_dirpath)
+        except OSError:
+            # Snapshot folder was replaced by a newer dataset meanwhile
+            logger.warning("Could not save dataset indexes to %s", snapshot_dirpath)
+        else:
+            # Use the saved copy, shared with the other processes
+            indexes = load_indexes(snapshot_dirpath) or indexes
+
+    return TourismDataStore(
+        df_arrivals_prepared,
+        year_matrix,
+        version=next(_version_counter),
+        source_sha256=manifest["csv_sha256"],
+        indexes=indexes,
+    )
+
+
+def get_data_store():
+    """
+    Get the process-wide tourism data store, loading the dataset on first use.
+
+    Callbacks should call this once and use the returned store throughout, so
+    a reload part way through a callback does not mix two dataset versions.
+
+    Args:
+        None
+    Returns:
+        TourismDataStore shared by every module in the app
+    """
+    global _data_store
+    if _data_store is None:
+        # Lock so that two threads starting together only load the data once
+        with _data_store_lock:
+            if _data_store is None:
+                _data_store = load_data_store()
+    return _data_store
+
+
+def reload_data_store(force=False):
+    """
+    Load the dataset again and swap it in if the CSV file contents changed.
+
+    The new store is fully loaded and validated before it replaces the old
+    one, so if the new file is invalid the current store stays in use.
+
+    Args:
+        force: Swap in a new version even if the CSV contents are unchanged
+    Returns:
+        TourismDataStore that is current after the reload
+    Raises:
+        ValueError: If the new dataset fails validation
+        OSError: If the CSV file is missing or cannot be read
+    """
+    global _data_store
+    # Only one reload at a time, readers never wait for this lock
+    with _data_store_lock:
+        current_store = _data_store
+        if (
+            not force
+            and current_store is not None
+            and helper.ensure_snapshot()["csv_sha256"] == current_store.source_sha256
+        ):
+            return current_store
+        new_store = load_data_store()
+        # Assigning the module global is atomic, so readers see old or new
+        _data_store = new_store
+    logger.info("Loaded tourism dataset version %s", new_store.version)
+    return new_store
+
+
+def _file_stat(csv_filepath):
+    """
+    Get the modified time and size of a file, or None if it does not exist.
+    """
+    try:
+        csv_stat = os.stat(csv_filepath)
+    except OSError:
+        return None
+    return csv_stat.st_mtime_ns, csv_stat.st_size
+
+
+def _watch_data_file(csv_filepath, interval_seconds, stop_event):
+    """
+    Poll the CSV file and reload the data store when it changes.
+    """
+    last_stat = _file_stat(csv_filepath)
+    while not stop_event.wait(interval_seconds):
+        current_stat = _file_stat(csv_filepath)
+        # File may be missing briefly while it is being replaced
+        if current_stat is not None and current_stat != last_stat:
+            try:
+                reload_data_store()
+            except Exception:
+                logger.exception("Keeping current tourism dataset version")
+        last_stat = current_stat
+
+
+def start_data_watcher(csv_filepath=helper.TOURISM_DATA_FILEPATH, interval_seconds=5.0):
+    """
+    Start a background thread that reloads the dataset when the CSV changes.
+
+    Args:
+        csv_filepath: Path of the prepared tourism arrivals CSV file to watch
+        interval_seconds: Number of seconds between checks of the file
+    Returns:
+        stop_event: threading.Event that stops the watcher when set
+    """
+    stop_event = threading.Event()
+    watcher_thread = threading.Thread(
+        target=_watch_data_file,
+        args=(csv_filepath, interval_seconds, stop_event),
+        name="tourism-data-watcher",
+        daemon=True,
+    )
+    watcher_thread.start()
+    return stop_event
@@ -0,0 +1,526 @@
+"""
+Derived metrics of every country, computed from the year by country matrix.
+
+The prepared dataset only carries a few precomputed statistics, so growth and
+trend metrics are computed here for all countries at once with NumPy array
+operations over the year matrix, rather than with pandas per callback. The
+metrics of a dataset version are computed once, the first time they are used,
+and then read by position, so the stats card and chart builders can look up
+any metric of a country without more work.
+
+Any range of years can also be summarised per country, e.g. the total or
+lowest arrivals over the pre-COVID decade. Sums and means are read from
+running totals of each country that also count the missing years, and minimums
+and maximums from tables of the minimum and maximum of every run of 2, 4, 8...
+years, so a range takes the same time whatever its length.
+
+Growth metrics are fractions, e.g. 0.05 for 5% growth. Missing values, and
+growth from a year with no arrivals, are NaN.
+"""
+from collections import OrderedDict
+import threading
+import numpy as np
+import pandas as pd
+import data_store as ds
+
+# First year affected by Covid-19, the pre-COVID metrics use the years before it
+COVID_YEAR = 2020
+
+# Number of years before COVID_YEAR used by the default CAGR and volatility
+TREND_YEARS = 10
+
+# Names of the per-country metric columns
+CAGR = "CAGR"
+VOLATILITY = "Volatility"
+LATEST_YOY_GROWTH = "Latest YoY growth"
+PRE_COVID_PEAK = "Pre-COVID peak"
+PRE_COVID_PEAK_YEAR = "Pre-COVID peak year"
+RECOVERY_RATIO = "Recovery ratio"
+METRIC_COLUMNS = [
+    CAGR,
+    VOLATILITY,
+    LATEST_YOY_GROWTH,
+    PRE_COVID_PEAK,
+    PRE_COVID_PEAK_YEAR,
+    RECOVERY_RATIO,
+]
+
+# Ways a range of years is summarised per country, growth is from the first
+# to the last year of the range
+WINDOW_SUM = "sum"
+WINDOW_MEAN = "mean"
+WINDOW_MIN = "min"
+WINDOW_MAX = "max"
+WINDOW_GROWTH = "growth"
+WINDOW_AGGREGATES = [WINDOW_SUM, WINDOW_MEAN, WINDOW_MIN, WINDOW_MAX, WINDOW_GROWTH]
+
+
+def _read_only(values):
+    """Mark a NumPy array as read-only, as the metrics are shared, and return it."""
+    values.flags.writeable = False
+    return values
+
+
+def yoy_growth(year_matrix):
+    """
+    Calculate the growth of every country from each year to the next.
+
+    Args:
+        year_matrix: Float matrix of arrivals with shape (years, countries)
+    Returns:
+        Float matrix of the same shape, the first year being NaN
+    """
+    previous_years = year_matrix[:-1]
+    growth = np.full(year_matrix.shape, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth[1:] = np.where(
+            previous_years > 0, year_matrix[1:] / previous_years - 1, np.nan
+        )
+    return growth
+
+
+def cagr(first_year_values, last_year_values, year_count):
+    """
+    Calculate the compound annual growth rate between two years of every country.
+
+    Args:
+        first_year_values: Float array of arrivals in the first year
+        last_year_values: Float array of arrivals in the last year
+        year_count: Number of years from the first to the last year
+    Returns:
+        Float array of the growth rate per year
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(
+            (first_year_values > 0) & (last_year_values >= 0) & (year_count > 0),
+            (last_year_values / first_year_values) ** (1 / max(year_count, 1)) - 1,
+            np.nan,
+        )
+
+
+def prefix_sums(year_matrix):
+    """
+    Calculate the running totals and missing year counts of every country.
+
+    Both have a first row of zeros, so the total of the rows first to last is
+    totals[last + 1] - totals[first], and likewise for the missing counts.
+
+    Args:
+        year_matrix: Float matrix of arrivals with shape (years, countries)
+    Returns:
+        totals: Float matrix with shape (years + 1, countries), missing
+            values counted as 0
+        missing_counts: Integer matrix of the same shape
+    """
+    missing = np.isnan(year_matrix)
+    totals = np.zeros((year_matrix.shape[0] + 1, year_matrix.shape[1]))
+    np.cumsum(np.where(missing, 0.0, year_matrix), axis=0, out=totals[1:])
+    missing_counts = np.zeros(totals.shape, dtype=np.intp)
+    np.cumsum(missing, axis=0, out=missing_counts[1:])
+    return totals, missing_counts
+
+
+def sparse_table(year_matrix, combine):
+    """
+    Build tables of the minimum or maximum of every run of 1, 2, 4, 8... years,
+    so the minimum or maximum of any range is found from 2 overlapping runs.
+
+    Args:
+        year_matrix: Float matrix of arrivals with shape (years, countries)
+        combine: np.fmin or np.fmax, which ignore missing values
+    Returns:
+        List of float matrices, the one at index k with the value of the run
+        of 2 ** k years starting at each row
+    """
+    table = [year_matrix]
+    run_length = 1
+    while run_length * 2 <= year_matrix.shape[0]:
+        previous_runs = table[-1]
+        table.append(combine(previous_runs[:-run_length], previous_runs[run_length:]))
+        run_length *= 2
+    return table
+
+
+def rolling_average(year_matrix, window):
+    """
+    Calculate the trailing average over a number of years of every country.
+
+    Like the pandas rolling mean, the average is NaN unless every year of the
+    window has a value.
+
+    Args:
+        year_matrix: Float matrix of arrivals with shape (years, countries)
+        window: Number of years averaged, including the current year
+    Returns:
+        Float matrix of the same shape, the first window - 1 years being NaN
+    """
+    # Each window is a difference of running totals
+    totals, missing_counts = prefix_sums(year_matrix)
+    averages = np.full(year_matrix.shape, np.nan)
+    window_totals = totals[window:] - totals[:-window]
+    window_missing = missing_counts[window:] - missing_counts[:-window]
+    averages[window - 1 :] = np.where(
+        window_missing == 0, window_totals / window, np.nan
+    )
+    return averages
+
+
+class DerivedMetrics:
+    """
+    Derived metrics of every country in one dataset version.
+
+    Metrics with a year window are computed for each window the first time it
+    is asked for and then kept, like the default metric columns.
+    """
+
+    def __init__(self, store):
+        """
+        Args:
+            store: TourismDataStore of the dataset version
+        """
+        self._store = store
+        self._years = np.array(store.years)
+        year_matrix = store.year_matrix
+        self._yoy_growth = _read_only(yoy_growth(year_matrix))
+        self._window_metrics = {}
+        self._lock = threading.Lock()
+
+        # Running totals and range tables to summarise any range of years
+        self._totals, self._missing_counts = (
+            _read_only(values) for values in prefix_sums(year_matrix)
+        )
+        self._min_table = [
+            _read_only(values) for values in sparse_table(year_matrix, np.fmin)
+        ]
+        self._max_table = [
+            _read_only(values) for values in sparse_table(year_matrix, np.fmax)
+        ]
+
+        # Default trend window, the TREND_YEARS years before COVID_YEAR, or the
+        # latest years if the dataset has no year before COVID_YEAR
+        pre_covid_years = self._years[self._years < COVID_YEAR]
+        trend_years = pre_covid_years if len(pre_covid_years) else self._years
+        self.trend_last_year = int(trend_years[-1])
+        self.trend_first_year = int(trend_years[max(len(trend_years) - TREND_YEARS, 0)])
+
+        # Peak before COVID_YEAR, ignoring missing years, NaN for every country
+        # if there is no year before COVID_YEAR
+        country_count = year_matrix.shape[1]
+        pre_covid_peak = np.full(country_count, np.nan)
+        pre_covid_peak_year = np.full(country_count, np.nan)
+        if len(pre_covid_years):
+            pre_covid_matrix = year_matrix[: len(pre_covid_years)]
+            has_pre_covid_value = ~np.isnan(pre_covid_matrix).all(axis=0)
+            peak_rows = np.argmax(np.nan_to_num(pre_covid_matrix, nan=-np.inf), axis=0)
+            pre_covid_peak = np.where(
+                has_pre_covid_value,
+                pre_covid_matrix[peak_rows, np.arange(country_count)],
+                np.nan,
+            )
+            pre_covid_peak_year = np.where(
+                has_pre_covid_value, self._years[peak_rows], np.nan
+            )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            recovery_ratio = np.where(
+                pre_covid_peak > 0, year_matrix[-1] / pre_covid_peak, np.nan
+            )
+
+        self._columns = {
+            CAGR: self.cagr(self.trend_first_year, self.trend_last_year),
+            VOLATILITY: self.volatility(self.trend_first_year, self.trend_last_year),
+            LATEST_YOY_GROWTH: self._yoy_growth[-1],
+            PRE_COVID_PEAK: _read_only(pre_covid_peak),
+            PRE_COVID_PEAK_YEAR: _read_only(pre_covid_peak_year),
+            RECOVERY_RATIO: _read_only(recovery_ratio),
+        }
+
+    def _year_row(self, year):
+        """
+        Get the row of a year in the year matrix.
+
+        Args:
+            year: Year as an integer or string
+        Returns:
+            Integer row position
+        Raises:
+            KeyError: If the year is not in the dataset
+        """
+        rows = np.flatnonzero(self._years == int(year))
+        if not len(rows):
+            raise KeyError(f"Year {year} is not in the dataset")
+        return int(rows[0])
+
+    def _window_metric(self, key, compute):
+        """
+        Get a metric of a year window, computing it the first time.
+        """
+        values = self._window_metrics.get(key)
+        if values is None:
+            values = _read_only(compute())
+            with self._lock:
+                values = self._window_metrics.setdefault(key, values)
+        return values
+
+    @property
+    def yoy_growth(self):
+        """Read-only matrix of the growth from the previous year, shaped like the year matrix."""
+        return self._yoy_growth
+
+    def cagr(self, first_year, last_year):
+        """
+        Get the compound annual growth rate of every country between two years.
+
+        Args:
+            first_year: First year of the window
+            last_year: Last year of the window
+        Returns:
+            Read-only float array in dataset order
+        """
+        first_row = self._year_row(first_year)
+        last_row = self._year_row(last_year)
+        return self._window_metric(
+            ("cagr", first_row, last_row),
+            lambda: cagr(
+                self._store.year_matrix[first_row],
+                self._store.year_matrix[last_row],
+                int(last_year) - int(first_year),
+            ),
+        )
+
+    def volatility(self, first_year, last_year):
+        """
+        Get the standard deviation of the yearly growth of every country
+        between two years, higher for countries with more uneven arrivals.
+
+        Args:
+            first_year: First year of the window
+            last_year: Last year of the window
+        Returns:
+            Read-only float array in dataset order, NaN for countries with
+            fewer than 2 yearly growth values in the window
+        """
+        first_row = self._year_row(first_year)
+        last_row = self._year_row(last_year)
+
+        def compute():
+            # Growth into each year after the first year of the window
+            window_growth = self._yoy_growth[first_row + 1 : last_row + 1]
+            growth_counts = np.count_nonzero(~np.isnan(window_growth), axis=0)
+            volatility = np.full(window_growth.shape[1], np.nan)
+            enough_values = growth_counts >= 2
+            volatility[enough_values] = np.nanstd(
+                window_growth[:, enough_values], axis=0, ddof=1
+            )
+            return volatility
+
+        return self._window_metric(("volatility", first_row, last_row), compute)
+
+    def rolling_average(self, window):
+        """
+        Get the trailing average over a number of years of every country.
+
+        Args:
+            window: Number of years averaged, including the current year
+        Returns:
+            Read-only float matrix shaped like the year matrix
+        """
+        if window < 1:
+            raise ValueError("Window must be at least 1 year")
+        return self._window_metric(
+            ("rolling_average", window),
+            lambda: rolling_average(self._store.year_matrix, window),
+        )
+
+    def window_rows(self, first_year, last_year):
+        """
+        Get the rows of the first and last year of a range in the year matrix.
+
+        Args:
+            first_year: First year of the range
+            last_year: Last year of the range, not before the first year
+        Returns:
+            Integer first and last row positions
+        Raises:
+            KeyError: If a year is not in the dataset
+            ValueError: If the last year is before the first year
+        """
+        first_row = self._year_row(first_year)
+        last_row = self._year_row(last_year)
+        if last_row < first_row:
+            raise ValueError(f"Year range {first_year}-{last_year} is reversed")
+        return first_row, last_row
+
+    def window_counts(self, first_year, last_year):
+        """
+        Get the number of years with data of every country in a range of years.
+
+        Args:
+            first_year: First year of the range
+            last_year: Last year of the range
+        Returns:
+            Integer array in dataset order
+        """
+        first_row, last_row = self.window_rows(first_year, last_year)
+        missing_counts = (
+            self._missing_counts[last_row + 1] - self._missing_counts[first_row]
+        )
+        return last_row - first_row + 1 - missing_counts
+
+    def window_values(self, first_year, last_year, aggregate):
+        """
+        Summarise a range of years for every country, ignoring missing years.
+
+        Args:
+            first_year: First year of the range
+            last_year: Last year of the range
+            aggregate: One of the names in WINDOW_AGGREGATES
+        Returns:
+            Float array in dataset order, NaN for countries with no data in
+            the range, or for growth, missing the first or last year
+        """
+        first_row, last_row = self.window_rows(first_year, last_year)
+        if aggregate in (WINDOW_SUM, WINDOW_MEAN):
+            totals = self._totals[last_row + 1] - self._totals[first_row]
+            counts = self.window_counts(first_year, last_year)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                if aggregate == WINDOW_MEAN:
+                    totals = totals / counts
+            return np.where(counts > 0, totals, np.nan)
+        if aggregate in (WINDOW_MIN, WINDOW_MAX):
+            if aggregate == WINDOW_MIN:
+                table, combine = self._min_table, np.fmin
+            else:
+                table, combine = self._max_table, np.fmax
+            # Two runs of the largest power of 2 years covering the range
+            level = (last_row - first_row + 1).bit_length() - 1
+            return combine(
+                table[level][first_row], table[level][last_row - (1 << level) + 1]
+            )
+        if aggregate == WINDOW_GROWTH:
+            year_matrix = self._store.year_matrix
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return np.where(
+                    year_matrix[first_row] > 0,
+                    year_matrix[last_row] / year_matrix[first_row] - 1,
+                    np.nan,
+                )
+        raise ValueError(f"Unknown aggregate: {aggregate}")
+
+    def window_ranked_positions(
+        self,
+        first_year,
+        last_year,
+        aggregate,
+        region_name=ds.ALL_REGIONS,
+        ascending=False,
+    ):
+        """
+        Get the row positions of the countries of a region sorted by a summary
+        of a range of years, like TourismDataStore.ranked_positions.
+
+        Args:
+            first_year: First year of the range
+            last_year: Last year of the range
+            aggregate: One of the names in WINDOW_AGGREGATES
+            region_name: Only include countries in this region, or "All regions"
+            ascending: Sort smallest first instead of largest first
+        Returns:
+            NumPy array of row positions with countries with missing values
+            last, tied countries in dataset order largest first and in reverse
+            dataset order smallest first
+        """
+        values = self.window_values(first_year, last_year, aggregate)
+        positions = self._store.region_positions(region_name)
+        region_values = values[positions]
+        missing = np.isnan(region_values)
+        valid_positions = positions[~missing]
+        rank_order = valid_positions[
+            np.argsort(-region_values[~missing], kind="stable")
+        ]
+        # Reversed like ranked_positions, so a range of one year is in the
+        # same order as the year itself
+        if ascending:
+            rank_order = rank_order[::-1]
+        return np.concatenate([rank_order, positions[missing]])
+
+    def column(self, metric_name):
+        """
+        Get a metric of every country.
+
+        Args:
+            metric_name: One of the names in METRIC_COLUMNS
+        Returns:
+            Read-only float array in dataset order
+        """
+        if metric_name not in self._columns:
+            raise KeyError(f"Unknown metric: {metric_name}")
+        return self._columns[metric_name]
+
+    def value(self, country_name, metric_name):
+        """
+        Get a metric of one country.
+
+        Args:
+            country_name: Country name as a string
+            metric_name: One of the names in METRIC_COLUMNS
+        Returns:
+            Float value, NaN if it is missing
+        """
+        return float(
+            self.column(metric_name)[self._store.country_position(country_name)]
+        )
+
+    def frame(self, metric_names=None, positions=None):
+        """
+        Get metric columns as a dataframe, e.g. to plot with plotly express.
+
+        Args:
+            metric_names: List of names in METRIC_COLUMNS, defaults to all
+            positions: Optional array of row positions, e.g. from the store
+                indexes, defaults to every country in dataset order
+        Returns:
+            Pandas dataframe with the Country Name column and a column per metric
+        """
+        if positions is None:
+            positions = np.arange(len(self._store.country_names))
+        metric_names = metric_names or METRIC_COLUMNS
+        df_country_names = self._store.columns(["Country Name"]).iloc[positions]
+        return pd.DataFrame(
+            {
+                "Country Name": df_country_names["Country Name"].to_numpy(),
+                **{
+                    metric_name: self.column(metric_name)[positions]
+                    for metric_name in metric_names
+                },
+            }
+        )
+
+
+# Metrics of the latest dataset versions, as version -> DerivedMetrics, so
+# callbacks still using the previous version do not compute them again
+_derived_metrics = OrderedDict()
+_derived_metrics_lock = threading.Lock()
+_KEEP_VERSIONS = 2
+
+
+def get_derived_metrics(store):
+    """
+    Get the derived metrics of a dataset version, computing them on first use.
+
+    Args:
+        store: TourismDataStore of the dataset version
+    Returns:
+        DerivedMetrics shared by every callback using this version
+    """
+    derived_metrics = _derived_metrics.get(store.version)
+    if derived_metrics is not None:
+        return derived_metrics
+    # Lock so that two threads starting together only compute them once
+    with _derived_metrics_lock:
+        derived_metrics = _derived_metrics.get(store.version)
+        if derived_metrics is None:
+            derived_metrics = DerivedMetrics(store)
+            _derived_metrics[store.version] = derived_metrics
+            while len(_derived_metrics) > _KEEP_VERSIONS:
+                _derived_metrics.popitem(last=False)
+    return derived_metrics
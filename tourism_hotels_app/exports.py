@@ -0,0 +1,679 @@
+"""
+Cached data exports of the tourism arrivals dataset, served on /export.
+
+An export is the dataset, or the rows and year columns picked by a filter of
+region, year range and countries, as an Excel, CSV or Parquet file. Built
+export files are kept in a bounded cache per dataset version, format and
+filter, so repeated downloads are sent from memory without building the file
+again.
+
+Bursts of downloads are kept from blocking the workers: requests for the same
+export wait for the one request building it, at most TOURISM_EXPORT_BUILDS
+exports are built at a time per process, and a request waiting longer than
+TOURISM_EXPORT_WAIT_SECONDS for its turn gets a 503 response to try again.
+CSV exports are streamed in chunks of rows as they are written, and only
+cached once fully sent.
+"""
+from collections import OrderedDict
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+from urllib.parse import urlencode
+from flask import Response, jsonify, request
+import numpy as np
+import pandas as pd
+import data_store as ds
+import metrics
+
+try:
+    import pyarrow
+except ImportError:
+    # Without pyarrow, exports are only offered as Excel and CSV files
+    pyarrow = None
+
+# File extension and content type of each export format
+EXPORT_FORMATS = {
+    "xlsx": (
+        ".xlsx",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ),
+    "csv": (".csv", "text/csv; charset=utf-8"),
+}
+if pyarrow is not None:
+    EXPORT_FORMATS["parquet"] = (".parquet", "application/vnd.apache.parquet")
+
+# Name of each export format shown to users
+EXPORT_FORMAT_NAMES = {"xlsx": "Excel", "csv": "CSV", "parquet": "Parquet"}
+
+# Name of the downloaded files, without the extension
+EXPORT_FILENAME = "Tourism arrivals"
+
+# Exports built at the same time per process, and the seconds a request
+# waits for its turn before it is answered with 503
+EXPORT_BUILDS = int(os.environ.get("TOURISM_EXPORT_BUILDS", "2"))
+EXPORT_WAIT_SECONDS = float(os.environ.get("TOURISM_EXPORT_WAIT_SECONDS", "10"))
+
+# Rows written per chunk of a streamed CSV export or export job
+CSV_CHUNK_ROWS = 50
+
+
+class ExportBusyError(Exception):
+    """
+    Raised when an export could not be started within EXPORT_WAIT_SECONDS.
+    """
+
+
+class ExportFilter:
+    """
+    Region, year range and countries picking the rows and columns of an export.
+    """
+
+    def __init__(self, region_name, first_year, last_year, country_names):
+        """
+        Args:
+            region_name: Region of the exported countries, or ALL_REGIONS
+            first_year: First exported year column
+            last_year: Last exported year column
+            country_names: Tuple of exported country names in dataset order,
+                or an empty tuple for every country in the region
+        """
+        self.region_name = region_name
+        self.first_year = first_year
+        self.last_year = last_year
+        self.country_names = country_names
+
+    def key(self):
+        """
+        Get the part of the export cache key describing this filter.
+
+        Returns:
+            Tuple of the filter values
+        """
+        return (
+            self.region_name,
+            self.first_year,
+            self.last_year,
+            self.country_names,
+        )
+
+    def query_string(self):
+        """
+        Get the query string of the export route selecting this filter.
+
+        Returns:
+            Query string starting with ?
+        """
+        return "?" + urlencode(
+            [
+                ("region", self.region_name),
+                ("start", self.first_year),
+                ("end", self.last_year),
+            ]
+            + [("country", country_name) for country_name in self.country_names]
+        )
+
+    @classmethod
+    def from_values(
+        cls, store, region_name=None, first_year=None, last_year=None, country_names=()
+    ):
+        """
+        Create a filter from the download options, checking them against the data.
+
+        Every option is optional, so with none of them the whole dataset is
+        exported.
+
+        Args:
+            store: Dataset version the export is built from
+            region_name: Region name, or None or ALL_REGIONS for every region
+            first_year: First year as an integer or string, or None
+            last_year: Last year as an integer or string, or None
+            country_names: Iterable of country names, empty for every country
+        Returns:
+            ExportFilter
+        Raises:
+            ValueError: If a region, year or country is not in the dataset
+        """
+        region_name = region_name or ds.ALL_REGIONS
+        if region_name != ds.ALL_REGIONS and region_name not in store.region_names:
+            raise ValueError(f"Unknown region {region_name}")
+
+        try:
+            first_year = int(first_year or store.years[0])
+            last_year = int(last_year or store.years[-1])
+        except ValueError:
+            raise ValueError("Years must be whole numbers") from None
+        if first_year not in store.years or last_year not in store.years:
+            raise ValueError(
+                f"Years must be from {store.years[0]} to {store.years[-1]}"
+            )
+        if first_year > last_year:
+            first_year, last_year = last_year, first_year
+
+        country_names = set(country_names or ())
+        unknown_country_names = sorted(country_names.difference(store.country_names))
+        if unknown_country_names:
+            raise ValueError(f"Unknown countries {', '.join(unknown_country_names)}")
+        # Sort by dataset position, so the same countries share one cache entry
+        country_names = tuple(sorted(country_names, key=store.country_position))
+
+        return cls(region_name, first_year, last_year, country_names)
+
+    @classmethod
+    def from_args(cls, store, args):
+        """
+        Create a filter from the query string parameters of an export request,
+        which are region, start and end years, and country, which can be repeated.
+
+        Args:
+            store: Dataset version the export is built from
+            args: Flask request args
+        Returns:
+            ExportFilter
+        Raises:
+            ValueError: If a region, year or country is not in the dataset
+        """
+        return cls.from_values(
+            store,
+            args.get("region"),
+            args.get("start"),
+            args.get("end"),
+            args.getlist("country"),
+        )
+
+
+class ExportCache:
+    """
+    Thread-safe least recently used cache of export files with a byte budget.
+
+    Keys start with the dataset version, so when a new dataset version is
+    cached the exports of older versions are dropped.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        Args:
+            max_bytes: Maximum total size of the cached export files
+        """
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self._latest_version = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Get a cached export file and mark it as most recently used.
+
+        Args:
+            key: Tuple of dataset version, format and filter values
+        Returns:
+            File bytes, or None if it is not in the cache
+        """
+        with self._lock:
+            export_bytes = self._entries.get(key)
+            if export_bytes is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return export_bytes
+
+    def __contains__(self, key):
+        """
+        Check if an export file is cached, without counting a hit or miss.
+
+        Args:
+            key: Tuple of dataset version, format and filter values
+        Returns:
+            True if it is in the cache
+        """
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, export_bytes):
+        """
+        Add an export file, evicting least recently used files to fit the budget.
+
+        Args:
+            key: Tuple of dataset version, format and filter values
+            export_bytes: File bytes
+        Returns:
+            None
+        """
+        if len(export_bytes) > self.max_bytes:
+            return
+        version = key[0]
+        with self._lock:
+            # Drop every export built from an older dataset version
+            if self._latest_version is None or version > self._latest_version:
+                self._latest_version = version
+                for old_key in [k for k in self._entries if k[0] < version]:
+                    self._total_bytes -= len(self._entries.pop(old_key))
+            elif version < self._latest_version:
+                return
+
+            if key in self._entries:
+                self._total_bytes -= len(self._entries.pop(key))
+            self._entries[key] = export_bytes
+            self._total_bytes += len(export_bytes)
+            while self._total_bytes > self.max_bytes:
+                _, evicted_bytes = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted_bytes)
+
+    def clear(self):
+        """Remove every cached export and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+            self.hits = self.misses = 0
+
+    def stats(self):
+        """
+        Get the cache counters, e.g. to check the hit rate.
+
+        Returns:
+            Dictionary of hits, misses, entries, bytes and max_bytes
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# Shared export cache, budget in megabytes can be set with an env variable
+export_cache = ExportCache(
+    int(float(os.environ.get("TOURISM_EXPORT_CACHE_MB", "16")) * 1024 * 1024)
+)
+
+# Exports being built, as cache key -> lock held by the request building it
+_building_locks = {}
+_building_locks_lock = threading.Lock()
+_build_slots = threading.BoundedSemaphore(EXPORT_BUILDS)
+_busy_count = [0]
+
+
+def export_metrics():
+    """
+    Get the export cache counters in the format of the /metrics route.
+
+    Returns:
+        List of (name, type, help, value) tuples
+    """
+    stats = export_cache.stats()
+    return [
+        ("export_cache_hits_total", "counter", "Export cache hits.", stats["hits"]),
+        (
+            "export_cache_misses_total",
+            "counter",
+            "Export cache misses.",
+            stats["misses"],
+        ),
+        ("export_cache_bytes", "gauge", "Size of the cached exports.", stats["bytes"]),
+        (
+            "export_busy_total",
+            "counter",
+            "Export requests answered with 503 as too many exports were building.",
+            _busy_count[0],
+        ),
+    ]
+
+
+metrics.register_collector(export_metrics)
+
+
+def export_cache_key(store, export_format, export_filter):
+    """
+    Create the export cache key for a format and filter.
+
+    Args:
+        store: Dataset version the export is built from
+        export_format: Name of the export format, e.g. xlsx
+        export_filter: ExportFilter of the exported rows and columns
+    Returns:
+        Tuple used as the export cache key
+    """
+    return (store.version, export_format) + export_filter.key()
+
+
+def export_dataframe(store, export_filter):
+    """
+    Select the rows and columns of an export from the dataset.
+
+    Args:
+        store: Dataset version to export
+        export_filter: ExportFilter of the exported rows and columns
+    Returns:
+        Pandas dataframe indexed by country name, with the info columns, the
+        year columns in the year range and the statistic columns
+    """
+    positions = store.region_positions(export_filter.region_name)
+    if export_filter.country_names:
+        country_positions = np.array(
+            [
+                store.country_position(country_name)
+                for country_name in export_filter.country_names
+            ],
+            dtype=np.intp,
+        )
+        # Both arrays are in dataset order, so the result is too
+        positions = np.intersect1d(positions, country_positions)
+
+    year_columns = [
+        year_column
+        for year, year_column in zip(store.years, store.year_columns)
+        if export_filter.first_year <= year <= export_filter.last_year
+    ]
+    column_names = [
+        column_name
+        for column_name in store.dataframe.columns
+        if column_name in ds.INFO_COLUMNS
+        or column_name in ds.STAT_COLUMNS
+        or column_name in year_columns
+    ]
+    df_export = store.rows(positions)
+    # Set dataframe index to the country name for cleaner download
+    return df_export[column_names].set_index("Country Name")
+
+
+def export_chunks(df_export):
+    """
+    Split an export dataframe into chunks of rows to write one at a time.
+
+    Args:
+        df_export: Dataframe returned by export_dataframe
+    Returns:
+        Generator of (start row, dataframe chunk) pairs, with at least one
+        chunk so the header is written even if no rows are exported
+    """
+    for start in range(0, max(len(df_export), 1), CSV_CHUNK_ROWS):
+        yield start, df_export.iloc[start : start + CSV_CHUNK_ROWS]
+
+
+def write_export(df_export, export_format, export_file, on_chunk=None):
+    """
+    Write an export dataframe to a file, in chunks of rows for Excel and CSV.
+
+    Args:
+        df_export: Dataframe returned by export_dataframe
+        export_format: Name of the export format, e.g. xlsx
+        export_file: Binary file object to write to
+        on_chunk: Optional function called with the part of the rows written
+            after each chunk, e.g. to report progress or stop the export
+    Returns:
+        None
+    """
+    row_count = max(len(df_export), 1)
+    if export_format == "parquet":
+        df_export.to_parquet(export_file)
+    elif export_format == "xlsx":
+        with pd.ExcelWriter(export_file, engine="openpyxl") as excel_writer:
+            for start, df_chunk in export_chunks(df_export):
+                # Rows after the first chunk go below the header row
+                df_chunk.to_excel(
+                    excel_writer,
+                    sheet_name="Main",
+                    startrow=start + 1 if start else 0,
+                    header=start == 0,
+                )
+                if on_chunk is not None:
+                    on_chunk(min(start + CSV_CHUNK_ROWS, row_count) / row_count)
+    else:
+        for start, df_chunk in export_chunks(df_export):
+            export_file.write(df_chunk.to_csv(header=start == 0).encode("utf-8"))
+            if on_chunk is not None:
+                on_chunk(min(start + CSV_CHUNK_ROWS, row_count) / row_count)
+
+
+def build_export(df_export, export_format, on_chunk=None):
+    """
+    Write an export dataframe to a file in memory.
+
+    Args:
+        df_export: Dataframe returned by export_dataframe
+        export_format: Name of the export format, e.g. xlsx
+        on_chunk: Optional function called with the part of the rows written
+            after each chunk, passed to write_export
+    Returns:
+        File bytes
+    """
+    export_file = io.BytesIO()
+    write_export(df_export, export_format, export_file, on_chunk=on_chunk)
+    return export_file.getvalue()
+
+
+def run_export_job(job, export_format, export_filter):
+    """
+    Background job writing an export file, run by jobs.submit_job.
+
+    The export is built with get_export, so it is added to the export cache
+    of the worker process and later jobs for the same export reuse it.
+
+    Args:
+        job: JobContext of the job
+        export_format: Name of the export format, e.g. xlsx
+        export_filter: ExportFilter of the exported rows and columns
+    Returns:
+        File name the result is downloaded as
+    Raises:
+        ExportBusyError: If the export could not start within EXPORT_WAIT_SECONDS
+    """
+    job.progress(0.05, "Selecting data")
+    export_bytes = get_export(
+        ds.get_data_store(),
+        export_format,
+        export_filter,
+        # Leave the last 5% for saving the result file
+        on_chunk=lambda fraction: job.progress(
+            0.05 + 0.9 * fraction,
+            f"Writing {EXPORT_FORMAT_NAMES[export_format]} file",
+        ),
+    )
+    job.progress(0.95, "Saving file")
+    extension = EXPORT_FORMATS[export_format][0]
+    filepath = job.result_filepath(extension)
+    # Written to a temporary file first so a partly written result is never
+    # downloaded
+    temp_filepath = filepath.with_name(f".{filepath.name}-{os.getpid()}")
+    temp_filepath.write_bytes(export_bytes)
+    os.replace(temp_filepath, filepath)
+    return EXPORT_FILENAME + extension
+
+
+def get_export(store, export_format, export_filter, on_chunk=None):
+    """
+    Get an export file from the cache, building it if it is not cached.
+
+    Only one request builds each export, others asking for it at the same
+    time wait and then get it from the cache.
+
+    Args:
+        store: Dataset version to export
+        export_format: Name of the export format, e.g. xlsx
+        export_filter: ExportFilter of the exported rows and columns
+        on_chunk: Optional function called with the part of the rows written
+            after each chunk, if the export is built
+    Returns:
+        File bytes
+    Raises:
+        ExportBusyError: If the export could not start within EXPORT_WAIT_SECONDS
+    """
+    key = export_cache_key(store, export_format, export_filter)
+    export_bytes = export_cache.get(key)
+    if export_bytes is not None:
+        return export_bytes
+
+    with _building_locks_lock:
+        building_lock = _building_locks.setdefault(key, threading.Lock())
+    if not building_lock.acquire(timeout=EXPORT_WAIT_SECONDS):
+        raise ExportBusyError
+    try:
+        # Built by another request while this one waited
+        export_bytes = export_cache.get(key)
+        if export_bytes is not None:
+            return export_bytes
+        if not _build_slots.acquire(timeout=EXPORT_WAIT_SECONDS):
+            raise ExportBusyError
+        try:
+            with metrics.builder_duration.time(f"export_{export_format}"):
+                export_bytes = build_export(
+                    export_dataframe(store, export_filter),
+                    export_format,
+                    on_chunk=on_chunk,
+                )
+        finally:
+            _build_slots.release()
+        export_cache.put(key, export_bytes)
+        return export_bytes
+    finally:
+        # Later requests check the cache first, so the lock is not needed
+        with _building_locks_lock:
+            _building_locks.pop(key, None)
+        building_lock.release()
+
+
+def stream_csv_export(store, export_filter):
+    """
+    Write a CSV export in chunks of rows, caching it once it is fully written.
+
+    Args:
+        store: Dataset version to export
+        export_filter: ExportFilter of the exported rows and columns
+    Returns:
+        Generator of CSV file chunks as bytes
+    """
+    key = export_cache_key(store, "csv", export_filter)
+    chunks = []
+    chunks_bytes = 0
+    for start, df_chunk in export_chunks(export_dataframe(store, export_filter)):
+        chunk = df_chunk.to_csv(header=start == 0).encode("utf-8")
+        # Only keep the chunks while the export fits in the cache
+        if chunks is not None:
+            chunks.append(chunk)
+            chunks_bytes += len(chunk)
+            if chunks_bytes > export_cache.max_bytes:
+                chunks = None
+        yield chunk
+    if chunks is not None:
+        export_cache.put(key, b"".join(chunks))
+
+
+def warm_export_cache():
+    """
+    Build the whole dataset export in every format and add them to the cache.
+    Only runs in the main process, so job worker processes never warm again.
+
+    Args:
+        None
+    Returns:
+        None
+    """
+    if multiprocessing.parent_process() is not None:
+        return
+    store = ds.get_data_store()
+    export_filter = ExportFilter.from_values(store)
+    df_export = export_dataframe(store, export_filter)
+    for export_format in EXPORT_FORMATS:
+        export_cache.put(
+            export_cache_key(store, export_format, export_filter),
+            build_export(df_export, export_format),
+        )
+
+
+def export_etag(store, export_format, export_filter):
+    """
+    Create the ETag of an export from its dataset contents, format and filter,
+    known before the file is built.
+
+    Every worker loads the same file contents, so the tag is the same
+    whichever worker answers the next request.
+
+    Args:
+        store: Dataset version to export
+        export_format: Name of the export format, e.g. xlsx
+        export_filter: ExportFilter of the exported rows and columns
+    Returns:
+        ETag string, without quotes
+    """
+    filter_sha256 = hashlib.sha256(repr(export_filter.key()).encode("utf-8"))
+    return (
+        f"{store.source_sha256[:16]}-{export_format}-{filter_sha256.hexdigest()[:16]}"
+    )
+
+
+def export_response(export_format):
+    """
+    Create the response of an export request, sent as an attachment.
+
+    Args:
+        export_format: Name of the export format, e.g. xlsx
+    Returns:
+        Flask response
+    """
+    if export_format not in EXPORT_FORMATS:
+        return jsonify(error=f"Unknown export format {export_format}"), 404
+
+    # Use the same dataset version for the whole export even if data reloads
+    store = ds.get_data_store()
+    try:
+        export_filter = ExportFilter.from_args(store, request.args)
+    except ValueError as error:
+        return jsonify(error=str(error)), 400
+
+    # Browsers that already have this export are answered before building it
+    etag = export_etag(store, export_format, export_filter)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response
+
+    extension, content_type = EXPORT_FORMATS[export_format]
+    if export_format == "csv":
+        export_bytes = export_cache.get(
+            export_cache_key(store, export_format, export_filter)
+        )
+        body = export_bytes or stream_csv_export(store, export_filter)
+    else:
+        try:
+            body = get_export(store, export_format, export_filter)
+        except ExportBusyError:
+            _busy_count[0] += 1
+            response = jsonify(error="Too many exports in progress, try again")
+            response.status_code = 503
+            response.headers["Retry-After"] = "5"
+            return response
+
+    response = Response(body, content_type=content_type)
+    response.headers[
+        "Content-Disposition"
+    ] = f'attachment; filename="{EXPORT_FILENAME}{extension}"'
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def add_export_route(app):
+    """
+    Add the /export/<format> route to the Flask server of a dash app.
+
+    Args:
+        app: Dash app
+    Returns:
+        None
+    """
+
+    @app.server.route("/export/<export_format>")
+    def export(export_format):
+        """
+        Download the dataset, or the rows and years picked with the region,
+        start, end and country query string parameters.
+        """
+        return export_response(export_format)
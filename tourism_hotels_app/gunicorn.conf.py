@@ -0,0 +1,47 @@
+"""
+Gunicorn settings for serving the dash app with several worker processes.
+
+Used by serve.py, or run from this folder with:
+gunicorn --config gunicorn.conf.py wsgi:server
+
+Each setting can be changed with an environment variable, or with the
+matching gunicorn command line option.
+"""
+import os
+
+
+# Folder of the app modules, which import each other by file name
+chdir = os.path.dirname(os.path.abspath(__file__))
+
+# Address and port to listen on
+bind = os.environ.get("TOURISM_BIND", "0.0.0.0:8051")
+
+# Worker processes, each serving requests with a pool of threads
+workers = int(os.environ.get("TOURISM_WORKERS", (os.cpu_count() or 1) * 2 + 1))
+threads = int(os.environ.get("TOURISM_THREADS", "4"))
+worker_class = "gthread"
+
+# Load the app, dataset and figure cache in the master process before forking
+# the workers, so the workers share that memory copy-on-write
+preload_app = True
+
+# Restart a worker if a request takes longer than this many seconds
+timeout = int(os.environ.get("TOURISM_WORKER_TIMEOUT", "60"))
+
+
+def post_fork(server, worker):
+    """
+    Start the dataset watcher in each worker after it is forked.
+
+    Threads do not survive a fork, and each worker has its own data store to
+    reload, so the watcher is not started in the master process.
+
+    Args:
+        server: Gunicorn arbiter of the master process
+        worker: Gunicorn worker that has just been forked
+    Returns:
+        None
+    """
+    import tourism_hotels_dash_app
+
+    tourism_hotels_dash_app.start_data_watcher()
@@ -1,60 +1,238 @@
 """
 Helper file with additional helper functions for basic tasks.
 
-The first function loads the global dataframe.
-The first function transposes the main dataframe and drops columns.
+The first function loads the global dataframe from the CSV file.
+The snapshot functions convert the CSV file into a binary columnar snapshot
+and memory-map it, which is how the data store in data_store.py loads the
+dataframe shared across the app.
+The post cards function creates the example post cards, and the last
+function re-sends input values restored from the browser session to the page
+callbacks that are not called when the page loads.
 """
-from dash import html
+from dash import html, clientside_callback, Input, Output
 import dash_bootstrap_components as dbc
 from pathlib import Path
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
 import pandas as pd
 
 
-def load_dataframe():
+# Global prepared dataset path for tourist arrivals
+TOURISM_DATA_FILEPATH = Path(__file__).parent.parent.joinpath(
+    "tourism_hotels_app", "data", "Tourism_arrivals_prepared.csv"
+)
+
+# Folder holding binary snapshots of the dataset and the manifest file
+SNAPSHOT_DIRPATH = TOURISM_DATA_FILEPATH.parent.joinpath("snapshot")
+
+
+def load_dataframe(csv_filepath=TOURISM_DATA_FILEPATH):
     """
     Load prepared tourism arrivals dataframe from filepath.
+
+    Args:
+        csv_filepath: Path of the prepared tourism arrivals CSV file
+    Returns:
+        df_arrivals_prepared: Pandas dataframe parsed from the CSV file
     """
-    # Global prepared dataset path for tourist arrivals
-    TOURISM_DATA_FILEPATH = Path(__file__).parent.parent.joinpath(
-        "tourism_hotels_app", "data", "Tourism_arrivals_prepared.csv"
-    )
     # Import global prepared dataframe from above dataset
-    df_arrivals_prepared = pd.read_csv(TOURISM_DATA_FILEPATH)
+    df_arrivals_prepared = pd.read_csv(csv_filepath)
     return df_arrivals_prepared
 
 
-def transpose_df_arrivals_prepared():
+def _hash_file(filepath):
     """
-    Transpose the prepared tourism arrivals dataframe and reset index to allow
-    access to first column containing years.
+    Calculate the SHA-256 hash of a file, reading it in chunks.
 
     Args:
-        None
+        filepath: Path of the file to hash
+    Returns:
+        Hex digest string of the file contents
+    """
+    sha256 = hashlib.sha256()
+    with open(filepath, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _read_manifest(snapshot_dirpath):
+    """
+    Read the snapshot manifest, or return None if there is no valid manifest.
+    """
+    try:
+        with open(snapshot_dirpath.joinpath("manifest.json")) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(snapshot_dirpath, snapshot_name, csv_stat, csv_sha256):
+    """
+    Atomically replace the manifest pointing at the current snapshot folder.
+    """
+    manifest = {
+        "snapshot": snapshot_name,
+        "csv_mtime_ns": csv_stat.st_mtime_ns,
+        "csv_size": csv_stat.st_size,
+        "csv_sha256": csv_sha256,
+    }
+    temp_manifest_filepath = snapshot_dirpath.joinpath(f".manifest-{os.getpid()}.json")
+    with open(temp_manifest_filepath, "w") as file:
+        json.dump(manifest, file)
+    os.replace(temp_manifest_filepath, snapshot_dirpath.joinpath("manifest.json"))
+    return manifest
+
+
+def convert_csv_to_snapshot(
+    csv_filepath=TOURISM_DATA_FILEPATH, snapshot_dirpath=SNAPSHOT_DIRPATH
+):
+    """
+    Convert the prepared CSV file into a binary columnar snapshot.
+
+    Numeric columns are saved together in one .npy file with a row per column,
+    so each column is contiguous and the year columns form the year by country
+    matrix. Text columns are saved in a JSON string table. Every snapshot is
+    written to its own folder named after the CSV hash and the manifest file
+    is then replaced atomically, so processes loading an older snapshot are
+    not affected.
+
+    Args:
+        csv_filepath: Path of the prepared tourism arrivals CSV file
+        snapshot_dirpath: Folder to write the snapshot and manifest into
     Returns:
-        df_arrivals_transposed: Transposed pandas dataframe
-    """
-    df_arrivals_prepared = load_dataframe()
-    # Drop all columns without numeric data, other than Country Name
-    # Also drop average, minimum and maximum columns
-    df_arrivals_prepared_drop = df_arrivals_prepared.drop(
-        [
-            "Region",
-            "IncomeGroup",
-            "Country Code",
-            "Indicator Name",
-            "10-year Average in tourist arrivals",
-            "Max number of arrivals",
-            "Minimum number of arrivals",
-            "Percent drop 2019 to 2020",
-        ],
-        axis=1,
+        manifest: Dictionary describing the snapshot that was written
+    """
+    snapshot_dirpath = Path(snapshot_dirpath)
+    snapshot_dirpath.mkdir(parents=True, exist_ok=True)
+
+    # Record the CSV file details before reading it to detect later changes
+    csv_stat = os.stat(csv_filepath)
+    csv_sha256 = _hash_file(csv_filepath)
+    df_arrivals_prepared = load_dataframe(csv_filepath)
+
+    # Split columns into numeric columns and text columns, a year column with
+    # no missing values is read as whole numbers and is numeric too
+    numeric_columns = [
+        column
+        for column in df_arrivals_prepared.columns
+        if pd.api.types.is_numeric_dtype(df_arrivals_prepared[column])
+    ]
+    string_table = {
+        "columns": df_arrivals_prepared.columns.tolist(),
+        "numeric_columns": numeric_columns,
+        "string_columns": {
+            column: [
+                None if pd.isna(value) else value
+                for value in df_arrivals_prepared[column]
+            ]
+            for column in df_arrivals_prepared.columns
+            if column not in numeric_columns
+        },
+    }
+    numeric_matrix = np.ascontiguousarray(
+        df_arrivals_prepared[numeric_columns].astype("float64").to_numpy().T
     )
 
-    # Transpose dataframe and reset index to access first column for years
-    df_arrivals_transposed = df_arrivals_prepared_drop.set_index(
-        "Country Name"
-    ).T.reset_index()
-    return df_arrivals_transposed
+    # Write snapshot files into a temporary folder then move it into place
+    snapshot_name = csv_sha256[:16]
+    temp_dirpath = Path(tempfile.mkdtemp(dir=snapshot_dirpath, prefix=".tmp-"))
+    np.save(temp_dirpath.joinpath("numeric.npy"), numeric_matrix)
+    with open(temp_dirpath.joinpath("strings.json"), "w") as file:
+        json.dump(string_table, file)
+    try:
+        os.rename(temp_dirpath, snapshot_dirpath.joinpath(snapshot_name))
+    except OSError:
+        # Another process already wrote a snapshot of the same CSV contents
+        shutil.rmtree(temp_dirpath, ignore_errors=True)
+
+    manifest = _write_manifest(snapshot_dirpath, snapshot_name, csv_stat, csv_sha256)
+
+    # Remove snapshots of older CSV contents, open memory maps stay valid
+    for old_dirpath in snapshot_dirpath.iterdir():
+        if old_dirpath.is_dir() and old_dirpath.name != snapshot_name:
+            if not old_dirpath.name.startswith(".tmp-"):
+                shutil.rmtree(old_dirpath, ignore_errors=True)
+
+    return manifest
+
+
+def ensure_snapshot(
+    csv_filepath=TOURISM_DATA_FILEPATH, snapshot_dirpath=SNAPSHOT_DIRPATH
+):
+    """
+    Rebuild the snapshot if the CSV file changed since it was converted.
+
+    The CSV modified time and size are checked first, and the hash of the
+    file is only calculated if they differ from the manifest.
+
+    Args:
+        csv_filepath: Path of the prepared tourism arrivals CSV file
+        snapshot_dirpath: Folder containing the snapshot and manifest
+    Returns:
+        manifest: Dictionary describing the current snapshot
+    """
+    snapshot_dirpath = Path(snapshot_dirpath)
+    manifest = _read_manifest(snapshot_dirpath)
+    if manifest is None or not snapshot_dirpath.joinpath(manifest["snapshot"]).is_dir():
+        return convert_csv_to_snapshot(csv_filepath, snapshot_dirpath)
+
+    csv_stat = os.stat(csv_filepath)
+    if (
+        csv_stat.st_mtime_ns == manifest["csv_mtime_ns"]
+        and csv_stat.st_size == manifest["csv_size"]
+    ):
+        return manifest
+
+    # File was touched or replaced, only rebuild if the contents changed
+    csv_sha256 = _hash_file(csv_filepath)
+    if csv_sha256 != manifest["csv_sha256"]:
+        return convert_csv_to_snapshot(csv_filepath, snapshot_dirpath)
+    # Same contents, so record the new modified time to skip hashing next time
+    return _write_manifest(snapshot_dirpath, manifest["snapshot"], csv_stat, csv_sha256)
+
+
+def load_snapshot(
+    csv_filepath=TOURISM_DATA_FILEPATH, snapshot_dirpath=SNAPSHOT_DIRPATH
+):
+    """
+    Load the prepared dataframe by memory-mapping the binary snapshot,
+    rebuilding the snapshot first if the CSV file changed.
+
+    The numeric columns of the returned dataframe are read-only views of the
+    memory-mapped file, so processes loading the same snapshot share pages,
+    only the text columns are copied into each process.
+
+    Args:
+        csv_filepath: Path of the prepared tourism arrivals CSV file
+        snapshot_dirpath: Folder containing the snapshot and manifest
+    Returns:
+        df_arrivals_prepared: Pandas dataframe with the same columns as the CSV
+        numeric_matrix: Read-only memory-mapped NumPy matrix, a row per column
+        numeric_columns: List of column names for the rows of numeric_matrix
+        manifest: Dictionary describing the snapshot that was loaded
+    """
+    manifest = ensure_snapshot(csv_filepath, snapshot_dirpath)
+    snapshot_filepath = Path(snapshot_dirpath).joinpath(manifest["snapshot"])
+
+    numeric_matrix = np.load(snapshot_filepath.joinpath("numeric.npy"), mmap_mode="r")
+    with open(snapshot_filepath.joinpath("strings.json")) as file:
+        string_table = json.load(file)
+    numeric_columns = string_table["numeric_columns"]
+
+    # Each numeric column is its row of the matrix, passed in column order
+    # with copy=False so pandas keeps the rows as they are rather than
+    # copying them into one block as concatenating or reordering would
+    columns = dict(string_table["string_columns"])
+    columns.update(zip(numeric_columns, numeric_matrix))
+    df_arrivals_prepared = pd.DataFrame(
+        {column: columns[column] for column in string_table["columns"]}, copy=False
+    )
+    return df_arrivals_prepared, numeric_matrix, numeric_columns, manifest
 
 
 def create_post_cards():
@@ -139,3 +317,45 @@ def create_post_cards():
     )
 
     return post_card_1, post_card_2, post_card_3
+
+
+def resend_persisted_values(component_ids, prerendered_values):
+    """
+    Register a client side callback that re-sends input values restored from
+    the browser session when they differ from the values the page layout was
+    prerendered with.
+
+    Pages prerender their figures for the default input values and do not
+    call their callbacks when loaded. Inputs with persistence can be restored
+    to a different value than the default, so re-sending that value calls the
+    callbacks that depend on it, in the browser and without a request when
+    the values match.
+
+    Args:
+        component_ids: List of ids of input components with a value property
+        prerendered_values: List of values the layout was prerendered with
+    Returns:
+        None
+    """
+    clientside_callback(
+        f"""
+        function(...values) {{
+            const dash_clientside = window.dash_clientside;
+            const prerendered_values = {json.dumps(prerendered_values)};
+            // Only check the values restored when the page loads, not changes
+            if (dash_clientside.callback_context.triggered.length) {{
+                return values.map(() => dash_clientside.no_update);
+            }}
+            return values.map((value, i) =>
+                value === prerendered_values[i] ? dash_clientside.no_update : value
+            );
+        }}
+        """,
+        [Output(component_id, "value") for component_id in component_ids],
+        [Input(component_id, "value") for component_id in component_ids],
+    )
+
+
+if __name__ == "__main__":
+    # Convert the CSV file into a snapshot when this file is run directly
+    print(convert_csv_to_snapshot())
@@ -0,0 +1,448 @@
+"""
+Background job queue for long-running work such as building data exports.
+
+Jobs run in a small pool of worker processes started by each server process,
+so the request threads stay free for the chart callbacks, and no message
+broker is needed. The state of each job is kept in a JSON file in
+TOURISM_JOBS_DIR, with its progress, any error and the name of its result
+file, so any server process can report on or cancel a job, whichever process
+started it.
+
+Job functions take a JobContext as their first argument, which they use to
+report progress, check if the job was cancelled and get the path to write the
+result file to. Finished jobs and their results are deleted after
+TOURISM_JOB_RETENTION_SECONDS.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+from pathlib import Path
+import re
+import threading
+import time
+import uuid
+from flask import jsonify, send_file
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Folder the job states and results are saved in, shared by every process
+JOBS_DIRPATH = Path(
+    os.environ.get("TOURISM_JOBS_DIR", Path(__file__).parent.joinpath("data", "jobs"))
+)
+
+# Worker processes running jobs per server process, and the seconds finished
+# jobs and their results are kept for
+JOB_WORKERS = int(os.environ.get("TOURISM_JOB_WORKERS", "1"))
+JOB_RETENTION_SECONDS = float(os.environ.get("TOURISM_JOB_RETENTION_SECONDS", "3600"))
+
+# Job statuses, a job ends in one of the finished statuses
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATUSES = (DONE, FAILED, CANCELLED)
+
+# Job IDs are random hex strings, checked before they are used in file names
+_JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+_executor = None
+_executor_lock = threading.Lock()
+# Futures of the jobs submitted by this process, as job ID -> future
+_futures = {}
+# Jobs submitted by this process, as kind -> number of jobs
+_submitted_counts = {}
+
+
+class JobCancelledError(Exception):
+    """
+    Raised in a job function when the job has been cancelled.
+    """
+
+
+class JobContext:
+    """
+    Handle passed to a job function to report on and check its job.
+    """
+
+    def __init__(self, job_id):
+        """
+        Args:
+            job_id: ID of the job being run
+        """
+        self.job_id = job_id
+        self.result_filename = None
+
+    def progress(self, fraction, message=None):
+        """
+        Record the progress of the job, shown to users polling it.
+
+        Args:
+            fraction: Part of the job done, from 0 to 1
+            message: Optional description of the current step
+        Returns:
+            None
+        Raises:
+            JobCancelledError: If the job has been cancelled
+        """
+        self.check_cancelled()
+        update_job(
+            self.job_id,
+            progress=round(min(max(fraction, 0.0), 1.0), 3),
+            message=message,
+        )
+
+    def check_cancelled(self):
+        """
+        Stop the job if it has been cancelled, job functions should call this
+        between steps.
+
+        Args:
+            None
+        Returns:
+            None
+        Raises:
+            JobCancelledError: If the job has been cancelled
+        """
+        if job_filepath(self.job_id, ".cancel").exists():
+            raise JobCancelledError
+
+    def result_filepath(self, extension):
+        """
+        Get the path to write the result file of the job to.
+
+        Args:
+            extension: File extension of the result, e.g. .xlsx
+        Returns:
+            Path of the result file
+        """
+        self.result_filename = f"{self.job_id}-result{extension}"
+        return JOBS_DIRPATH.joinpath(self.result_filename)
+
+
+def job_filepath(job_id, suffix):
+    """
+    Get the path of a file of a job in the jobs folder.
+
+    Args:
+        job_id: ID of the job
+        suffix: End of the file name, e.g. .json for the job state
+    Returns:
+        Path of the file
+    """
+    return JOBS_DIRPATH.joinpath(f"{job_id}{suffix}")
+
+
+def _now():
+    """Current UTC date and time as an ISO 8601 string."""
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def _write_job(state):
+    """
+    Atomically replace the state file of a job.
+
+    Args:
+        state: Dictionary of the job state
+    Returns:
+        None
+    """
+    filepath = job_filepath(state["id"], ".json")
+    temp_filepath = filepath.with_name(
+        f".{filepath.name}-{os.getpid()}-{threading.get_ident()}"
+    )
+    with open(temp_filepath, "w", encoding="utf-8") as file:
+        json.dump(state, file)
+    os.replace(temp_filepath, filepath)
+
+
+def read_job(job_id):
+    """
+    Read the state of a job.
+
+    Args:
+        job_id: ID of the job
+    Returns:
+        Dictionary of the job state, or None if there is no such job
+    """
+    if not isinstance(job_id, str) or not _JOB_ID_PATTERN.match(job_id):
+        return None
+    try:
+        with open(job_filepath(job_id, ".json"), encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def update_job(job_id, **changes):
+    """
+    Change some values of the state of a job.
+
+    The state is mostly written by the worker process running the job, but the
+    server process that submitted it also records jobs that were cancelled
+    while queued or whose worker crashed. Each write replaces the whole file
+    atomically, so readers never see a partly written state, and the last
+    write wins.
+
+    Args:
+        job_id: ID of the job
+        changes: Job state values to set, e.g. status or progress
+    Returns:
+        Dictionary of the new job state, or None if there is no such job
+    """
+    state = read_job(job_id)
+    if state is None:
+        return None
+    state.update(changes, updated=_now())
+    _write_job(state)
+    return state
+
+
+def _run_job(job_id, function, kwargs):
+    """
+    Run a job function in a worker process and record how it finished.
+
+    Args:
+        job_id: ID of the job
+        function: Job function, taking a JobContext and the keyword arguments
+        kwargs: Dictionary of keyword arguments of the job function
+    Returns:
+        None
+    """
+    job = JobContext(job_id)
+    try:
+        # Cancelled while it was queued in another process
+        job.check_cancelled()
+        update_job(job_id, status=RUNNING, started=_now(), pid=os.getpid())
+        download_name = function(job, **kwargs)
+    except JobCancelledError:
+        if job.result_filename is not None:
+            JOBS_DIRPATH.joinpath(job.result_filename).unlink(missing_ok=True)
+        update_job(job_id, status=CANCELLED, message="Cancelled")
+    except Exception as error:
+        logger.exception("Job %s failed", job_id)
+        update_job(job_id, status=FAILED, error=repr(error), message="Failed")
+    else:
+        update_job(
+            job_id,
+            status=DONE,
+            progress=1.0,
+            message="Done",
+            result_file=job.result_filename,
+            download_name=download_name,
+        )
+
+
+def _get_executor():
+    """
+    Get the worker process pool of this process, starting it on first use.
+
+    The pool is started after gunicorn forks its workers, as a process pool
+    does not survive a fork, and its processes are spawned rather than forked
+    from the threads of the server process.
+
+    Args:
+        None
+    Returns:
+        ProcessPoolExecutor
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=JOB_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def _job_finished(job_id, future):
+    """
+    Record jobs that never ran, e.g. if a worker process crashed.
+    """
+    _futures.pop(job_id, None)
+    if future.cancelled():
+        update_job(job_id, status=CANCELLED, message="Cancelled")
+        return
+    error = future.exception()
+    if error is not None:
+        state = read_job(job_id)
+        if state is not None and state["status"] not in FINISHED_STATUSES:
+            update_job(job_id, status=FAILED, error=repr(error), message="Failed")
+
+
+def submit_job(kind, function, **kwargs):
+    """
+    Queue a job to run in a worker process.
+
+    Args:
+        kind: Name of the kind of job, e.g. export, used in the metrics
+        function: Module-level job function, taking a JobContext and kwargs
+        kwargs: Keyword arguments of the job function, which must be picklable
+    Returns:
+        ID of the new job
+    """
+    JOBS_DIRPATH.mkdir(parents=True, exist_ok=True)
+    remove_expired_jobs()
+
+    job_id = uuid.uuid4().hex
+    created = _now()
+    _write_job(
+        {
+            "id": job_id,
+            "kind": kind,
+            "status": QUEUED,
+            "progress": 0.0,
+            "message": "Waiting to start",
+            "created": created,
+            "updated": created,
+            "result_file": None,
+            "download_name": None,
+            "error": None,
+        }
+    )
+    future = _get_executor().submit(_run_job, job_id, function, kwargs)
+    _futures[job_id] = future
+    _submitted_counts[kind] = _submitted_counts.get(kind, 0) + 1
+    future.add_done_callback(lambda future: _job_finished(job_id, future))
+    return job_id
+
+
+def cancel_job(job_id):
+    """
+    Cancel a job that has not finished.
+
+    A queued job in this process is removed from the queue, and any other job
+    stops the next time its function checks for cancellation.
+
+    Args:
+        job_id: ID of the job
+    Returns:
+        Dictionary of the job state, or None if there is no such job
+    """
+    state = read_job(job_id)
+    if state is None or state["status"] in FINISHED_STATUSES:
+        return state
+    job_filepath(job_id, ".cancel").touch()
+    future = _futures.get(job_id)
+    if future is not None and future.cancel():
+        # Cancelled futures run their done callback straight away
+        return read_job(job_id)
+    # A running job records the cancellation itself when it next checks for
+    # it, so its state is not overwritten here
+    return dict(state, message="Cancelling")
+
+
+def result_filepath(state):
+    """
+    Get the path of the result file of a finished job.
+
+    Args:
+        state: Dictionary of the job state
+    Returns:
+        Path of the result file, or None if the job has no result
+    """
+    if state["status"] != DONE or not state.get("result_file"):
+        return None
+    return JOBS_DIRPATH.joinpath(state["result_file"])
+
+
+def remove_expired_jobs():
+    """
+    Delete the files of jobs that finished more than JOB_RETENTION_SECONDS ago,
+    or that have not been updated for that long, e.g. if their process stopped.
+
+    Args:
+        None
+    Returns:
+        None
+    """
+    expired_before = time.time() - JOB_RETENTION_SECONDS
+    for state_filepath in JOBS_DIRPATH.glob("*.json"):
+        try:
+            if state_filepath.stat().st_mtime >= expired_before:
+                continue
+        except OSError:
+            continue
+        job_id = state_filepath.stem
+        for filepath in JOBS_DIRPATH.glob(f"{job_id}*"):
+            filepath.unlink(missing_ok=True)
+
+
+def job_metrics():
+    """
+    Get the job counters of this process in the format of the /metrics route.
+
+    Returns:
+        List of (name, type, help, value) tuples
+    """
+    return [
+        (
+            "jobs_submitted_total",
+            "counter",
+            "Background jobs submitted by this process.",
+            sum(_submitted_counts.values()),
+        ),
+        (
+            "jobs_pending",
+            "gauge",
+            "Background jobs of this process queued or running.",
+            len(_futures),
+        ),
+    ]
+
+
+metrics.register_collector(job_metrics)
+
+
+def add_job_routes(app):
+    """
+    Add the routes to poll, cancel and download the result of a job.
+
+    Args:
+        app: Dash app
+    Returns:
+        None
+    """
+
+    @app.server.route("/jobs/<job_id>")
+    def job_status(job_id):
+        """
+        State of a job, with its status, progress and message.
+        """
+        state = read_job(job_id)
+        if state is None:
+            return jsonify(error="Unknown job"), 404
+        return jsonify(state)
+
+    @app.server.route("/jobs/<job_id>/cancel", methods=["POST"])
+    def job_cancel(job_id):
+        """
+        Cancel a job, returning its state.
+        """
+        state = cancel_job(job_id)
+        if state is None:
+            return jsonify(error="Unknown job"), 404
+        return jsonify(state)
+
+    @app.server.route("/jobs/<job_id>/result")
+    def job_result(job_id):
+        """
+        Download the result file of a finished job.
+        """
+        state = read_job(job_id)
+        if state is None:
+            return jsonify(error="Unknown job"), 404
+        filepath = result_filepath(state)
+        if filepath is None or not filepath.exists():
+            return jsonify(error=f"Job is {state['status']}, with no result"), 409
+        return send_file(
+            filepath,
+            as_attachment=True,
+            download_name=state["download_name"] or filepath.name,
+        )
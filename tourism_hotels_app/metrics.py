@@ -0,0 +1,422 @@
+"""
+Lightweight latency and payload metrics for the dash callbacks.
+
+Every server callback is wrapped to record its wall time, the time spent
+encoding its response to JSON and the size of that response, and the chart
+builders in create_charts.py record their own time. The values are kept in
+fixed-bucket histograms, which only add a few counter increments per request,
+and are served in the Prometheus text format on the /metrics route.
+
+Each server process keeps its own metrics, so with several gunicorn workers a
+scrape shows the worker that answered it.
+"""
+import bisect
+from contextlib import contextmanager
+import functools
+import threading
+import time
+import dash
+from dash.exceptions import PreventUpdate
+from flask import Response
+
+# Histogram bucket upper bounds, in seconds and in bytes
+SECONDS_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+BYTES_BUCKETS = (1e3, 5e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6)
+
+# Content type of the Prometheus text format
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape_label_value(value):
+    """
+    Escape a label value for the Prometheus text format.
+
+    Args:
+        value: Label value string
+    Returns:
+        Escaped label value string
+    """
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_number(value):
+    """
+    Format a bucket bound or sample value for the Prometheus text format.
+
+    Args:
+        value: Integer or float value
+    Returns:
+        Value string, using +Inf for infinity and no decimals for whole numbers
+    """
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Histogram:
+    """
+    Thread-safe histogram of values per label, e.g. per callback.
+    """
+
+    def __init__(self, name, help_text, label_name, buckets):
+        """
+        Create an empty histogram.
+
+        Args:
+            name: Metric name
+            help_text: Description shown in the HELP line
+            label_name: Name of the label the values are recorded per
+            buckets: Ascending bucket upper bounds, +Inf is added automatically
+        Returns:
+            None
+        """
+        self.name = name
+        self.help_text = help_text
+        self.label_name = label_name
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # Label value -> [bucket counts (not cumulative), sum, count]
+        self._series = {}
+
+    def observe(self, label, value):
+        """
+        Record one value.
+
+        Args:
+            label: Label value, e.g. the callback name
+            value: Value to record
+        Returns:
+            None
+        """
+        # Index of the first bucket the value fits in, len(buckets) for +Inf
+        bucket_index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._series[label] = series
+            series[0][bucket_index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, label):
+        """
+        Context manager recording the seconds spent in its block.
+
+        Args:
+            label: Label value, e.g. the chart builder name
+        Returns:
+            Context manager
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(label, time.perf_counter() - start)
+
+    def render(self):
+        """
+        Render the histogram in the Prometheus text format.
+
+        Args:
+            None
+        Returns:
+            List of text lines
+        """
+        with self._lock:
+            series = {
+                label: (list(counts), total, count)
+                for label, (counts, total, count) in self._series.items()
+            }
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for label, (counts, total, count) in sorted(series.items()):
+            label_pair = f'{self.label_name}="{escape_label_value(label)}"'
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                lines.append(
+                    f'{self.name}_bucket{{{label_pair},le="{format_number(bound)}"}} '
+                    f"{cumulative}"
+                )
+            lines.append(f"{self.name}_sum{{{label_pair}}} {format_number(total)}")
+            lines.append(f"{self.name}_count{{{label_pair}}} {count}")
+        return lines
+
+
+class Counter:
+    """
+    Thread-safe counter per label, e.g. callback errors per callback.
+    """
+
+    def __init__(self, name, help_text, label_name):
+        """
+        Create a counter with no labels counted yet.
+
+        Args:
+            name: Metric name, ending in _total
+            help_text: Description shown in the HELP line
+            label_name: Name of the label the counts are kept per
+        Returns:
+            None
+        """
+        self.name = name
+        self.help_text = help_text
+        self.label_name = label_name
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def inc(self, label):
+        """
+        Add one to the count of a label.
+
+        Args:
+            label: Label value, e.g. the callback name
+        Returns:
+            None
+        """
+        with self._lock:
+            self._counts[label] = self._counts.get(label, 0) + 1
+
+    def render(self):
+        """
+        Render the counter in the Prometheus text format.
+
+        Args:
+            None
+        Returns:
+            List of text lines
+        """
+        with self._lock:
+            counts = dict(self._counts)
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} counter",
+        ]
+        for label, count in sorted(counts.items()):
+            lines.append(
+                f'{self.name}{{{self.label_name}="{escape_label_value(label)}"}} '
+                f"{count}"
+            )
+        return lines
+
+
+callback_duration = Histogram(
+    "dash_callback_duration_seconds",
+    "Wall time of each dash callback, including encoding the response.",
+    "callback",
+    SECONDS_BUCKETS,
+)
+callback_serialization = Histogram(
+    "dash_callback_serialization_seconds",
+    "Time spent encoding each dash callback response to JSON.",
+    "callback",
+    SECONDS_BUCKETS,
+)
+callback_response_bytes = Histogram(
+    "dash_callback_response_bytes",
+    "Size of each dash callback JSON response.",
+    "callback",
+    BYTES_BUCKETS,
+)
+callback_errors = Counter(
+    "dash_callback_errors_total",
+    "Dash callbacks that raised an error, not counting prevented updates.",
+    "callback",
+)
+builder_duration = Histogram(
+    "chart_builder_duration_seconds",
+    "Time spent in each chart builder, including figure cache hits.",
+    "builder",
+    SECONDS_BUCKETS,
+)
+
+# Functions called at scrape time returning (name, type, help, value) tuples,
+# e.g. for the figure cache counters
+_collectors = []
+
+# Serialization time of the callback running in the current thread
+_callback_state = threading.local()
+
+
+def register_collector(collect):
+    """
+    Add a function reporting extra metric values when /metrics is requested.
+
+    Args:
+        collect: Function taking no arguments and returning a list of
+            (name, type, help, value) tuples, type being counter or gauge
+    Returns:
+        None
+    """
+    _collectors.append(collect)
+
+
+def timed_builder(build_figure):
+    """
+    Decorator recording the time spent in a chart builder.
+
+    Args:
+        build_figure: Chart builder function
+    Returns:
+        Wrapped chart builder recording its time in the builder histogram
+    """
+    builder_name = build_figure.__name__
+
+    @functools.wraps(build_figure)
+    def timed_build_figure(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return build_figure(*args, **kwargs)
+        finally:
+            builder_duration.observe(builder_name, time.perf_counter() - start)
+
+    return timed_build_figure
+
+
+def render_metrics():
+    """
+    Render every metric in the Prometheus text format.
+
+    Args:
+        None
+    Returns:
+        Text of the metrics, ending with a new line
+    """
+    lines = []
+    for metric in (
+        callback_duration,
+        callback_serialization,
+        callback_response_bytes,
+        callback_errors,
+        builder_duration,
+    ):
+        lines += metric.render()
+    for collect in _collectors:
+        for name, metric_type, help_text, value in collect():
+            lines += [
+                f"# HELP {name} {help_text}",
+                f"# TYPE {name} {metric_type}",
+                f"{name} {format_number(value)}",
+            ]
+    return "\n".join(lines) + "\n"
+
+
+def instrument_callback(callback, label):
+    """
+    Wrap a registered dash callback to record its time and response size.
+
+    Args:
+        callback: Function dash calls for the callback, returning the JSON
+            response string
+        label: Callback label used in the metrics
+    Returns:
+        Wrapped callback function
+    """
+
+    @functools.wraps(callback)
+    def instrumented_callback(*args, **kwargs):
+        _callback_state.serialization_seconds = 0.0
+        start = time.perf_counter()
+        try:
+            response = callback(*args, **kwargs)
+        except PreventUpdate:
+            raise
+        except Exception:
+            callback_errors.inc(label)
+            raise
+        finally:
+            callback_duration.observe(label, time.perf_counter() - start)
+            callback_serialization.observe(label, _callback_state.serialization_seconds)
+            # Only time serialization inside a callback
+            del _callback_state.serialization_seconds
+        if isinstance(response, str):
+            callback_response_bytes.observe(label, len(response.encode("utf-8")))
+        return response
+
+    instrumented_callback.instrumented = True
+    return instrumented_callback
+
+
+def timed_to_json(to_json):
+    """
+    Wrap dash's JSON encoder to add its time to the running callback.
+
+    Args:
+        to_json: Dash function encoding a callback response to JSON
+    Returns:
+        Wrapped encoder function
+    """
+
+    @functools.wraps(to_json)
+    def timed_encode(obj):
+        start = time.perf_counter()
+        try:
+            return to_json(obj)
+        finally:
+            if hasattr(_callback_state, "serialization_seconds"):
+                _callback_state.serialization_seconds += time.perf_counter() - start
+
+    return timed_encode
+
+
+def instrument_app(app):
+    """
+    Record metrics for every server callback of a dash app and add /metrics.
+
+    Page callbacks are only added to the app's callback map when the first
+    request is served, so callbacks are wrapped before each request, once
+    the map has changed.
+
+    Args:
+        app: Dash app, with its callbacks and pages registered
+    Returns:
+        None
+    """
+    # Callback responses are encoded by the to_json function dash imported
+    # into its callback module, so time that one
+    if hasattr(dash._callback, "to_json"):
+        dash._callback.to_json = timed_to_json(dash._callback.to_json)
+
+    instrumented_count = [0]
+
+    def instrument_new_callbacks():
+        if len(app.callback_map) == instrumented_count[0]:
+            return
+        for callback_entry in app.callback_map.values():
+            callback = callback_entry.get("callback")
+            # Clientside callbacks have no server function
+            if callback is None or getattr(callback, "instrumented", False):
+                continue
+            label = f"{callback.__module__}.{callback.__name__}"
+            callback_entry["callback"] = instrument_callback(callback, label)
+        instrumented_count[0] = len(app.callback_map)
+
+    # Runs after dash's own hooks, which register the page callbacks
+    app.server.before_request(instrument_new_callbacks)
+
+    @app.server.route("/metrics")
+    def metrics():
+        """
+        Prometheus metrics endpoint of this server process.
+        """
+        return Response(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
@@ -63,10 +63,11 @@ def Navbar():
                         dbc.Col(
                             [
                                 dbc.Nav(
-                                    [  # Add 3 navigation bar link objects with a link to each page
+                                    [  # Add 4 navigation bar link objects with a link to each page
                                         dbc.NavItem([dbc.NavLink("Home", href="/")]),
                                         dbc.NavItem(dbc.NavLink("Trends", href="/pg2")),
                                         dbc.NavItem(dbc.NavLink("Posts", href="/pg3")),
+                                        dbc.NavItem(dbc.NavLink("Regions", href="/pg4")),
                                     ]
                                 )
                             ],
@@ -1,14 +1,7 @@
 """Helper functions for creating the charts."""
-from pathlib import Path
-import pandas as pd
 import plotly.express as px
 import plotly.graph_objs as go
-
-# Global prepared dataset path for tourist arrivals
-TOURISM_DATA_FILEPATH = Path(__file__).parent.parent.joinpath(
-    'data', 'Tourism_arrivals_prepared.csv')
-# Import global prepared dataframe from above dataset
-df_arrivals_prepared = pd.read_csv(TOURISM_DATA_FILEPATH)
+import data_store as ds
 
 
 def bar_chart_top_x_tourism_countries(top_x_countries):
@@ -27,11 +20,8 @@ def bar_chart_top_x_tourism_countries(top_x_countries):
             "10-year Average in tourist arrivals",
             ]
 
-    # Define global dataframe of the prepared tourism dataset
-    df_arrivals_10year_average = pd.read_csv(
-                                             TOURISM_DATA_FILEPATH,
-                                             usecols=cols
-                                             )
+    # Get the desired columns from the shared dataset store
+    df_arrivals_10year_average = ds.get_data_store().columns(cols)
 
     # Sort the values by "Average tourist arrivals in last 10 years" column descending order
     df_arrivals_ascending_10yr_average = df_arrivals_10year_average.sort_values(['10-year Average in tourist arrivals'], ascending=(False))
@@ -69,7 +59,7 @@ def create_choropleth_map(year_selected):
     """
     # Create choropleth figure, note title not added
     ## Title added in main page layout to look better with responsive devices
-    fig_choropleth = px.choropleth(df_arrivals_prepared, locations="Country Code",
+    fig_choropleth = px.choropleth(ds.get_data_store().dataframe, locations="Country Code",
                             color=str(year_selected),
                             hover_name="Country Name",
                             hover_data={
@@ -94,7 +84,7 @@ def create_scatter_per_country():
     # Drop all columns without numeric data, other than Country Name
     # Also drop the 10-year Average in tourist arrivals column
     df_arrivals_prepared = \
-        df_arrivals_prepared.drop([
+        ds.get_data_store().dataframe.drop([
                                    'Region', 'IncomeGroup',
                                    'Country Code',
                                    'Indicator Name',
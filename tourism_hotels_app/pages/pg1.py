@@ -1,293 +1,624 @@
 """Contain the contents for the first / home page in multi-page app"""
+import os
 import dash
-from dash import html, dcc, Dash, Input, Output, State, callback
+from dash import html, dcc, Dash, Input, Output, State, callback, clientside_callback
 from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import plotly.express as px
 import create_charts as cc
+import data_store as ds
+import derived_metrics as dm
 import helper_functions as helper
 
 
-# Import global prepared dataframe from Tourism dataset
-df_arrivals_prepared = helper.load_dataframe()
+dash.register_page(__name__, path="/")
 
+# Switch the choropleth and tree map between years in the browser, using the
+# values of every year sent once per region, instead of a request per year
+CLIENTSIDE_YEARS = os.environ.get("TOURISM_CLIENTSIDE_YEARS", "1") == "1"
+# When years are switched on the server, only send the changed trace data
+# after the first full figures
+PATCH_FIGURES = os.environ.get("TOURISM_PATCH_FIGURES", "1") == "1"
 
-dash.register_page(__name__, path="/")
+# Default inputs, the page layout is prerendered with their figures
+DEFAULT_YEAR = 2019
+DEFAULT_REGION = "All regions"
+DEFAULT_TOP_X_COUNTRIES = 10
 
-# Wraps content of the dash app page in a responsive width dbc container
-layout = dbc.Container(
-    fluid=True,
-    children=[
-        # Use dbc to split page into rows and columns
-        # First row here
-        dbc.Row(
-            [
-                # Column containing options and treemap
-                dbc.Col(
-                    [
-                        html.Label(
-                            ["Choose with arrows, or type a year between 1995 and 2020"]
-                        ),
-                        dbc.Row(
-                            [
-                                # Add input field to enter year as a number, numeric type
-                                # Make field red if nothing entered or anything other than the specified type or range
-                                dcc.Input(
-                                    id="input_year_field",
-                                    type="number",
-                                    # Set debounce as true
-                                    inputMode="numeric",
-                                    debounce=True,
-                                    # Set pre-selected value to 2019
-                                    value=2019,
-                                    # Set min and max to year range of available data columns
-                                    max=2020,
-                                    min=1995,
-                                    step=1,
-                                    required=True,
-                                    # Increase padding, add rounded grey border
-                                    className="p-1 rounded border border-secondary",
-                                ),
-                                # Add button to submit chosen year to update graphs only when it's clicked
-                                html.Button(
-                                    id="submit_button",
-                                    n_clicks=0,
-                                    children="Submit",
-                                    className="my-1 rounded border-secondary",
-                                ),
-                                # Increase padding, horizontal gutter and change positioning for better visual appearance
-                            ],
-                            className="p-2 gx-3 my-0 py-0",
-                        ),
-                        dbc.Col(
-                            [
-                                html.Label(["Filter by Region"], className="text-dark"),
-                                # Place region selector dropdown in card
-                                dbc.Card(
-                                    [
-                                        dcc.Dropdown(
-                                            id="region-dropdown",
-                                            # Give options dictionary for each region and All regions
-                                            options=[
-                                                {
-                                                    "label": "All regions",
-                                                    "value": "All regions",
-                                                },
-                                                {
-                                                    "label": "East Asia & Pacific",
-                                                    "value": "East Asia & Pacific",
-                                                },
-                                                {
-                                                    "label": "Europe & Central Asia",
-                                                    "value": "Europe & Central Asia",
-                                                },
-                                                {
-                                                    "label": "Latin America & Caribbean",
-                                                    "value": "Latin America & Caribbean",
-                                                },
-                                                {
-                                                    "label": "Middle East & North Africa",
-                                                    "value": "Middle East & North Africa",
-                                                },
-                                                {
-                                                    "label": "North America",
-                                                    "value": "North America",
-                                                },
-                                                {
-                                                    "label": "South Asia",
-                                                    "value": "South Asia",
-                                                },
-                                                {
-                                                    "label": "Sub-Saharan Africa",
-                                                    "value": "Sub-Saharan Africa",
-                                                },
-                                            ],
-                                            # Set height between dropdown options
-                                            optionHeight=35,
-                                            # Initially set to show all regions in treemap and choropleth figure
-                                            value="All regions",
-                                            # Allow user to search available values
-                                            searchable=True,
-                                            # Default text shown if nothing selected
-                                            placeholder="Please select...",
-                                            # Allow user to clear selected value
-                                            clearable=True,
-                                            style={"width": "100%"},
-                                            # Allow last selected option to remain if user refreshes browser tab
-                                            persistence=True,
-                                            persistence_type="session",
-                                            className="border rounded",
-                                        ),
-                                    ],
-                                    class_name="border border-white",
-                                ),
-                                # Add tree map figure and title to be updated via callback
-                                html.H5(id="tree-map-title", className="my-3"),
-                                dbc.Card(
-                                    [
-                                        dcc.Graph(id="tree-map-regions"),
-                                    ],
-                                    # Center tree map figure in card and change spacing and position
-                                    className="",
-                                ),
-                            ],
-                            className="my-2",
-                        ),
-                    ],
-                    width=5,
-                    className="my-2 p-2",
-                    # Add column widths to reposition column position for smaller screens
-                    xs=12,
-                    sm=12,
-                    md=12,
-                    lg=12,
-                    xl=5,
-                ),
-                dbc.Col(
-                    [
-                        # Add title of chart here, smaller than main dashboard title
-                        html.H4(
-                            [
-                                "International Tourist Arrivals per Country by Year and Region"
-                            ]
-                        ),
-                        # Add the choropleth figure in a card, updated via callback
-                        dbc.Card(
-                            [
-                                dcc.Graph(id="choropleth"),
-                            ],
-                            # Align figure in centre of card and increase padding
-                            class_name="d-flex align-items-center justify-content-center p-2 py-5",
-                        ),
-                    ],
-                    width=7,
-                    # Add column widths to reposition column position for smaller screens
-                    xs=12,
-                    sm=12,
-                    md=12,
-                    lg=12,
-                    xl=7,
-                ),
-            ],
-            justify="center",
-        ),
-        # Second Row Here
-        dbc.Row(
-            [
-                dbc.Col(
-                    [
-                        # Add id for graph title output from callback
-                        html.H4(id="bar-10yr-average-title", className="text-dark"),
-                        dbc.Card(
-                            [
-                                html.Label(
-                                    ["Choose between top 1 to top 15 countries"],
-                                    className="text-dark",
-                                ),
-                                dcc.Slider(
-                                    # Set slider options from 1 and 15 with initial value at 10
-                                    min=1,
-                                    max=15,
-                                    step=1,
-                                    value=10,
-                                    # Add tooltip to make clear what year is selected
-                                    tooltip={
-                                        "placement": "bottom",
-                                        "always_visible": True,
-                                    },
-                                    updatemode="mouseup",
-                                    # Allow last slider selection to stay when browser refreshed for convenience
-                                    persistence=True,
-                                    persistence_type="session",
-                                    id="top-x-slider",
-                                ),
-                            ],
-                            class_name="p-2 my-2",
-                        ),
-                        dbc.Card(
-                            [
-                                dcc.Graph(
-                                    # Create id to output bar figure using callback
-                                    id="bar-10yr-average",
-                                ),
-                            ],
-                            class_name="p-2",
-                        ),
-                    ]
-                )
-            ]
-        ),
-        html.Br(),
-    ],
-)
+# Value of the year summary selector showing the year in the year field, the
+# other options summarise the years of the range slider, by default the
+# pre-COVID decade
+SINGLE_YEAR = "year"
+DEFAULT_YEAR_RANGE = [2010, 2019]
+YEAR_AGGREGATE_OPTIONS = [
+    {"label": "Single year", "value": SINGLE_YEAR},
+    {"label": "Total", "value": dm.WINDOW_SUM},
+    {"label": "Average", "value": dm.WINDOW_MEAN},
+    {"label": "Lowest", "value": dm.WINDOW_MIN},
+    {"label": "Highest", "value": dm.WINDOW_MAX},
+    {"label": "Growth", "value": dm.WINDOW_GROWTH},
+]
 
 
-@callback(
-    [
-        Output("choropleth", "figure"),
-        Output("tree-map-regions", "figure"),
-        Output("tree-map-title", "children"),
-    ],
-    [Input("submit_button", "n_clicks"), Input("region-dropdown", "value")],
-    [State("input_year_field", "value")],
-)
-def update_output(number_clicks, selected_region, year_selected):
+def layout(prerender_figures=False, **kwargs):
+    """
+    Create the page layout each time the page is loaded, with the figures for
+    the default year, region and number of countries already drawn, so no
+    callbacks are needed when the page loads.
+
+    :param prerender_figures: True when the page is loaded in the browser, dash also
+        builds the layout when the app starts to validate the callbacks, which only needs the ids
+    :param kwargs: Query string parameters passed by dash pages, not used
+    :return: Dash bootstrap container with the page contents
+    """
+    fig_choropleth = fig_tree_map_regions = fig_bar_chart_top_x_countries = None
+    tree_map_title = fig_bar_chart_title_text = None
+
+    if prerender_figures:
+        # Use the same dataset version for every prerendered figure
+        store = ds.get_data_store()
+
+        # Figures are added as cached pre-encoded JSON, as in the callbacks
+        fig_choropleth = cc.create_choropleth_map.encoded(
+            DEFAULT_YEAR, DEFAULT_REGION, store=store
+        )
+        fig_tree_map_regions = cc.create_tree_map.encoded(
+            DEFAULT_YEAR, DEFAULT_REGION, store=store
+        )
+        tree_map_title = (
+            f"Distribution of Arrivals in {DEFAULT_REGION} in {DEFAULT_YEAR}"
+        )
+        fig_bar_chart_top_x_countries = cc.bar_chart_top_x_tourism_countries.encoded(
+            DEFAULT_TOP_X_COUNTRIES, store=store
+        )
+        fig_bar_chart_title_text = f"Top {DEFAULT_TOP_X_COUNTRIES} countries for international tourist arrivals"
+
+    # Wraps content of the dash app page in a responsive width dbc container
+    return dbc.Container(
+        fluid=True,
+        children=[
+            # Use dbc to split page into rows and columns
+            # First row here
+            dbc.Row(
+                [
+                    # Column containing options and treemap
+                    dbc.Col(
+                        [
+                            html.Label(
+                                [
+                                    "Choose with arrows, or type a year between 1995 and 2020"
+                                ]
+                            ),
+                            dbc.Row(
+                                [
+                                    # Add input field to enter year as a number, numeric type
+                                    # Make field red if nothing entered or anything other than the specified type or range
+                                    dcc.Input(
+                                        id="input_year_field",
+                                        type="number",
+                                        # Set debounce as true
+                                        inputMode="numeric",
+                                        debounce=True,
+                                        # Set pre-selected value to 2019
+                                        value=DEFAULT_YEAR,
+                                        # Set min and max to year range of available data columns
+                                        max=2020,
+                                        min=1995,
+                                        step=1,
+                                        required=True,
+                                        # Increase padding, add rounded grey border
+                                        className="p-1 rounded border border-secondary",
+                                    ),
+                                    # Add button to submit chosen year to update graphs only when it's clicked
+                                    html.Button(
+                                        id="submit_button",
+                                        n_clicks=0,
+                                        children="Submit",
+                                        className="my-1 rounded border-secondary",
+                                    ),
+                                    # Increase padding, horizontal gutter and change positioning for better visual appearance
+                                ],
+                                className="p-2 gx-3 my-0 py-0",
+                            ),
+                            # Choose to show a summary of a range of years instead of one year
+                            html.Label(["Or summarise a range of years"]),
+                            dbc.RadioItems(
+                                id="year-aggregate",
+                                options=YEAR_AGGREGATE_OPTIONS,
+                                value=SINGLE_YEAR,
+                                inline=True,
+                            ),
+                            dcc.RangeSlider(
+                                id="year-range-slider",
+                                min=1995,
+                                max=2020,
+                                step=1,
+                                value=DEFAULT_YEAR_RANGE,
+                                # Label every fifth year to stop the marks overlapping
+                                marks={
+                                    year: str(year) for year in range(1995, 2021, 5)
+                                },
+                                tooltip={"placement": "bottom"},
+                                # Only update the figures when the handle is released
+                                updatemode="mouseup",
+                            ),
+                            dbc.Col(
+                                [
+                                    html.Label(
+                                        ["Filter by Region"], className="text-dark"
+                                    ),
+                                    # Place region selector dropdown in card
+                                    dbc.Card(
+                                        [
+                                            dcc.Dropdown(
+                                                id="region-dropdown",
+                                                # Give options dictionary for each region and All regions
+                                                options=[
+                                                    {
+                                                        "label": "All regions",
+                                                        "value": "All regions",
+                                                    },
+                                                    {
+                                                        "label": "East Asia & Pacific",
+                                                        "value": "East Asia & Pacific",
+                                                    },
+                                                    {
+                                                        "label": "Europe & Central Asia",
+                                                        "value": "Europe & Central Asia",
+                                                    },
+                                                    {
+                                                        "label": "Latin America & Caribbean",
+                                                        "value": "Latin America & Caribbean",
+                                                    },
+                                                    {
+                                                        "label": "Middle East & North Africa",
+                                                        "value": "Middle East & North Africa",
+                                                    },
+                                                    {
+                                                        "label": "North America",
+                                                        "value": "North America",
+                                                    },
+                                                    {
+                                                        "label": "South Asia",
+                                                        "value": "South Asia",
+                                                    },
+                                                    {
+                                                        "label": "Sub-Saharan Africa",
+                                                        "value": "Sub-Saharan Africa",
+                                                    },
+                                                ],
+                                                # Set height between dropdown options
+                                                optionHeight=35,
+                                                # Initially set to show all regions in treemap and choropleth figure
+                                                value=DEFAULT_REGION,
+                                                # Allow user to search available values
+                                                searchable=True,
+                                                # Default text shown if nothing selected
+                                                placeholder="Please select...",
+                                                # Allow user to clear selected value
+                                                clearable=True,
+                                                style={"width": "100%"},
+                                                # Allow last selected option to remain if user refreshes browser tab
+                                                persistence=True,
+                                                persistence_type="session",
+                                                className="border rounded",
+                                            ),
+                                        ],
+                                        class_name="border border-white",
+                                    ),
+                                    # Add tree map figure and title to be updated via callback
+                                    html.H5(
+                                        tree_map_title,
+                                        id="tree-map-title",
+                                        className="my-3",
+                                    ),
+                                    dbc.Card(
+                                        [
+                                            dcc.Graph(
+                                                id="tree-map-regions",
+                                                figure=fig_tree_map_regions,
+                                            ),
+                                        ],
+                                        # Center tree map figure in card and change spacing and position
+                                        className="",
+                                    ),
+                                ],
+                                className="my-2",
+                            ),
+                        ],
+                        width=5,
+                        className="my-2 p-2",
+                        # Add column widths to reposition column position for smaller screens
+                        xs=12,
+                        sm=12,
+                        md=12,
+                        lg=12,
+                        xl=5,
+                    ),
+                    dbc.Col(
+                        [
+                            # Add title of chart here, smaller than main dashboard title
+                            html.H4(
+                                [
+                                    "International Tourist Arrivals per Country by Year and Region"
+                                ]
+                            ),
+                            # Add the choropleth figure in a card, updated via callback
+                            dbc.Card(
+                                [
+                                    dcc.Graph(id="choropleth", figure=fig_choropleth),
+                                    # Holds the figures and values of every year for the selected region
+                                    dcc.Store(id="region-years-store"),
+                                    # Holds the region to request the values of every year for
+                                    dcc.Store(id="region-years-request"),
+                                ],
+                                # Align figure in centre of card and increase padding
+                                class_name="d-flex align-items-center justify-content-center p-2 py-5",
+                            ),
+                        ],
+                        width=7,
+                        # Add column widths to reposition column position for smaller screens
+                        xs=12,
+                        sm=12,
+                        md=12,
+                        lg=12,
+                        xl=7,
+                    ),
+                ],
+                justify="center",
+            ),
+            # Second Row Here
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [
+                            # Add id for graph title output from callback
+                            html.H4(
+                                fig_bar_chart_title_text,
+                                id="bar-10yr-average-title",
+                                className="text-dark",
+                            ),
+                            dbc.Card(
+                                [
+                                    html.Label(
+                                        ["Choose between top 1 to top 15 countries"],
+                                        className="text-dark",
+                                    ),
+                                    dcc.Slider(
+                                        # Set slider options from 1 and 15 with initial value at 10
+                                        min=1,
+                                        max=15,
+                                        step=1,
+                                        value=DEFAULT_TOP_X_COUNTRIES,
+                                        # Add tooltip to make clear what year is selected
+                                        tooltip={
+                                            "placement": "bottom",
+                                            "always_visible": True,
+                                        },
+                                        updatemode="mouseup",
+                                        # Allow last slider selection to stay when browser refreshed for convenience
+                                        persistence=True,
+                                        persistence_type="session",
+                                        id="top-x-slider",
+                                    ),
+                                ],
+                                class_name="p-2 my-2",
+                            ),
+                            dbc.Card(
+                                [
+                                    dcc.Graph(
+                                        # Create id to output bar figure using callback
+                                        id="bar-10yr-average",
+                                        figure=fig_bar_chart_top_x_countries,
+                                    ),
+                                ],
+                                class_name="p-2",
+                            ),
+                        ]
+                    )
+                ]
+            ),
+            html.Br(),
+        ],
+    )
+
+
+def update_output(number_clicks, selected_region, year_selected, year_aggregate):
     """
     Call back to update choropleth and tree map, as well as the tree map title when the year and/or region is changed
 
     :param number_clicks: Counts number of clicks of submit button, so state input for year is only updated when clicked
     :param selected_region: Value of selected region from region dropdown
     :param year_selected: Value of specific year chosen in input via typing or clicking arrows
+    :param year_aggregate: Value of the year summary selector, the figures are only for one year if it is "year"
     :return: Figure for choropleth and tree map and tree map title, filtered by year and region
     """
 
-    # Prevent updates to chorpleth figure if no year selected
-    if year_selected is None:
+    # Prevent updates to chorpleth figure if no year selected, or if a range
+    # of years is shown, which update_year_range_figures updates
+    if year_selected is None or year_aggregate != SINGLE_YEAR:
         raise PreventUpdate
     else:
-        # Don't show all regions on one treemap as it is too many segments
-        if selected_region == "All regions":
-            # Show middle east region instead
-            fig_choropleth = cc.create_choropleth_map(year_selected, selected_region)
-            fig_tree_map_regions = cc.create_tree_map(
-                year_selected, "Middle East & North Africa"
+        # Use the same dataset version for both figures even if data reloads
+        store = ds.get_data_store()
+
+        # Figures already shown in the browser from the prerendered page
+        # layout only need their trace data replaced
+        if PATCH_FIGURES:
+            fig_choropleth = cc.create_choropleth_patch(
+                year_selected, selected_region, store=store
+            )
+            fig_tree_map_regions = cc.create_tree_map_patch(
+                year_selected, selected_region, store=store
             )
-            tree_map_title = f"Distribution of Arrivals in Middle East & North Africa in {year_selected}"
         else:
-            # Run external helper function to create choropleth graph figure
-            fig_choropleth = cc.create_choropleth_map(year_selected, selected_region)
-
-            fig_tree_map_regions = cc.create_tree_map(year_selected, selected_region)
-
-            tree_map_title = (
-                f"Distribution of Arrivals in {selected_region} in {year_selected}"
+            # Figures are returned as cached pre-encoded JSON for faster responses
+            fig_choropleth = cc.create_choropleth_map.encoded(
+                year_selected, selected_region, store=store
+            )
+            fig_tree_map_regions = cc.create_tree_map.encoded(
+                year_selected, selected_region, store=store
             )
 
+        tree_map_title = (
+            f"Distribution of Arrivals in {selected_region} in {year_selected}"
+        )
+
         return fig_choropleth, fig_tree_map_regions, tree_map_title
 
     i
 
 
+def update_region_years(selected_region):
+    """
+    Call back to send the choropleth and tree map values of every year for the selected region to the browser
+
+    :param selected_region: Value of selected region from region dropdown
+    :return: Figures for the latest year and the values for each year, used by the client side year callback
+    """
+    if selected_region is None:
+        raise PreventUpdate
+
+    return cc.create_region_years_data(
+        selected_region,
+        selected_region,
+        store=ds.get_data_store(),
+    )
+
+
+# Request the values of every year when the region has none loaded yet
+REQUEST_REGION_YEARS_JS = """
+function(number_clicks, selected_region, region_years) {
+    if (!selected_region || (region_years && region_years.region === selected_region)) {
+        return window.dash_clientside.no_update;
+    }
+    return selected_region;
+}
+"""
+
+
+# Copy the latest year figures and swap in the values of the selected year,
+# unless a range of years is shown
+UPDATE_YEAR_FIGURES_JS = """
+function(number_clicks, region_years, year_selected, year_aggregate) {
+    const no_update = window.dash_clientside.no_update;
+    if (!region_years || year_selected === null || year_selected === undefined
+            || (year_aggregate && year_aggregate !== "year")) {
+        return [no_update, no_update, no_update];
+    }
+    const year = String(year_selected);
+    const tree_map_year = region_years.tree_map_years[year];
+    if (!(year in region_years.choropleth_z) || !tree_map_year) {
+        return [no_update, no_update, no_update];
+    }
+
+    const choropleth = region_years.choropleth;
+    const fig_choropleth = {
+        ...choropleth,
+        data: [{...choropleth.data[0], z: region_years.choropleth_z[year]}],
+    };
+
+    // The drill-down tree map of all regions keeps its squares, the tree map
+    // of a region has its countries in the order of the year
+    const tree_map = region_years.tree_map;
+    const tree_map_trace = tree_map.data[0];
+    const tree_map_squares = tree_map_year.labels ? {
+        ids: tree_map_year.labels,
+        labels: tree_map_year.labels,
+        parents: tree_map_year.labels.map(() => ""),
+    } : {};
+    const fig_tree_map_regions = {
+        ...tree_map,
+        data: [{
+            ...tree_map_trace,
+            ...tree_map_squares,
+            values: tree_map_year.values,
+            marker: {...tree_map_trace.marker, colors: tree_map_year.colors},
+        }],
+    };
+
+    const tree_map_title = `Distribution of Arrivals in ${region_years.tree_map_region} in ${year}`;
+    return [fig_choropleth, fig_tree_map_regions, tree_map_title];
+}
+"""
+
+if CLIENTSIDE_YEARS:
+    # Only a region change calls the server, a year change is drawn in the browser
+    clientside_callback(
+        REQUEST_REGION_YEARS_JS,
+        Output("region-years-request", "data"),
+        [Input("submit_button", "n_clicks"), Input("region-dropdown", "value")],
+        [State("region-years-store", "data")],
+        prevent_initial_call=True,
+    )
+
+    callback(
+        Output("region-years-store", "data"),
+        Input("region-years-request", "data"),
+        prevent_initial_call=True,
+    )(update_region_years)
+
+    clientside_callback(
+        UPDATE_YEAR_FIGURES_JS,
+        [
+            Output("choropleth", "figure"),
+            Output("tree-map-regions", "figure"),
+            Output("tree-map-title", "children"),
+        ],
+        [Input("submit_button", "n_clicks"), Input("region-years-store", "data")],
+        [State("input_year_field", "value"), State("year-aggregate", "value")],
+        prevent_initial_call=True,
+    )
+else:
+    callback(
+        [
+            Output("choropleth", "figure"),
+            Output("tree-map-regions", "figure"),
+            Output("tree-map-title", "children"),
+        ],
+        [Input("submit_button", "n_clicks"), Input("region-dropdown", "value")],
+        [State("input_year_field", "value"), State("year-aggregate", "value")],
+        prevent_initial_call=True,
+    )(update_output)
+
+# Figures are prerendered for the default inputs, so only call the callbacks
+# when the page loads if the browser session restored different inputs
+helper.resend_persisted_values(
+    ["region-dropdown", "top-x-slider"], [DEFAULT_REGION, DEFAULT_TOP_X_COUNTRIES]
+)
+
+
+def create_top_x_bar_chart(top_x_countries, year_aggregate, year_range, store):
+    """
+    Create the top countries bar chart and its title, for the 10-year average
+    or for a summary of the selected range of years.
+
+    :param top_x_countries: A number between 1 and 15 for top 1 to 15 countries
+    :param year_aggregate: Value of the year summary selector
+    :param year_range: First and last year of the range slider
+    :param store: Dataset version to use
+    :return: Pre-encoded bar chart figure and title text
+    """
+    if year_aggregate == SINGLE_YEAR:
+        fig_bar_chart_top_x_countries = cc.bar_chart_top_x_tourism_countries.encoded(
+            top_x_countries, store=store
+        )
+        fig_bar_chart_title_text = (
+            f"Top {top_x_countries} countries for international tourist arrivals"
+        )
+    else:
+        first_year, last_year = year_range
+        fig_bar_chart_top_x_countries = cc.bar_chart_top_x_range.encoded(
+            top_x_countries, first_year, last_year, year_aggregate, store=store
+        )
+        fig_bar_chart_title_text = (
+            f"Top {top_x_countries} countries for "
+            f"{cc.WINDOW_LABELS[year_aggregate].lower()} in {first_year}-{last_year}"
+        )
+    return fig_bar_chart_top_x_countries, fig_bar_chart_title_text
+
+
 @callback(
     [
         Output("bar-10yr-average", "figure"),
         Output("bar-10yr-average-title", "children"),
     ],
     Input("top-x-slider", "value"),
+    [State("year-aggregate", "value"), State("year-range-slider", "value")],
+    prevent_initial_call=True,
 )
-def update_topx_tourism_graph(top_x_countries):
+def update_topx_tourism_graph(top_x_countries, year_aggregate, year_range):
     """
     Call back for updating bar chart figure and title when slider value changed.
 
     :param top_x_countries: A number between 1 and 15 for top 1 to 15 countries
+    :param year_aggregate: Value of the year summary selector
+    :param year_range: First and last year of the range slider
     :return: figure of plotly bar chart created in external file and title text that update depending on chosen value
     """
-    fig_bar_chart_top_x_countries = cc.bar_chart_top_x_tourism_countries(
-        top_x_countries
+    return create_top_x_bar_chart(
+        top_x_countries, year_aggregate, year_range, ds.get_data_store()
     )
 
-    fig_bar_chart_title_text = (
-        f"Top {top_x_countries} countries for international tourist arrivals"
+
+@callback(
+    [
+        Output("choropleth", "figure", allow_duplicate=True),
+        Output("tree-map-regions", "figure", allow_duplicate=True),
+        Output("tree-map-title", "children", allow_duplicate=True),
+        Output("bar-10yr-average", "figure", allow_duplicate=True),
+        Output("bar-10yr-average-title", "children", allow_duplicate=True),
+    ],
+    [
+        Input("year-aggregate", "value"),
+        Input("year-range-slider", "value"),
+        Input("region-dropdown", "value"),
+    ],
+    [State("input_year_field", "value"), State("top-x-slider", "value")],
+    prevent_initial_call=True,
+)
+def update_year_range_figures(
+    year_aggregate, year_range, selected_region, year_selected, top_x_countries
+):
+    """
+    Call back to update the choropleth, tree map and top countries bar chart
+    with a summary of a range of years, e.g. the total arrivals from 2010 to 2019.
+
+    The summaries are read from running totals of every country, so any range
+    takes the same time. When the selector is set back to a single year, the
+    figures for the year in the year field are shown again.
+
+    :param year_aggregate: Value of the year summary selector
+    :param year_range: First and last year of the range slider
+    :param selected_region: Value of selected region from region dropdown
+    :param year_selected: Value of specific year chosen in input
+    :param top_x_countries: A number between 1 and 15 for top 1 to 15 countries
+    :return: Figures for choropleth, tree map and bar chart and the tree map and bar chart titles
+    """
+    if selected_region is None or not year_range:
+        raise PreventUpdate
+    if year_aggregate == SINGLE_YEAR:
+        # The single year callbacks update the figures, except when switching
+        # back from a range of years
+        if dash.ctx.triggered_id != "year-aggregate" or year_selected is None:
+            raise PreventUpdate
+
+    # Use the same dataset version for every figure even if data reloads
+    store = ds.get_data_store()
+    top_x_countries = top_x_countries or DEFAULT_TOP_X_COUNTRIES
+
+    if year_aggregate == SINGLE_YEAR:
+        # Full figures, as the figures shown are for the range of years
+        fig_choropleth = cc.create_choropleth_map.encoded(
+            year_selected, selected_region, store=store
+        )
+        fig_tree_map_regions = cc.create_tree_map.encoded(
+            year_selected, selected_region, store=store
+        )
+        tree_map_title = (
+            f"Distribution of Arrivals in {selected_region} in {year_selected}"
+        )
+    else:
+        first_year, last_year = year_range
+        fig_choropleth = cc.create_choropleth_map_range.encoded(
+            first_year, last_year, year_aggregate, selected_region, store=store
+        )
+        fig_tree_map_regions = cc.create_tree_map_range.encoded(
+            first_year, last_year, year_aggregate, selected_region, store=store
+        )
+        tree_map_title = (
+            f"Distribution of {cc.WINDOW_LABELS[year_aggregate]} in "
+            f"{selected_region} in {first_year}-{last_year}"
+        )
+
+    fig_bar_chart_top_x_countries, fig_bar_chart_title_text = create_top_x_bar_chart(
+        top_x_countries, year_aggregate, year_range, store
     )
 
-    return fig_bar_chart_top_x_countries, fig_bar_chart_title_text
+    return (
+        fig_choropleth,
+        fig_tree_map_regions,
+        tree_map_title,
+        fig_bar_chart_top_x_countries,
+        fig_bar_chart_title_text,
+    )
@@ -1,22 +1,66 @@
 """Contain the contents for the second page in multi-page app"""
+import math
 import dash
-from dash import html, dcc, Dash, Input, Output, State, callback
+from dash import html, dcc, Dash, Input, Output, State, callback, clientside_callback
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import create_charts as cc
+import data_store as ds
+import derived_metrics as dm
+import exports
 import helper_functions as helper
+import jobs
 import plotly.graph_objs as go
 
 
-# Import global prepared dataframe from Tourism dataset
-df_arrivals_prepared = helper.load_dataframe()
+dash.register_page(__name__)
 
-# Get list of country names from corresponding column
-country_names_list = df_arrivals_prepared["Country Name"].unique()
+# Default countries, the page layout is prerendered with their figures
+DEFAULT_COUNTRY = "Armenia"
+DEFAULT_COMPARE_COUNTRY_1 = "Bermuda"
+DEFAULT_COMPARE_COUNTRY_2 = "Bangladesh"
 
-dash.register_page(__name__)
+# Milliseconds between checks of the progress of a download being prepared
+EXPORT_POLL_INTERVAL_MS = 500
+
+
+def layout(prerender_figures=False, **kwargs):
+    """
+    Create the page layout each time the page is loaded, so the country
+    dropdowns use the current dataset version if the data has been reloaded.
+
+    The figures and statistics card for the default countries are already
+    drawn, so no callbacks are needed when the page loads.
+
+    :param prerender_figures: True when the page is loaded in the browser, dash also
+        builds the layout when the app starts to validate the callbacks, which only needs the ids
+    :param kwargs: Query string parameters passed by dash pages, not used
+    :return: Dash bootstrap container with the page contents
+    """
+    # Use the same dataset version for the dropdowns and prerendered figures
+    store = ds.get_data_store()
 
-layout = (
-    dbc.Container(
+    # Get list of country names from the shared Tourism dataset store
+    country_names_list = store.country_names
+
+    fig_line_per_country = fig_compare_countries_line = None
+    line_per_country_title = line_compare_chart_title = stats_card = None
+
+    if prerender_figures:
+        # Figures are added as cached pre-encoded JSON, as in the callbacks
+        fig_line_per_country = cc.create_line_per_country.encoded(
+            DEFAULT_COUNTRY, store=store
+        )
+        line_per_country_title = f"Trends in tourist arrivals for {DEFAULT_COUNTRY}"
+        stats_card = create_stats_card(DEFAULT_COUNTRY, store)
+        fig_compare_countries_line = cc.create_line_chart_compare_countries.encoded(
+            DEFAULT_COMPARE_COUNTRY_1, DEFAULT_COMPARE_COUNTRY_2, store=store
+        )
+        line_compare_chart_title = create_compare_title(
+            DEFAULT_COMPARE_COUNTRY_1, DEFAULT_COMPARE_COUNTRY_2
+        )
+
+    return dbc.Container(
         fluid=True,
         children=[
             # First row here for line plot for one country
@@ -35,7 +79,7 @@ layout = (
                                 ],
                                 # Set height between dropdown options
                                 optionHeight=35,
-                                value="Armenia",
+                                value=DEFAULT_COUNTRY,
                                 # Allow user to search available values
                                 searchable=True,
                                 # Default text shown if nothing selected
@@ -47,7 +91,10 @@ layout = (
                                 persistence_type="session",
                             ),
                             html.Br(),
-                            html.Div(id="stats-card"),
+                            html.Div(
+                                stats_card,
+                                id="stats-card",
+                            ),
                         ],
                         width=3,
                         # Increase vertical spacing to align with graph card
@@ -64,11 +111,17 @@ layout = (
                     dbc.Col(
                         [
                             # Add callback output title for line for one country
-                            html.H4(id="line-per-country-title"),
+                            html.H4(
+                                line_per_country_title,
+                                id="line-per-country-title",
+                            ),
                             # Increase padding to stop chart corners extruding rounded card corners
                             dbc.Card(
                                 [
-                                    dcc.Graph(id="line-per-country"),
+                                    dcc.Graph(
+                                        id="line-per-country",
+                                        figure=fig_line_per_country,
+                                    ),
                                 ],
                                 className="p-1 px-2",
                             ),
@@ -99,7 +152,7 @@ layout = (
                                 ],
                                 # Set height between dropdown options
                                 optionHeight=35,
-                                value="Bermuda",
+                                value=DEFAULT_COMPARE_COUNTRY_1,
                                 # Allow user to search available values
                                 searchable=True,
                                 # Default text shown if nothing selected
@@ -119,7 +172,7 @@ layout = (
                                     for country in country_names_list
                                 ],
                                 optionHeight=35,
-                                value="Bangladesh",
+                                value=DEFAULT_COMPARE_COUNTRY_2,
                                 searchable=True,
                                 placeholder="Select second country...",
                                 clearable=False,
@@ -140,11 +193,17 @@ layout = (
                     ),
                     dbc.Col(
                         [
-                            html.H4(id="line-compare-countries-title"),
+                            html.H4(
+                                line_compare_chart_title,
+                                id="line-compare-countries-title",
+                            ),
                             # Increase padding to stop chart corners extruding rounded card corners
                             dbc.Card(
                                 [
-                                    dcc.Graph(id="line-compare-countries"),
+                                    dcc.Graph(
+                                        id="line-compare-countries",
+                                        figure=fig_compare_countries_line,
+                                    ),
                                 ],
                                 className="p-1",
                             ),
@@ -160,70 +219,144 @@ layout = (
                 ],
                 justify="center",
             ),
-            # Final row on page for download button
+            # Final row on page for the download options and button
             dbc.Row(
                 [
                     html.H5(
-                        "Click to download the dataset as an Excel file",
+                        "Click to download the dataset, or choose a region, years and countries to download",
                         className="d-flex justify-content-center gy-3 fw-bold",
                     ),
                     dbc.Col(
                         [
                             dbc.Card(
                                 [
-                                    # Add download button for user to download data as excel file in callback
-                                    html.Button(
-                                        "Download data as Excel",
-                                        id="excel-download-button",
+                                    # Choose the file format of the download
+                                    dbc.RadioItems(
+                                        id="export-format",
+                                        options=[
+                                            {
+                                                "label": exports.EXPORT_FORMAT_NAMES[
+                                                    export_format
+                                                ],
+                                                "value": export_format,
+                                            }
+                                            # Only the formats the server can write
+                                            for export_format in exports.EXPORT_FORMATS
+                                        ],
+                                        value="xlsx",
+                                        inline=True,
+                                    ),
+                                    html.Label("Region"),
+                                    dcc.Dropdown(
+                                        id="export-region",
+                                        options=[
+                                            {"label": region_name, "value": region_name}
+                                            for region_name in [ds.ALL_REGIONS]
+                                            + store.region_names
+                                        ],
+                                        value=ds.ALL_REGIONS,
+                                        clearable=False,
+                                    ),
+                                    html.Label("Years"),
+                                    dcc.RangeSlider(
+                                        id="export-years",
+                                        min=store.years[0],
+                                        max=store.years[-1],
+                                        step=1,
+                                        value=[store.years[0], store.years[-1]],
+                                        # Label every fifth year to stop the marks overlapping
+                                        marks={
+                                            year: str(year) for year in store.years[::5]
+                                        },
+                                        tooltip={"placement": "bottom"},
+                                    ),
+                                    html.Label("Countries"),
+                                    dcc.Dropdown(
+                                        id="export-countries",
+                                        options=[
+                                            {"label": country, "value": country}
+                                            for country in country_names_list
+                                        ],
+                                        multi=True,
+                                        # Default text shown if nothing selected
+                                        placeholder="All countries in the region",
+                                    ),
+                                    html.Br(),
+                                    # Prepare the file in a background job, or send it from the export cache
+                                    dbc.Button(
+                                        "Download data",
+                                        id="export-download-button",
                                         n_clicks=0,
+                                        color="light",
                                         style={"background-color": "lightgreen"},
                                     ),
-                                    dcc.Download(id="download-excel"),
-                                ]
+                                    dbc.Button(
+                                        "Cancel",
+                                        id="export-cancel-button",
+                                        n_clicks=0,
+                                        color="light",
+                                        disabled=True,
+                                        className="mt-2",
+                                    ),
+                                    # Progress of the background job, checked at an interval while it runs
+                                    dbc.Progress(
+                                        id="export-progress", value=0, className="my-2"
+                                    ),
+                                    html.Div(id="export-status"),
+                                    # Link to the prepared file, in case the download did not start
+                                    html.A(id="export-save-link"),
+                                    dcc.Interval(
+                                        id="export-job-interval",
+                                        interval=EXPORT_POLL_INTERVAL_MS,
+                                        disabled=True,
+                                    ),
+                                    dcc.Store(id="export-job"),
+                                    dcc.Store(id="export-cancelled"),
+                                    dcc.Store(id="export-result"),
+                                ],
+                                className="p-3",
                             )
                         ],
                         width=6,
+                        # Reposition column position for smaller screens
+                        xs=12,
+                        sm=12,
+                        md=8,
+                        lg=6,
+                        xl=6,
                     ),
                 ],
                 justify="center",
             ),
             html.Br(),
         ],
-    ),
-)
+    )
 
 
-@callback(
-    [
-        Output("line-per-country", "figure"),
-        Output("line-per-country-title", "children"),
-        Output("stats-card", "children"),
-    ],
-    [Input("dropdown-line-per-country", "value")],
-)
-def update_country_line_and_stats_card(country_name):
+def create_stats_card(country_name, store):
     """
-    Callback to updates line plot figure and title per country value selected in dropwdown.
-    """
-    # Call helper function to create line plot, given callback input
-    fig_line_per_country = cc.create_line_per_country(country_name)
-
-    # Set dataframe to the country name
-    df_arrivals_reset_index = df_arrivals_prepared.set_index("Country Name")
+    Create the card with the 10-year average, peak and lowest arrivals of a country,
+    and its growth before and recovery since Covid-19.
 
+    :param country_name: Name of country selected in dropdown
+    :param store: Dataset version to get the statistics from
+    :return: Dash bootstrap card with the statistics
+    """
     # Get minimum, maximum and 10-year average values per country
-    average_10yr_per_country = df_arrivals_reset_index.loc[
+    average_10yr_per_country = store.stat(
         country_name, "10-year Average in tourist arrivals"
-    ]
-    max_value_per_country = df_arrivals_reset_index.loc[
-        country_name, "Max number of arrivals"
-    ]
-    min_value_per_country = df_arrivals_reset_index.loc[
-        country_name, "Minimum number of arrivals"
-    ]
+    )
+    max_value_per_country = store.stat(country_name, "Max number of arrivals")
+    min_value_per_country = store.stat(country_name, "Minimum number of arrivals")
+
+    # Read the growth metrics computed once for all countries of this version
+    derived_metrics = dm.get_derived_metrics(store)
+    cagr_per_country = derived_metrics.value(country_name, dm.CAGR)
+    recovery_ratio_per_country = derived_metrics.value(country_name, dm.RECOVERY_RATIO)
+    pre_covid_peak_year = derived_metrics.value(country_name, dm.PRE_COVID_PEAK_YEAR)
 
     # Generate the bootstrap format card with statistics
-    stats_card = dbc.Card(
+    return dbc.Card(
         children=[
             dbc.CardHeader(
                 [
@@ -264,12 +397,80 @@ def update_country_line_and_stats_card(country_name):
                         className="card-text text-danger fw-bolder",
                     ),
                     html.Br(),
+                    # Add growth and recovery as smaller grey text below the arrivals
+                    html.H6(
+                        f"Growth per year {derived_metrics.trend_first_year}-"
+                        f"{derived_metrics.trend_last_year}:",
+                        className="card-title text-secondary",
+                    ),
+                    html.H5(
+                        format_metric(cagr_per_country, "{:+.2%}"),
+                        className="card-text text-secondary fw-bold",
+                    ),
+                    html.H6(
+                        f"{store.years[-1]} arrivals vs pre-COVID peak"
+                        + format_metric(pre_covid_peak_year, " ({:.0f})", "")
+                        + ":",
+                        className="card-title text-secondary",
+                    ),
+                    html.H5(
+                        format_metric(recovery_ratio_per_country, "{:.0%}"),
+                        className="card-text text-secondary fw-bold",
+                    ),
                 ],
                 className="py-3",
             ),
         ],
     )
 
+
+def format_metric(value, format_string, missing_text="No data"):
+    """
+    Format a derived metric for the stats card.
+
+    :param value: Float value, NaN if it is missing
+    :param format_string: Format string for the value, e.g. "{:.0%}"
+    :param missing_text: Text shown if the value is missing
+    :return: Formatted text
+    """
+    if math.isnan(value):
+        return missing_text
+    return format_string.format(value)
+
+
+def create_compare_title(country_name_1, country_name_2):
+    """
+    Create the title of the comparison line chart for 2 countries.
+
+    :param country_name_1: Name of first country selected in dropdown
+    :param country_name_2: Name of second country selected in dropdown
+    :return: Title text
+    """
+    return f"Comparison in tourist arrival trends between {country_name_1} and {country_name_2}"
+
+
+@callback(
+    [
+        Output("line-per-country", "figure"),
+        Output("line-per-country-title", "children"),
+        Output("stats-card", "children"),
+    ],
+    [Input("dropdown-line-per-country", "value")],
+    prevent_initial_call=True,
+)
+def update_country_line_and_stats_card(country_name):
+    """
+    Callback to updates line plot figure and title per country value selected in dropwdown.
+    """
+    # Use the same dataset version for the figure and card even if data reloads
+    store = ds.get_data_store()
+
+    # Call helper function to create line plot, given callback input
+    fig_line_per_country = cc.create_line_per_country.encoded(country_name, store=store)
+
+    # Generate the bootstrap format card with statistics
+    stats_card = create_stats_card(country_name, store)
+
     return (
         fig_line_per_country,
         f"Trends in tourist arrivals for {country_name}",
@@ -286,6 +487,7 @@ def update_country_line_and_stats_card(country_name):
         Input("dropdown-compare-countries-1", "value"),
         Input("dropdown-compare-countries-2", "value"),
     ],
+    prevent_initial_call=True,
 )
 def updatate_compare_line_charts_and_title(country_name_1, country_name_2):
     """
@@ -296,33 +498,169 @@ def updatate_compare_line_charts_and_title(country_name_1, country_name_2):
     :return: Figure for line chart with both selected country lines and its updated title
     """
     # Use external helper function to create combined line chart
-    fig_compare_countries_line = cc.create_line_chart_compare_countries(
-        country_name_1, country_name_2
+    fig_compare_countries_line = cc.create_line_chart_compare_countries.encoded(
+        country_name_1, country_name_2, store=ds.get_data_store()
     )
 
-    line_compare_chart_title = f"Comparison in tourist arrival trends between {country_name_1} and {country_name_2}"
+    line_compare_chart_title = create_compare_title(country_name_1, country_name_2)
 
     return fig_compare_countries_line, line_compare_chart_title
 
 
+# Figures are prerendered for the default countries, so only call the callbacks
+# when the page loads if the browser session restored different countries
+helper.resend_persisted_values(
+    [
+        "dropdown-line-per-country",
+        "dropdown-compare-countries-1",
+        "dropdown-compare-countries-2",
+    ],
+    [DEFAULT_COUNTRY, DEFAULT_COMPARE_COUNTRY_1, DEFAULT_COMPARE_COUNTRY_2],
+)
+
+
 @callback(
-    [Output("download-excel", "data")],
-    [Input("excel-download-button", "n_clicks")],
+    Output("export-job", "data"),
+    [Input("export-download-button", "n_clicks")],
+    [
+        State("export-format", "value"),
+        State("export-region", "value"),
+        State("export-years", "value"),
+        State("export-countries", "value"),
+        State("export-job", "data"),
+    ],
     prevent_initial_call=True,
 )
-def download_raw_data(excel_clicks):
+def start_export(
+    download_clicks, export_format, region_name, year_range, country_names, export_job
+):
     """
-    Callback to download raw data as excel file when download button clicked.
+    Callback to prepare the file to download when the download button is clicked.
 
-    :param country_name_1: number of clicks of the download button
-    :return: raw excel file object to pass to the download dbc function and download file
+    A file already in the export cache is downloaded straight away, others are
+    written in a background job, so the file is not built in this request.
+
+    :param download_clicks: Number of clicks of the download button
+    :param export_format: Name of the chosen file format, e.g. xlsx
+    :param region_name: Chosen region name
+    :param year_range: List of the first and last chosen years
+    :param country_names: List of chosen country names, empty for every country
+    :param export_job: Previous download, its job is cancelled if still running
+    :return: Dictionary of the download, with the job ID or the URL of the cached file
     """
-    # Set dataframe to the country name for cleaner download
-    df_arrivals_reset_index = df_arrivals_prepared.set_index("Country Name")
+    if export_job and export_job.get("job_id"):
+        jobs.cancel_job(export_job["job_id"])
+
+    store = ds.get_data_store()
+    try:
+        export_filter = exports.ExportFilter.from_values(
+            store, region_name, *(year_range or [None, None]), country_names
+        )
+    except ValueError as error:
+        return {"error": str(error), "request": download_clicks}
 
-    # If download button clicked, download data as excel
-    excel_file_raw = dcc.send_data_frame(
-        df_arrivals_reset_index.to_excel, "Tourism arrivals.xlsx", sheet_name="Main"
+    if exports.export_cache_key(store, export_format, export_filter) in (
+        exports.export_cache
+    ):
+        result_url = dash.get_relative_path(
+            f"/export/{export_format}{export_filter.query_string()}"
+        )
+        return {"result_url": result_url, "request": download_clicks}
+
+    job_id = jobs.submit_job(
+        "export",
+        exports.run_export_job,
+        export_format=export_format,
+        export_filter=export_filter,
     )
+    return {"job_id": job_id, "request": download_clicks}
+
+
+@callback(
+    [
+        Output("export-job-interval", "disabled"),
+        Output("export-progress", "value"),
+        Output("export-progress", "label"),
+        Output("export-status", "children"),
+        Output("export-cancel-button", "disabled"),
+        Output("export-result", "data"),
+    ],
+    [
+        Input("export-job", "data"),
+        Input("export-job-interval", "n_intervals"),
+        Input("export-cancelled", "data"),
+    ],
+    prevent_initial_call=True,
+)
+def update_export_progress(export_job, interval_count, cancelled_job_id):
+    """
+    Callback to show the progress of the download being prepared, checked at an
+    interval until its job finishes.
 
-    return [excel_file_raw]
+    :param export_job: Dictionary of the download returned by start_export
+    :param interval_count: Number of progress checks so far
+    :param cancelled_job_id: ID of the last job cancelled with the cancel button
+    :return: Whether to stop checking, the progress bar value and label, the status
+        text, whether to disable the cancel button and the download URL once ready
+    """
+    if not export_job:
+        raise PreventUpdate
+    if export_job.get("error"):
+        return True, 0, "", export_job["error"], True, dash.no_update
+    if export_job.get("result_url"):
+        result = {"url": export_job["result_url"], "request": export_job["request"]}
+        return True, 100, "100%", "Download ready", True, result
+
+    state = jobs.read_job(export_job["job_id"])
+    if state is None:
+        return True, 0, "", "The download has expired, please try again", True, None
+    percent = round(state["progress"] * 100)
+    if state["status"] == jobs.DONE:
+        result = {
+            "url": dash.get_relative_path(f"/jobs/{state['id']}/result"),
+            "request": export_job["request"],
+        }
+        return True, 100, "100%", "Download ready", True, result
+    if state["status"] in jobs.FINISHED_STATUSES:
+        return True, percent, f"{percent}%", state["message"], True, dash.no_update
+    # Keep checking while the job is queued or running
+    return False, percent, f"{percent}%", state["message"], False, dash.no_update
+
+
+@callback(
+    Output("export-cancelled", "data"),
+    [Input("export-cancel-button", "n_clicks")],
+    [State("export-job", "data")],
+    prevent_initial_call=True,
+)
+def cancel_export(cancel_clicks, export_job):
+    """
+    Callback to cancel the download being prepared when the cancel button is clicked.
+
+    :param cancel_clicks: Number of clicks of the cancel button
+    :param export_job: Dictionary of the download returned by start_export
+    :return: ID of the cancelled job, which updates the progress straight away
+    """
+    if not export_job or not export_job.get("job_id"):
+        raise PreventUpdate
+    jobs.cancel_job(export_job["job_id"])
+    return export_job["job_id"]
+
+
+# Start the download in the browser once the file is ready, and link to it
+DOWNLOAD_EXPORT_RESULT_JS = """
+function(export_result) {
+    if (!export_result) {
+        return [null, null];
+    }
+    window.location.assign(export_result.url);
+    return [export_result.url, "Download did not start? Click here to save the file"];
+}
+"""
+
+clientside_callback(
+    DOWNLOAD_EXPORT_RESULT_JS,
+    [Output("export-save-link", "href"), Output("export-save-link", "children")],
+    [Input("export-result", "data")],
+    prevent_initial_call=True,
+)
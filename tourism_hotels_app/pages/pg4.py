@@ -0,0 +1,224 @@
+"""Contain the contents for the regions page in multi-page app"""
+import dash
+from dash import html, dcc, Input, Output, callback
+from dash.exceptions import PreventUpdate
+import dash_bootstrap_components as dbc
+import aggregate_cube as ac
+import create_charts as cc
+import data_store as ds
+
+
+dash.register_page(__name__)
+
+# Default measure and region, the page layout is prerendered with their figures
+DEFAULT_MEASURE = ac.SUM
+DEFAULT_INCOME_GROUP_REGION = ds.ALL_REGIONS
+
+# Measures of the aggregate cube the charts can show
+MEASURE_OPTIONS = [
+    {"label": "Total arrivals", "value": ac.SUM},
+    {"label": "Average per country", "value": ac.MEAN},
+    {"label": "Countries with data", "value": ac.COUNT},
+]
+
+
+def create_income_group_title(region_name):
+    """
+    Create the title of the income group line chart for a region.
+
+    :param region_name: Region name the income groups are sliced by, or "All regions"
+    :return: Title as a string
+    """
+    return f"Tourist arrivals by income group in {region_name}"
+
+
+def layout(prerender_figures=False, **kwargs):
+    """
+    Create the page layout each time the page is loaded, so the region
+    dropdown uses the current dataset version if the data has been reloaded.
+
+    The figures for the default measure and region are already drawn, so no
+    callbacks are needed when the page loads.
+
+    :param prerender_figures: True when the page is loaded in the browser, dash also
+        builds the layout when the app starts to validate the callbacks, which only needs the ids
+    :param kwargs: Query string parameters passed by dash pages, not used
+    :return: Dash bootstrap container with the page contents
+    """
+    # Use the same dataset version for the dropdown and prerendered figures
+    store = ds.get_data_store()
+
+    fig_region_line = fig_income_group_line = income_group_title = None
+
+    if prerender_figures:
+        # Figures are added as cached pre-encoded JSON, as in the callbacks
+        fig_region_line = cc.create_group_line_chart.encoded(
+            ac.REGION, DEFAULT_MEASURE, ds.ALL_REGIONS, store=store
+        )
+        fig_income_group_line = cc.create_group_line_chart.encoded(
+            ac.INCOME_GROUP,
+            DEFAULT_MEASURE,
+            DEFAULT_INCOME_GROUP_REGION,
+            store=store,
+        )
+        income_group_title = create_income_group_title(DEFAULT_INCOME_GROUP_REGION)
+
+    return dbc.Container(
+        fluid=True,
+        children=[
+            # First row for the measure shown by both charts
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [
+                            html.Label(["Show"], className="me-3 fw-bold"),
+                            dbc.RadioItems(
+                                id="group-measure",
+                                options=MEASURE_OPTIONS,
+                                value=DEFAULT_MEASURE,
+                                inline=True,
+                            ),
+                        ],
+                        className="d-flex my-3",
+                        width="auto",
+                    ),
+                ],
+                justify="center",
+            ),
+            dbc.Row(
+                [
+                    # First column for the line chart of every region
+                    dbc.Col(
+                        [
+                            html.H4(["Tourist arrivals by region"]),
+                            html.Label(
+                                ["Click a region to see its income groups"],
+                                className="lead",
+                            ),
+                            # Increase padding to stop chart corners extruding rounded card corners
+                            dbc.Card(
+                                [
+                                    dcc.Graph(
+                                        id="region-line-chart",
+                                        figure=fig_region_line,
+                                    ),
+                                ],
+                                className="p-1 px-2",
+                            ),
+                        ],
+                        width=6,
+                        # Move columns on top of each other on smaller screens
+                        xs=12,
+                        sm=12,
+                        md=12,
+                        lg=6,
+                        xl=6,
+                    ),
+                    # Second column for the line chart of the income groups of a region
+                    dbc.Col(
+                        [
+                            html.H4(
+                                income_group_title,
+                                id="income-group-line-chart-title",
+                            ),
+                            dcc.Dropdown(
+                                id="income-group-region-dropdown",
+                                # Obtain region names from dataset as options
+                                options=[
+                                    {"label": region_name, "value": region_name}
+                                    for region_name in [ds.ALL_REGIONS]
+                                    + store.region_names
+                                ],
+                                value=DEFAULT_INCOME_GROUP_REGION,
+                                # Prevent user from clearing value
+                                clearable=False,
+                            ),
+                            dbc.Card(
+                                [
+                                    dcc.Graph(
+                                        id="income-group-line-chart",
+                                        figure=fig_income_group_line,
+                                    ),
+                                ],
+                                className="p-1 px-2",
+                            ),
+                        ],
+                        width=6,
+                        xs=12,
+                        sm=12,
+                        md=12,
+                        lg=6,
+                        xl=6,
+                    ),
+                ],
+                justify="center",
+            ),
+        ],
+    )
+
+
+@callback(
+    Output("region-line-chart", "figure"),
+    [Input("group-measure", "value")],
+    prevent_initial_call=True,
+)
+def update_region_line_chart(measure):
+    """
+    Callback to update the line chart of every region when the measure changes.
+
+    :param measure: Value of the selected measure radio item
+    :return: Figure for the line chart with a line per region
+    """
+    return cc.create_group_line_chart.encoded(
+        ac.REGION, measure, ds.ALL_REGIONS, store=ds.get_data_store()
+    )
+
+
+@callback(
+    Output("income-group-region-dropdown", "value"),
+    [Input("region-line-chart", "clickData")],
+    prevent_initial_call=True,
+)
+def drill_down_region(click_data):
+    """
+    Callback to show the income groups of a region when its line is clicked.
+
+    :param click_data: Click data of the region line chart
+    :return: Name of the clicked region for the income group region dropdown
+    """
+    if not click_data or not click_data.get("points"):
+        raise PreventUpdate
+
+    # Each trace is a region, in the order of the aggregate cube
+    region_names = ac.get_aggregate_cube(ds.get_data_store()).region_names
+    curve_number = click_data["points"][0].get("curveNumber")
+    if not isinstance(curve_number, int) or not 0 <= curve_number < len(region_names):
+        raise PreventUpdate
+    return region_names[curve_number]
+
+
+@callback(
+    [
+        Output("income-group-line-chart", "figure"),
+        Output("income-group-line-chart-title", "children"),
+    ],
+    [
+        Input("group-measure", "value"),
+        Input("income-group-region-dropdown", "value"),
+    ],
+    prevent_initial_call=True,
+)
+def update_income_group_line_chart(measure, region_name):
+    """
+    Callback to update the line chart of the income groups of a region, given
+    the measure and the region selected or clicked.
+
+    :param measure: Value of the selected measure radio item
+    :param region_name: Region name selected in the dropdown, or "All regions"
+    :return: Figure for the line chart with a line per income group and its title
+    """
+    fig_income_group_line = cc.create_group_line_chart.encoded(
+        ac.INCOME_GROUP, measure, region_name, store=ds.get_data_store()
+    )
+
+    return fig_income_group_line, create_income_group_title(region_name)
@@ -3,174 +3,182 @@ import dash
 from dash import html, dcc, Dash, Input, Output, State, callback
 import dash_bootstrap_components as dbc
 import create_charts as cc
-import helper_functions as helper
+import data_store as ds
 import plotly.graph_objs as go
 
 
-# Import global prepared dataframe from Tourism dataset
-df_arrivals_prepared = helper.load_dataframe()
+dash.register_page(__name__)
 
-# Get list of country names from column
-country_names_list = df_arrivals_prepared['Country Name'].unique()
 
-dash.register_page(__name__)
+def layout(**kwargs):
+    """
+    Create the page layout each time the page is loaded, so the country
+    dropdowns use the current dataset version if the data has been reloaded.
 
-layout = dbc.Container(
-    fluid=True,
-    children=[
-        # First row here
-        dbc.Row([
-            dbc.Col([
-                    ], 
-                       
-                width="auto")],
-                justify="center",
-                ),
+    :param kwargs: Query string parameters passed by dash pages, not used
+    :return: Dash bootstrap container with the page contents
+    """
+    # Get list of country names from the shared Tourism dataset store
+    country_names_list = ds.get_data_store().country_names
 
-        # Second row here for scatter plot for each country
-        dbc.Row([
-                # This is for the London area selector and the statistics panel
-                dbc.Col([
-                         html.Label(["Choose or type Country Name"]),
-                         dcc.Dropdown(id='dropdown-scatter-per-country',
-                                      options=[
-                                              {'label': country,
-                                               'value': country}
-                                              for country in country_names_list
-                                              ],
-                                      # Set height between dropdown options
-                                      optionHeight=35,
-                                      value='Armenia',
-                                      # Allow user to search available values
-                                      searchable=True,
-                                      # Default text shown if nothing selected
-                                      placeholder='Please select...',
-                                      # Prevemt user from clearing value
-                                      clearable=False,
-                                      style={'width': "100%"},
-                                      # Allow last selected option to remain
-                                      # if user refreshes browser tab
-                                      persistence=True,
-                                      persistence_type='session',
-                                      ),
-                         html.Br(),
-                         html.Div(id="stats-card"),
-                         ],
-                        width=3,
-                        # Increase vertical spacing to align with graph card
-                        className="my-3",
-                        # To reposition column position for smaller screen
-                        ## For smallest screens make the columns on top of each other with max screen width
-                        xs=12, sm=12, md=3, lg=3, xl=3
-                        ),
-                # Add the second column here. This is for the figure.
-                dbc.Col([
-                         # Add callback output title for scatter per country
-                         html.H4(id='scatter-per-country-title'),
-                         # Increased padding to stop corners of chart extruding the rounded corners
-                         dbc.Card([
-                            dcc.Graph(id='scatter-per-country'),
-                                  ], className="p-1 px-2"
-                                  ),
-                        ],
-                        width=9,
-                        # To reposition column position for smaller screen
-                        xs=12, sm=12, md=9, lg=9, xl=9
-                        )
-                ], justify="center"
-                ),
+    return dbc.Container(
+        fluid=True,
+        children=[
+            # First row here
             dbc.Row([
                 dbc.Col([
-                         html.H4(id='line-compare-countries-title'),
-                         # Increased padding to stop corners of chart extruding the rounded corners
-                         dbc.Card([
-                            dcc.Graph(id='line-compare-countries'),
-                                  ], className="p-1"
-                                  ),
-
-                    ],
-                    width=8,
-                    # To reposition column position for smaller screen
-                    xs=12, sm=12, md=9, lg=8, xl=8
+                        ], 
+                       
+                    width="auto")],
+                    justify="center",
                     ),
-                dbc.Col([
-                         html.Label("Choose 2 countries to compare"),
-                         dcc.Dropdown(id='dropdown-compare-countries-1',
-                                      options=[
-                                              {'label': country,
-                                              'value': country}
-                                              for country in country_names_list
-                                              ],
-                                      # Set height between dropdown options
-                                      optionHeight=35,
-                                      value='Bermuda',
-                                      # Allow user to search available values
-                                      searchable=True,
-                                      # Default text shown if nothing selected
-                                      placeholder='Select first country...',
-                                      # Allow user to clear selected value
-                                      clearable=False,
-                                      style={'width': "100%"},
-                                      # Allow last selected option to remain
-                                      # if user refreshes browser tab
-                                      persistence=True,
-                                      persistence_type='session',
+
+            # Second row here for scatter plot for each country
+            dbc.Row([
+                    # This is for the London area selector and the statistics panel
+                    dbc.Col([
+                             html.Label(["Choose or type Country Name"]),
+                             dcc.Dropdown(id='dropdown-scatter-per-country',
+                                          options=[
+                                                  {'label': country,
+                                                   'value': country}
+                                                  for country in country_names_list
+                                                  ],
+                                          # Set height between dropdown options
+                                          optionHeight=35,
+                                          value='Armenia',
+                                          # Allow user to search available values
+                                          searchable=True,
+                                          # Default text shown if nothing selected
+                                          placeholder='Please select...',
+                                          # Prevemt user from clearing value
+                                          clearable=False,
+                                          style={'width': "100%"},
+                                          # Allow last selected option to remain
+                                          # if user refreshes browser tab
+                                          persistence=True,
+                                          persistence_type='session',
+                                          ),
+                             html.Br(),
+                             html.Div(id="stats-card"),
+                             ],
+                            width=3,
+                            # Increase vertical spacing to align with graph card
+                            className="my-3",
+                            # To reposition column position for smaller screen
+                            ## For smallest screens make the columns on top of each other with max screen width
+                            xs=12, sm=12, md=3, lg=3, xl=3
+                            ),
+                    # Add the second column here. This is for the figure.
+                    dbc.Col([
+                             # Add callback output title for scatter per country
+                             html.H4(id='scatter-per-country-title'),
+                             # Increased padding to stop corners of chart extruding the rounded corners
+                             dbc.Card([
+                                dcc.Graph(id='scatter-per-country'),
+                                      ], className="p-1 px-2"
                                       ),
-                        html.Br(),
-                        dcc.Dropdown(id='dropdown-compare-countries-2',
-                                      options=[
-                                              {'label': country,
-                                              'value': country}
-                                              for country in country_names_list
-                                              ],
-                                      # Set height between dropdown options
-                                      optionHeight=35,
-                                      value='Bangladesh',
-                                      # Allow user to search available values
-                                      searchable=True,
-                                      # Default text shown if nothing selected
-                                      placeholder='Select second country...',
-                                      # Allow user to clear selected value
-                                      clearable=False,
-                                      style={'width': "100%"},
-                                      # Allow last selected option to remain
-                                      # if user refreshes browser tab
-                                      persistence=True,
-                                      persistence_type='session',
+                            ],
+                            width=9,
+                            # To reposition column position for smaller screen
+                            xs=12, sm=12, md=9, lg=9, xl=9
+                            )
+                    ], justify="center"
+                    ),
+                dbc.Row([
+                    dbc.Col([
+                             html.H4(id='line-compare-countries-title'),
+                             # Increased padding to stop corners of chart extruding the rounded corners
+                             dbc.Card([
+                                dcc.Graph(id='line-compare-countries'),
+                                      ], className="p-1"
                                       ),
 
-                    ],
-                    width=4,
-                    # Increase vertical spacing to align with graph card
-                    className="my-3",
-                    # To reposition column position for smaller screen
-                    xs=12, sm=12, md=3, lg=4, xl=4
-                    ),
+                        ],
+                        width=8,
+                        # To reposition column position for smaller screen
+                        xs=12, sm=12, md=9, lg=8, xl=8
+                        ),
+                    dbc.Col([
+                             html.Label("Choose 2 countries to compare"),
+                             dcc.Dropdown(id='dropdown-compare-countries-1',
+                                          options=[
+                                                  {'label': country,
+                                                  'value': country}
+                                                  for country in country_names_list
+                                                  ],
+                                          # Set height between dropdown options
+                                          optionHeight=35,
+                                          value='Bermuda',
+                                          # Allow user to search available values
+                                          searchable=True,
+                                          # Default text shown if nothing selected
+                                          placeholder='Select first country...',
+                                          # Allow user to clear selected value
+                                          clearable=False,
+                                          style={'width': "100%"},
+                                          # Allow last selected option to remain
+                                          # if user refreshes browser tab
+                                          persistence=True,
+                                          persistence_type='session',
+                                          ),
+                            html.Br(),
+                            dcc.Dropdown(id='dropdown-compare-countries-2',
+                                          options=[
+                                                  {'label': country,
+                                                  'value': country}
+                                                  for country in country_names_list
+                                                  ],
+                                          # Set height between dropdown options
+                                          optionHeight=35,
+                                          value='Bangladesh',
+                                          # Allow user to search available values
+                                          searchable=True,
+                                          # Default text shown if nothing selected
+                                          placeholder='Select second country...',
+                                          # Allow user to clear selected value
+                                          clearable=False,
+                                          style={'width': "100%"},
+                                          # Allow last selected option to remain
+                                          # if user refreshes browser tab
+                                          persistence=True,
+                                          persistence_type='session',
+                                          ),
+
+                        ],
+                        width=4,
+                        # Increase vertical spacing to align with graph card
+                        className="my-3",
+                        # To reposition column position for smaller screen
+                        xs=12, sm=12, md=3, lg=4, xl=4
+                        ),
                 
-                ],justify="center"
-                ),
+                    ],justify="center"
+                    ),
 
-                dbc.Row([
-                         html.H5("Click to download the dataset as an Excel file", className="d-flex justify-content-center gy-3 fw-bold"),
-                         dbc.Col([
-                             dbc.Card([
-                                 html.Button('Download data as Excel', 
-                                              id="excel-download-button", n_clicks=0, 
-                                              style={'background-color': 'lightgreen'}),
-                                 dcc.Download(id="download-excel")
-                                      ])
-                                 ], width=6)
-                               ], justify="center"),
-                html.Br()
+                    dbc.Row([
+                             html.H5("Click to download the dataset as an Excel file", className="d-flex justify-content-center gy-3 fw-bold"),
+                             dbc.Col([
+                                 dbc.Card([
+                                     html.Button('Download data as Excel', 
+                                                  id="excel-download-button", n_clicks=0, 
+                                                  style={'background-color': 'lightgreen'}),
+                                     dcc.Download(id="download-excel")
+                                          ])
+                                     ], width=6)
+                                   ], justify="center"),
+                    html.Br()
 
-            ]),
+                ])
 
 
 @callback(
     [Output('line-compare-countries', 'figure'),
      Output('line-compare-countries-title', "children")],
     [Input('dropdown-compare-countries-1', 'value'),
-     Input('dropdown-compare-countries-2', 'value')]
+     Input('dropdown-compare-countries-2', 'value')],
+    # Same outputs as the Trends page, which prerenders the default countries
+    prevent_initial_call=True
 )
 def updatate_compare_line_charts_and_title(country_name_1, country_name_2):
 
@@ -194,7 +202,7 @@ def update_country_scatter_and_stats_card(country_name):
     fig_scatter_per_country = cc.create_scatter_per_country(country_name)
 
     # Set dataframe to the country name
-    df_arrivals_reset_index = df_arrivals_prepared.set_index('Country Name')
+    df_arrivals_reset_index = ds.get_data_store().dataframe.set_index('Country Name')
 
     # Get minimum, maximum and 10-year average values per country
     average_10yr_per_country = \
@@ -250,7 +258,7 @@ def update_country_scatter_and_stats_card(country_name):
 def download_raw_data(excel_clicks):
 
     # Set dataframe to the country name for cleaner download
-    df_arrivals_reset_index = df_arrivals_prepared.set_index('Country Name')
+    df_arrivals_reset_index = ds.get_data_store().dataframe.set_index('Country Name')
 
     # If download button clicked, download data as excel
     excel_file_raw = dcc.send_data_frame(df_arrivals_reset_index.to_excel, "Tourism arrivals.xlsx", sheet_name="Main")
@@ -0,0 +1,306 @@
+"""
+On-demand profiler for single dash callback requests.
+
+A _dash-update-component request is profiled when it sends an X-Profile
+header or a profile query parameter, from an admin (see is_allowed in
+install_profiler), or when it is picked by sampling 1 in
+TOURISM_PROFILE_SAMPLE_N requests. The header or parameter value chooses the
+profiler:
+
+- cprofile (or 1): cProfile, saved as a .prof pstats file for snakeviz,
+  flameprof or gprof2dot
+- sample: a stack sampler, saved as a .folded file of collapsed stacks for
+  flamegraph.pl or speedscope
+
+Each profile is saved in TOURISM_PROFILE_DIR with a .json file of the same
+name recording the callback ID, its inputs and state, and the request time,
+and the file name is sent back in the X-Profile-File response header.
+"""
+import cProfile
+import datetime
+import itertools
+import json
+import os
+from pathlib import Path
+import re
+import sys
+import threading
+import time
+from flask import g, request
+
+# Folder the profiles are saved in, and the number of profiles kept in it
+PROFILE_DIRPATH = Path(
+    os.environ.get(
+        "TOURISM_PROFILE_DIR", Path(__file__).parent.joinpath("data", "profiles")
+    )
+)
+PROFILE_KEEP = int(os.environ.get("TOURISM_PROFILE_KEEP", "200"))
+
+# Profile 1 in N callback requests, 0 turns sampling off, and the profiler
+# used for the sampled requests
+PROFILE_SAMPLE_N = int(os.environ.get("TOURISM_PROFILE_SAMPLE_N", "0"))
+PROFILE_SAMPLE_MODE = os.environ.get("TOURISM_PROFILE_SAMPLE_MODE", "cprofile")
+
+# Seconds between stacks recorded by the stack sampler
+SAMPLE_INTERVAL_SECONDS = 0.001
+
+# Profiler modes, with the file extension each one saves
+PROFILE_MODES = {"cprofile": ".prof", "sample": ".folded"}
+
+# Dash route running the server callbacks
+CALLBACK_PATH_SUFFIX = "/_dash-update-component"
+
+# Only one request is profiled at a time, as cProfile cannot run in two
+# threads at once and profiling slows down the other requests
+_profile_lock = threading.Lock()
+_request_counter = itertools.count(1)
+
+
+class StackSampler:
+    """
+    Sampling profiler recording the call stack of one thread at an interval.
+    """
+
+    def __init__(self, thread_id, interval_seconds=SAMPLE_INTERVAL_SECONDS):
+        """
+        Create a sampler for a thread, which starts with the start method.
+
+        Args:
+            thread_id: Identifier of the thread to sample
+            interval_seconds: Seconds between samples
+        Returns:
+            None
+        """
+        self.thread_id = thread_id
+        self.interval_seconds = interval_seconds
+        # Collapsed stack -> number of samples
+        self.stack_counts = {}
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop_event.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                module_name = frame.f_globals.get("__name__", code.co_filename)
+                function_name = getattr(code, "co_qualname", code.co_name)
+                stack.append(f"{module_name}.{function_name}")
+                frame = frame.f_back
+            if stack:
+                # Collapsed stacks list the outermost frame first
+                collapsed_stack = ";".join(reversed(stack))
+                self.stack_counts[collapsed_stack] = (
+                    self.stack_counts.get(collapsed_stack, 0) + 1
+                )
+
+    def start(self):
+        """
+        Start sampling in a background thread.
+
+        Args:
+            None
+        Returns:
+            None
+        """
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop sampling and wait for the background thread to finish.
+
+        Args:
+            None
+        Returns:
+            None
+        """
+        self._stop_event.set()
+        self._thread.join()
+
+    def save(self, filepath):
+        """
+        Save the samples as collapsed stacks, one "stack count" line each.
+
+        Args:
+            filepath: Path of the .folded file to write
+        Returns:
+            None
+        """
+        with open(filepath, "w", encoding="utf-8") as folded_file:
+            for collapsed_stack, count in sorted(self.stack_counts.items()):
+                folded_file.write(f"{collapsed_stack} {count}\n")
+
+
+def requested_profile_mode(is_allowed):
+    """
+    Get the profiler mode asked for by the current request, if any.
+
+    Args:
+        is_allowed: Function returning True if the current request may ask
+            for a profile
+    Returns:
+        Profiler mode name, or None if the request is not profiled
+    """
+    flag = request.headers.get("X-Profile") or request.args.get("profile")
+    if flag and is_allowed():
+        mode = flag.lower()
+    elif PROFILE_SAMPLE_N > 0 and next(_request_counter) % PROFILE_SAMPLE_N == 0:
+        mode = PROFILE_SAMPLE_MODE
+    else:
+        return None
+    # Any other flag value, e.g. 1, uses cProfile
+    return mode if mode in PROFILE_MODES else "cprofile"
+
+
+def start_profile(is_allowed):
+    """
+    Start profiling the current callback request if it asks for a profile.
+
+    Args:
+        is_allowed: Function returning True if the current request may ask
+            for a profile
+    Returns:
+        None
+    """
+    if not request.path.endswith(CALLBACK_PATH_SUFFIX):
+        return
+    mode = requested_profile_mode(is_allowed)
+    # Skip profiling if another request is being profiled
+    if mode is None or not _profile_lock.acquire(blocking=False):
+        return
+
+    if mode == "sample":
+        profile = StackSampler(threading.get_ident())
+        profile.start()
+    else:
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler, e.g. a debugger, is already running
+            _profile_lock.release()
+            return
+    g.request_profile = (
+        mode,
+        profile,
+        datetime.datetime.now(datetime.timezone.utc),
+        time.perf_counter(),
+    )
+
+
+def save_profile(mode, profile, started_at, seconds):
+    """
+    Save a finished profile with the callback details of the current request.
+
+    Args:
+        mode: Profiler mode name
+        profile: Stopped cProfile.Profile or StackSampler
+        started_at: UTC date and time the profile started
+        seconds: Wall time of the request
+    Returns:
+        File name of the saved profile
+    """
+    body = request.get_json(silent=True) or {}
+    callback_id = str(body.get("output", "unknown"))
+
+    # File names sort by time, and show which callback was profiled
+    callback_slug = re.sub(r"[^A-Za-z0-9_-]+", "_", callback_id).strip("_")[:80]
+    filename_stem = (
+        f"{started_at:%Y%m%dT%H%M%S%f}-{os.getpid()}-{callback_slug or 'callback'}"
+    )
+    PROFILE_DIRPATH.mkdir(parents=True, exist_ok=True)
+    profile_filepath = PROFILE_DIRPATH.joinpath(filename_stem + PROFILE_MODES[mode])
+
+    if mode == "sample":
+        profile.save(profile_filepath)
+    else:
+        profile.dump_stats(profile_filepath)
+
+    details = {
+        "callback_id": callback_id,
+        "inputs": body.get("inputs", []),
+        "state": body.get("state", []),
+        "changed_prop_ids": body.get("changedPropIds", []),
+        "profiler": mode,
+        "seconds": seconds,
+        "time": started_at.isoformat(),
+        "pid": os.getpid(),
+        "profile_file": profile_filepath.name,
+    }
+    with open(
+        PROFILE_DIRPATH.joinpath(filename_stem + ".json"), "w", encoding="utf-8"
+    ) as details_file:
+        json.dump(details, details_file, indent=2, default=str)
+
+    remove_old_profiles()
+    return profile_filepath.name
+
+
+def remove_old_profiles():
+    """
+    Delete the oldest profiles so at most PROFILE_KEEP of them are kept.
+
+    Args:
+        None
+    Returns:
+        None
+    """
+    details_filepaths = sorted(PROFILE_DIRPATH.glob("*.json"))
+    for details_filepath in details_filepaths[
+        : max(0, len(details_filepaths) - PROFILE_KEEP)
+    ]:
+        for extension in (".json", *PROFILE_MODES.values()):
+            details_filepath.with_suffix(extension).unlink(missing_ok=True)
+
+
+def finish_profile():
+    """
+    Stop profiling the current request, if it is profiled, and save it.
+
+    Args:
+        None
+    Returns:
+        File name of the saved profile, or None if the request is not profiled
+    """
+    request_profile = g.pop("request_profile", None)
+    if request_profile is None:
+        return None
+    mode, profile, started_at, start = request_profile
+    try:
+        if mode == "sample":
+            profile.stop()
+        else:
+            profile.disable()
+        return save_profile(mode, profile, started_at, time.perf_counter() - start)
+    finally:
+        _profile_lock.release()
+
+
+def install_profiler(app, is_allowed):
+    """
+    Profile the callback requests of a dash app that ask for it.
+
+    Args:
+        app: Dash app
+        is_allowed: Function returning True if the current request may ask
+            for a profile with the X-Profile header or profile parameter
+    Returns:
+        None
+    """
+
+    @app.server.before_request
+    def start_request_profile():
+        start_profile(is_allowed)
+
+    @app.server.after_request
+    def finish_request_profile(response):
+        profile_filename = finish_profile()
+        if profile_filename is not None:
+            response.headers["X-Profile-File"] = profile_filename
+        return response
+
+    @app.server.teardown_request
+    def finish_failed_request_profile(error):
+        # Requests that raised an error skip after_request
+        finish_profile()
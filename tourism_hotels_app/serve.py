@@ -0,0 +1,49 @@
+"""
+Launcher for the production server, running wsgi.py with gunicorn.
+
+Run with e.g. python serve.py --workers 4 --threads 8. Options not given
+default to the settings in gunicorn.conf.py, and any other gunicorn options
+are passed on unchanged.
+"""
+import argparse
+from pathlib import Path
+import sys
+from gunicorn.app.wsgiapp import run
+
+
+# Gunicorn settings file in the same folder as this file
+GUNICORN_CONFIG_FILEPATH = Path(__file__).parent.joinpath("gunicorn.conf.py")
+
+
+def main():
+    """
+    Parse the command line options and start gunicorn with them.
+
+    Args:
+        None
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(
+        description="Serve the tourism dash app with several worker processes."
+    )
+    parser.add_argument("--workers", type=int, help="number of worker processes")
+    parser.add_argument("--threads", type=int, help="threads per worker process")
+    parser.add_argument("--bind", help="address and port to listen on")
+    args, gunicorn_args = parser.parse_known_args()
+
+    argv = ["gunicorn", "--config", str(GUNICORN_CONFIG_FILEPATH)]
+    if args.workers is not None:
+        argv += ["--workers", str(args.workers)]
+    if args.threads is not None:
+        argv += ["--threads", str(args.threads)]
+    if args.bind is not None:
+        argv += ["--bind", args.bind]
+
+    # Gunicorn reads its options from the command line arguments
+    sys.argv = argv + gunicorn_args + ["wsgi:server"]
+    run()
+
+
+if __name__ == "__main__":
+    main()
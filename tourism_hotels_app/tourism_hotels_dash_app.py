@@ -1,8 +1,17 @@
 """Main dash app layout that links the multiple pages."""
+import hmac
+import os
 import dash
 from dash import html, dcc, Dash, Input, Output, State
 import dash_bootstrap_components as dbc
+from flask import jsonify, request
 from navbar import Navbar
+import cache_warmer
+import data_store as ds
+import exports
+import jobs
+import metrics
+import profiler
 
 
 # Create the dash app
@@ -14,6 +23,9 @@ app = Dash(
         {"name": "viewport", "content": "width=device-width, initial-scale=1"},
     ],
     use_pages=True,
+    # Tell the page layouts they are loaded in the browser, so they prerender
+    # their figures, which is not needed when dash validates the callbacks
+    routing_callback_inputs={"prerender_figures": State("prerender-figures", "data")},
 )
 
 # Wrap content of the dash app in a responsive width dbc container
@@ -48,6 +60,8 @@ app.layout = dbc.Container(
         ),
         # Add line break
         html.Br(),
+        # Read by the page router so the pages prerender their figures
+        dcc.Store(id="prerender-figures", data=True),
         # Add multi-page contents container
         dbc.Row(
             dbc.Col(
@@ -71,5 +85,94 @@ def toggle_navbar_collapse(n, is_open):
     return is_open
 
 
+# Reload the dataset in the background when the CSV file changes, set the
+# number of seconds between checks to 0 to turn this off
+DATA_WATCH_SECONDS = float(os.environ.get("TOURISM_DATA_WATCH_SECONDS", "5"))
+
+
+def start_data_watcher():
+    """
+    Start the background thread reloading the dataset when the CSV file changes.
+
+    Threads do not survive a fork, so this is called in every process that
+    serves requests, i.e. in each worker when running with wsgi.py.
+
+    Args:
+        None
+    Returns:
+        Event to set to stop the watcher, or None if it is turned off
+    """
+    if DATA_WATCH_SECONDS > 0:
+        return ds.start_data_watcher(interval_seconds=DATA_WATCH_SECONDS)
+    return None
+
+
+# Optionally pre-render every figure variant and the whole dataset exports
+# before serving requests
+if os.environ.get("TOURISM_WARM_FIGURE_CACHE") == "1":
+    cache_warmer.warm_figure_cache()
+    exports.warm_export_cache()
+
+
+# Record the time and response size of every callback, served on /metrics,
+# set to 0 to turn this off
+if os.environ.get("TOURISM_METRICS", "1") == "1":
+    metrics.instrument_app(app)
+
+
+def is_admin_request():
+    """
+    Check if the current request may use the admin features.
+
+    Requests must send the TOURISM_ADMIN_TOKEN environment variable value in
+    the X-Admin-Token header. Every request is denied if it is not set, as
+    behind a reverse proxy every request comes from the same machine.
+
+    Args:
+        None
+    Returns:
+        True if the request is allowed, otherwise False
+    """
+    admin_token = os.environ.get("TOURISM_ADMIN_TOKEN")
+    if not admin_token:
+        return False
+    # Compare in constant time so the token cannot be guessed from timings
+    return hmac.compare_digest(
+        request.headers.get("X-Admin-Token", "").encode(), admin_token.encode()
+    )
+
+
+# Profile single callback requests on demand, allowed for admin requests only
+profiler.install_profiler(app, is_allowed=is_admin_request)
+
+
+# Serve the dataset downloads of the trends page from the export cache, and
+# the status and results of the background jobs preparing the other downloads
+exports.add_export_route(app)
+jobs.add_job_routes(app)
+
+
+@app.server.route("/admin/reload-data", methods=["POST"])
+def reload_data():
+    """
+    Admin endpoint to reload the dataset now, e.g. after publishing a new CSV.
+
+    Requests must be allowed by is_admin_request. Add ?force=1 to load a new
+    version even if the CSV contents are unchanged.
+    """
+    if not is_admin_request():
+        return jsonify(error="Not allowed"), 403
+
+    try:
+        store = ds.reload_data_store(force=request.args.get("force") == "1")
+    except (ValueError, OSError) as error:
+        # Invalid, missing or unreadable new file, the current dataset
+        # version stays in use
+        return jsonify(error=str(error)), 400
+    return jsonify(version=store.version, sha256=store.source_sha256)
+
+
 if __name__ == "__main__":
+    # Development server, use wsgi.py to serve with several worker processes
+    start_data_watcher()
     app.run_server(debug=True, port=8051)
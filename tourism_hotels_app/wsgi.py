@@ -0,0 +1,29 @@
+"""
+Production WSGI entry point for the multi-page dash app.
+
+The dataset, its indexes and the figure cache are loaded here, once, in the
+server's master process. With gunicorn.conf.py the app is preloaded before
+the worker processes are forked, so the workers share that memory
+copy-on-write instead of each loading their own copy.
+
+Start the server with serve.py, or point a WSGI server at wsgi:server.
+"""
+import gc
+import os
+
+# Pre-render every figure at start-up by default, set to 0 to turn this off
+os.environ.setdefault("TOURISM_WARM_FIGURE_CACHE", "1")
+
+import data_store as ds  # noqa: E402
+from tourism_hotels_dash_app import app  # noqa: E402
+
+
+# Load the dataset and build its indexes before any worker is forked
+ds.get_data_store()
+
+# Flask server of the dash app, called by the WSGI server
+server = app.server
+
+# Stop the garbage collector tracking everything loaded so far, so collections
+# in the workers do not write to the shared memory pages and copy them
+gc.freeze()